@@ -0,0 +1,69 @@
+"""Throughput and peak memory of batch scoring a large file with an increasing number of workers.
+
+Scores a synthetic data set from `benchmarks.data` with the configured model, which needs a fitted
+preprocessing, e.g. with a local model
+
+    MODEL_DIR=/path/to/model python -m benchmarks.batch_scoring 1000000
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from default_detection.api.batch_scoring import BatchScorer
+
+WORKER_COUNTS = [1, 2, 4]
+
+
+def _score(input_path, output_path, workers):
+    """Score the input and return the time and peak memory of this process and its workers."""
+    start = time.perf_counter()
+    rows = BatchScorer(workers=workers).score(input_path, output_path)
+    seconds = time.perf_counter() - start
+    return {
+        "workers": workers,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds,
+        # Kilobytes on Linux, the largest worker for the children
+        "parent_peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "worker_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def run(rows=1000000, worker_counts=WORKER_COUNTS):
+    """Return rows per second and peak memory of the parent and the workers per number of workers.
+
+    The data is generated and every worker count runs in a new process, so their peak memory is
+    measured separately.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = os.path.join(directory, "input.csv")
+        subprocess.run([sys.executable, "-m", "benchmarks.data", str(rows), input_path], check=True)
+        for workers in worker_counts:
+            process = subprocess.run(
+                [sys.executable, "-m", "benchmarks.batch_scoring", "--score", input_path, str(workers)],
+                stdout=subprocess.PIPE,
+                check=True,
+            )
+            results.append(json.loads(process.stdout.decode().strip().splitlines()[-1]))
+        input_mb = os.path.getsize(input_path) / 2 ** 20
+    return input_mb, results
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["--score"]:
+        input_path, workers = sys.argv[2], int(sys.argv[3])
+        print(json.dumps(_score(input_path, input_path + ".scored", workers)))
+        sys.exit()
+
+    input_mb, results = run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
+    print(f"input {input_mb:.0f} MB")
+    print(f"{'workers':>8} {'seconds':>8} {'rows/s':>9} {'parent MB':>10} {'worker MB':>10}")
+    for r in results:
+        print(f"{r['workers']:>8} {r['seconds']:>8.1f} {r['rows_per_second']:>9.0f} "
+              f"{r['parent_peak_rss_mb']:>10.0f} {r['worker_peak_rss_mb']:>10.0f}")
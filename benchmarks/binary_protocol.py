@@ -0,0 +1,89 @@
+"""Payload size and latency of /predictions in JSON, msgpack and Arrow IPC by number of UUIDs.
+
+Every request is encoded by the client, answered in process through the Flask test client and
+decoded by the client again, so the latency includes the serialization on both sides but not the
+network, for which the payload sizes are reported. Scores are materialized first, so the model does
+not hide the cost of the protocol. Uses the configured model and `CSV_DATA` and
+needs `msgpack` and `pyarrow`, e.g. with a local model
+
+    MODEL_DIR=/path/to/model python -m benchmarks.binary_protocol
+"""
+import json
+import time
+
+import msgpack
+import numpy as np
+import pyarrow as pa
+
+from default_detection.api import app, binary, predictions
+
+SIZES = [100, 1000, 10000, 50000]
+
+
+def _arrow_stream(column):
+    sink = pa.BufferOutputStream()
+    batch = pa.RecordBatch.from_arrays([column], ["uuid"])
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def _protocols():
+    """Return (name, encode, content type, accept, decode) of every protocol."""
+    def decode_arrow(body):
+        # Arrow callers work on the columns, not on Python objects
+        return pa.ipc.open_stream(body).read_all()
+
+    return [
+        ("json records", lambda ids: json.dumps({"uuids": [{"uuid": u} for u in ids]}),
+         "application/json", "application/json", json.loads),
+        ("msgpack", lambda ids: msgpack.packb({"uuids": ids}),
+         binary.MSGPACK, binary.MSGPACK, msgpack.unpackb),
+        ("msgpack packed", lambda ids: msgpack.packb({"uuids": binary.pack_uuids(ids)}),
+         binary.MSGPACK, binary.MSGPACK, msgpack.unpackb),
+        ("arrow", lambda ids: _arrow_stream(pa.array(ids, type=pa.string())),
+         binary.ARROW, binary.ARROW, decode_arrow),
+        ("arrow packed", lambda ids: _arrow_stream(pa.FixedSizeBinaryArray.from_buffers(
+            pa.binary(16), len(ids), [None, pa.py_buffer(binary.pack_uuids(ids))])),
+         binary.ARROW, binary.ARROW, decode_arrow),
+    ]
+
+
+def run(sizes=SIZES, min_requests=5, max_seconds=5):
+    """Return request and response bytes and the median and minimum latency per protocol and size."""
+    predictions.materialize_scores()
+    client = app.test_client()
+    uuids = predictions._serving.uuids
+    rng = np.random.default_rng(0)
+
+    results = []
+    for size in sorted({min(size, len(uuids)) for size in sizes}):
+        ids = uuids[rng.choice(len(uuids), size=size, replace=False)].tolist()
+        for name, encode, content_type, accept, decode in _protocols():
+            latencies = []
+            deadline = time.perf_counter() + max_seconds
+            while len(latencies) < min_requests or time.perf_counter() < deadline and len(latencies) < 50:
+                start = time.perf_counter()
+                body = encode(ids)
+                response = client.post("/predictions", data=body, content_type=content_type,
+                                       headers={"Accept": accept})
+                decode(response.get_data())
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{name} request failed: {response.get_data()[:200]}")
+            results.append({
+                "protocol": name,
+                "uuids": len(ids),
+                "request_bytes": len(body),
+                "response_bytes": len(response.get_data()),
+                "p50": float(np.percentile(latencies, 50)),
+                "min": float(np.min(latencies)),
+            })
+    return results
+
+
+if __name__ == '__main__':
+    print(f"{'uuids':>7} {'protocol':<15} {'request kB':>11} {'response kB':>12} {'p50 [ms]':>9} {'min [ms]':>9}")
+    for r in run():
+        print(f"{r['uuids']:>7} {r['protocol']:<15} {r['request_bytes'] / 1e3:>11.1f} "
+              f"{r['response_bytes'] / 1e3:>12.1f} {r['p50'] * 1e3:>9.2f} {r['min'] * 1e3:>9.2f}")
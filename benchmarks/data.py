@@ -0,0 +1,148 @@
+"""Synthetic data sets with the schema of the production data set.
+
+Generates the columns of `default_detection/data/__init__.py` in the order, dtypes and missing
+value rates of the production CSV: UUIDs, a `default` target that is missing for the test set,
+numerical features, integer status codes and the string valued encoded features. Defaults depend on
+a latent risk that also drives the payment features, so models learn a real signal.
+
+    python -m benchmarks.data 1000000 dataset.csv
+"""
+import sys
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from default_detection.data import CATEGORICAL_FEATURES, ENCODED_FEATURES, NUMERICAL_FEATURES
+
+# Column order of the production CSV
+COLUMNS = [
+    "uuid", "default", "account_amount_added_12_24m", "account_days_in_dc_12_24m", "account_days_in_rem_12_24m",
+    "account_days_in_term_12_24m", "account_incoming_debt_vs_paid_0_24m", "account_status",
+    "account_worst_status_0_3m", "account_worst_status_12_24m", "account_worst_status_3_6m",
+    "account_worst_status_6_12m", "age", "avg_payment_span_0_12m", "avg_payment_span_0_3m", "merchant_category",
+    "merchant_group", "has_paid", "max_paid_inv_0_12m", "max_paid_inv_0_24m", "name_in_email",
+    "num_active_div_by_paid_inv_0_12m", "num_active_inv", "num_arch_dc_0_12m", "num_arch_dc_12_24m",
+    "num_arch_ok_0_12m", "num_arch_ok_12_24m", "num_arch_rem_0_12m", "num_arch_written_off_0_12m",
+    "num_arch_written_off_12_24m", "num_unpaid_bills", "status_last_archived_0_24m",
+    "status_2nd_last_archived_0_24m", "status_3rd_last_archived_0_24m", "status_max_archived_0_6_months",
+    "status_max_archived_0_12_months", "status_max_archived_0_24_months", "recovery_debt",
+    "sum_capital_paid_account_0_12m", "sum_capital_paid_account_12_24m", "sum_paid_inv_0_12m", "time_hours",
+    "worst_status_active_inv",
+]
+
+# Share of missing values per column in the training data
+MISSING_RATES = {
+    "worst_status_active_inv": 0.695,
+    "account_worst_status_12_24m": 0.667,
+    "account_worst_status_6_12m": 0.604,
+    "account_incoming_debt_vs_paid_0_24m": 0.593,
+    "account_worst_status_3_6m": 0.577,
+    "account_status": 0.544,
+    "account_worst_status_0_3m": 0.544,
+    "avg_payment_span_0_3m": 0.493,
+    "avg_payment_span_0_12m": 0.239,
+    "num_active_div_by_paid_inv_0_12m": 0.230,
+    "num_arch_written_off_0_12m": 0.181,
+    "num_arch_written_off_12_24m": 0.181,
+    "account_days_in_term_12_24m": 0.119,
+    "account_days_in_rem_12_24m": 0.119,
+    "account_days_in_dc_12_24m": 0.119,
+}
+
+# Values of the encoded features with their frequency, rare values are left out
+ENCODED_VALUES = {
+    "merchant_category": {
+        "Diversified entertainment": 34781, "Youthful Shoes & Clothing": 10524, "Books & Magazines": 8447,
+        "General Shoes & Clothing": 4162, "Concept stores & Miscellaneous": 3969, "Sports gear & Outdoor": 3300,
+        "Dietary supplements": 2800, "Diversified children products": 2400, "Diversified electronics": 2000,
+        "Prints & Photos": 1800, "Children Clothes & Nurturing products": 1700, "Pet supplies": 1200,
+        "Jewelry & Watches": 1100, "Automotive Parts & Accessories": 600, "Plants & Flowers": 400,
+    },
+    "merchant_group": {
+        "Entertainment": 44000, "Clothing & Shoes": 15000, "Leisure, Sport & Hobby": 9000, "Health & Beauty": 6000,
+        "Children Products": 5000, "Home & Garden": 4000, "Electronics": 3000, "Automotive Products": 1200,
+        "Intangible products": 1000, "Jewelry & Accessories": 900, "Food & Beverage": 400, "Erotic Materials": 300,
+    },
+    "name_in_email": {
+        "F+L": 36358, "no_match": 15094, "L1+F": 14495, "F": 8755, "Nick": 7496, "F1+L": 6566, "L": 1188,
+        "Initials": 24,
+    },
+}
+
+DEFAULT_RATE = 0.0143
+TEST_FRACTION = 0.1
+
+
+def generate(n_rows, seed=0, test_fraction=TEST_FRACTION, default_rate=DEFAULT_RATE):
+    """Return a data frame of synthetic records with the production schema."""
+    rng = np.random.default_rng(seed)
+    risk = rng.normal(size=n_rows)
+
+    # Calibrate the intercept so the default rate matches on average
+    logits = 2.0 * risk + np.log(default_rate / (1 - default_rate)) - 1.75
+    default = (rng.random(n_rows) < 1 / (1 + np.exp(-logits))).astype(np.float64)
+    default[rng.random(n_rows) < test_fraction] = np.nan
+
+    columns = {
+        "uuid": [str(uuid.UUID(bytes=bytes(b), version=4)) for b in rng.integers(0, 256, (n_rows, 16), np.uint8)],
+        "default": default,
+    }
+
+    for column in NUMERICAL_FEATURES:
+        columns[column] = _numerical(column, risk, rng)
+
+    for column in CATEGORICAL_FEATURES:
+        if column in ENCODED_FEATURES:
+            values = ENCODED_VALUES[column]
+            weights = np.array(list(values.values()), dtype=np.float64)
+            columns[column] = rng.choice(list(values), size=n_rows, p=weights / weights.sum())
+        elif column == "has_paid":
+            columns[column] = rng.random(n_rows) < 1 / (1 + np.exp(risk - 2))
+        elif column.startswith("status_"):
+            # Archived statuses are never missing, 0 means no archived invoice
+            columns[column] = np.clip(np.round(rng.gamma(1.2, 0.8, n_rows) + 0.4 * risk), 0, 5).astype(np.int64)
+        else:
+            columns[column] = np.clip(np.round(1 + rng.gamma(0.4, 0.5, n_rows) + 0.3 * risk), 1, 4)
+
+    for column, rate in MISSING_RATES.items():
+        values = np.asarray(columns[column], dtype=np.float64)
+        values[rng.random(n_rows) < rate] = np.nan
+        columns[column] = values
+
+    return pd.DataFrame(columns)[COLUMNS]
+
+
+def write_csv(path, n_rows, seed=0, chunk_size=500000):
+    """Write a synthetic data set as `;` delimited CSV in chunks, so any size fits in memory."""
+    for i, start in enumerate(range(0, n_rows, chunk_size)):
+        chunk = generate(min(chunk_size, n_rows - start), seed=(seed, i))
+        chunk.to_csv(path, sep=";", index=False, header=i == 0, mode="w" if i == 0 else "a")
+    return path
+
+
+def _numerical(column, risk, rng):
+    n_rows = len(risk)
+    if column == "age":
+        return np.clip(np.round(rng.normal(36, 12, n_rows)), 18, 100)
+    if column == "time_hours":
+        return np.mod(rng.normal(15, 5, n_rows), 24)
+    if column.startswith("avg_payment_span"):
+        return np.maximum(rng.gamma(2, 9, n_rows) * np.exp(0.4 * risk), 0)
+    if column.startswith("account_days_in"):
+        # Mostly zero, few accounts with days in collection
+        return np.where(rng.random(n_rows) < 0.03 * np.exp(risk), np.round(rng.uniform(1, 365, n_rows)), 0.0)
+    if column.startswith("num_") and "div" not in column:
+        return rng.poisson(np.exp(0.8 + 0.3 * rng.normal(size=n_rows))).astype(np.float64)
+    if column == "num_active_div_by_paid_inv_0_12m":
+        return rng.gamma(0.5, 0.3, n_rows)
+    if column == "account_incoming_debt_vs_paid_0_24m":
+        return rng.gamma(0.6, 1.5, n_rows)
+    if column == "recovery_debt":
+        return np.where(rng.random(n_rows) < 0.02 * np.exp(risk), np.round(rng.gamma(1, 500, n_rows)), 0.0)
+    # Amounts, zero for a large share of the customers
+    return np.where(rng.random(n_rows) < 0.4, 0.0, np.round(rng.lognormal(8.5, 1.3, n_rows)))
+
+
+if __name__ == '__main__':
+    write_csv(sys.argv[2], int(sys.argv[1]))
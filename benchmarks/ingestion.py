@@ -0,0 +1,56 @@
+"""Time to ingest deltas of new and of updated records into the loaded data set.
+
+Ingests synthetic records from `benchmarks.data` into the data set of the configured model and
+`CSV_DATA`, first as new UUIDs and then again as updates of the same UUIDs, directly and through
+/ingest. Run it on data sets of different sizes to compare, e.g. with a local model
+
+    MODEL_DIR=/path/to/model CSV_DATA=/path/to/dataset.csv python -m benchmarks.ingestion
+"""
+import time
+
+import numpy as np
+
+from benchmarks.data import generate
+from default_detection.api import app, predictions
+
+DELTA_SIZES = [100, 1000, 10000]
+
+
+def _records(n_rows, seed):
+    data = generate(n_rows, seed=seed).astype(object)
+    return data.where(data.notnull(), None).to_dict(orient="records")
+
+
+def run(delta_sizes=DELTA_SIZES):
+    """Return the loaded rows and the seconds to insert and update each delta size."""
+    predictions.load_data()
+    loaded_rows = len(predictions._serving.index)
+    client = app.test_client()
+
+    results = []
+    for seed, size in enumerate(delta_sizes, 1):
+        records = _records(size, seed)
+        result = {"records": size}
+        for name in ["insert", "update"]:
+            start = time.perf_counter()
+            predictions.ingest_records(records)
+            result[name] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        response = client.post("/ingest", json={"records": records})
+        result["http_update"] = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"Ingestion failed: {response.get_json()}")
+
+        known, _ = predictions._serving.lookup([record["uuid"] for record in records])
+        assert len(known) == size and np.all(known >= len(predictions._serving.features))
+        results.append(result)
+    return loaded_rows, results
+
+
+if __name__ == '__main__':
+    loaded_rows, results = run()
+    print(f"{loaded_rows} loaded rows")
+    print(f"{'records':>8} {'insert [ms]':>12} {'update [ms]':>12} {'/ingest [ms]':>13}")
+    for r in results:
+        print(f"{r['records']:>8} {r['insert'] * 1e3:>12.1f} {r['update'] * 1e3:>12.1f} {r['http_update'] * 1e3:>13.1f}")
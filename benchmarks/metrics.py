@@ -0,0 +1,71 @@
+"""Benchmark the NumPy metrics against sklearn and check that both agree.
+
+    python -m benchmarks.metrics
+"""
+import timeit
+
+import numpy as np
+from sklearn import metrics as sklearn_metrics
+
+from default_detection.model import metrics
+
+SIZES = [1000, 30000, 300000]
+
+
+def _sklearn_sweep(y_true, scores):
+    precision, recall, thresholds = sklearn_metrics.precision_recall_curve(y_true, scores)
+    return precision, recall, thresholds
+
+
+def _data(size, seed=0):
+    rng = np.random.default_rng(seed)
+    y_true = (rng.random(size) < 0.1).astype(np.float32)
+    scores = np.round(np.clip(0.3 * y_true + rng.random(size) * 0.7, 0, 1), 4)
+    return y_true, scores
+
+
+def _check(y_true, scores):
+    """Return the largest absolute difference between the NumPy and sklearn results."""
+    sweep = metrics.threshold_sweep(y_true, scores)
+    precision, recall, thresholds = _sklearn_sweep(y_true, scores)
+    n = len(thresholds)
+    return max(
+        abs(metrics.f1_score_at(y_true, scores) - sklearn_metrics.f1_score(y_true, np.where(scores < 0.5, 0, 1))),
+        abs(metrics.roc_auc_score(y_true, scores) - sklearn_metrics.roc_auc_score(y_true, scores)),
+        np.abs(sweep["threshold"][:n] - thresholds[::-1]).max(),
+        np.abs(sweep["precision"][:n] - precision[:-1][::-1]).max(),
+        np.abs(sweep["recall"][:n] - recall[:-1][::-1]).max(),
+    )
+
+
+def _time(fn, repeat):
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def run(sizes=SIZES):
+    """Return timings in seconds of each metric for NumPy and sklearn per number of rows."""
+    results = []
+    for size in sizes:
+        y_true, scores = _data(size)
+        repeat = 5 if size >= 100000 else 50
+        results.append({
+            "rows": size,
+            "f1_numpy": _time(lambda: metrics.f1_score_at(y_true, scores), repeat),
+            "f1_sklearn": _time(lambda: sklearn_metrics.f1_score(y_true, np.where(scores < 0.5, 0, 1)), repeat),
+            "auc_numpy": _time(lambda: metrics.roc_auc_score(y_true, scores), repeat),
+            "auc_sklearn": _time(lambda: sklearn_metrics.roc_auc_score(y_true, scores), repeat),
+            "sweep_numpy": _time(lambda: metrics.threshold_sweep(y_true, scores), repeat),
+            "sweep_sklearn": _time(lambda: _sklearn_sweep(y_true, scores), repeat),
+            "max_difference": _check(y_true, scores),
+        })
+    return results
+
+
+if __name__ == '__main__':
+    print(f"{'rows':>8} {'metric':>6} {'numpy [ms]':>11} {'sklearn [ms]':>13} {'speedup':>8}")
+    for r in run():
+        for metric in ["f1", "auc", "sweep"]:
+            numpy_time, sklearn_time = r[f"{metric}_numpy"], r[f"{metric}_sklearn"]
+            print(f"{r['rows']:>8} {metric:>6} {numpy_time * 1e3:>11.3f} {sklearn_time * 1e3:>13.3f} "
+                  f"{sklearn_time / numpy_time:>7.1f}x")
+        print(f"{r['rows']:>8} largest difference to sklearn {r['max_difference']:.2e}")
@@ -0,0 +1,66 @@
+"""Latency of reason codes of known UUIDs, computed per request and looked up once computed, by number of UUIDs.
+
+Compares explaining the rows of every request with `pred_contrib` to /reason-codes, once on its
+first request for the UUIDs, which computes them in one batch, and once they are kept, with
+/predictions from materialized scores as the reference. Uses the configured model and `CSV_DATA`,
+e.g. with a local model
+
+    MODEL_DIR=/path/to/model python -m benchmarks.reason_codes
+"""
+import time
+
+import numpy as np
+
+from default_detection import REASON_CODES_TOP_K
+from default_detection.api import app, predictions
+
+SIZES = [1, 10, 100, 1000]
+
+
+def _median_seconds(call, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        seconds.append(time.perf_counter() - start)
+    return float(np.median(seconds))
+
+
+def run(sizes=SIZES, repeat=5):
+    """Return the median seconds per request of every way to get reason codes by number of UUIDs."""
+    predictions.materialize_scores()
+    serving = predictions._serving
+    client = app.test_client()
+    rng = np.random.default_rng(0)
+    positions = rng.permutation(len(serving.uuids))
+
+    results = []
+    offset = 0
+    for size in sizes:
+        rows = np.sort(positions[offset:offset + size])
+        offset += size
+        body = {"uuids": [{"uuid": uuid} for uuid in serving.uuids[rows].tolist()]}
+
+        def request(path):
+            response = client.post(path, json=body)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} failed: {response.get_json()}")
+
+        result = {
+            "uuids": size,
+            "per_request": _median_seconds(
+                lambda: serving.classifier.reason_codes(serving.features[rows], REASON_CODES_TOP_K), repeat
+            ),
+        }
+        result["first_request"] = _median_seconds(lambda: request("/reason-codes"), 1)
+        result["kept"] = _median_seconds(lambda: request("/reason-codes"), repeat)
+        result["predictions"] = _median_seconds(lambda: request("/predictions"), repeat)
+        results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    print(f"{'uuids':>6} {'per request [ms]':>17} {'first [ms]':>11} {'kept [ms]':>10} {'/predictions [ms]':>18}")
+    for r in run():
+        print(f"{r['uuids']:>6} {r['per_request'] * 1e3:>17.2f} {r['first_request'] * 1e3:>11.2f} "
+              f"{r['kept'] * 1e3:>10.2f} {r['predictions'] * 1e3:>18.2f}")
@@ -0,0 +1,59 @@
+"""Benchmark building and serializing the /predictions response.
+
+Compares the former `iterrows` based response with the vectorized record and columnar responses.
+
+    python -m benchmarks.serialization
+"""
+import timeit
+import uuid
+
+import numpy as np
+import pandas as pd
+from flask import jsonify
+
+from default_detection.api import app
+from default_detection.api.predictions import build_response
+
+SIZES = [1, 100, 10000, 100000]
+
+
+def _iterrows_response(uuids, probabilities, defaults):
+    to_predict = pd.DataFrame({"uuid": uuids, "pd": probabilities, "default": defaults})
+    result = []
+    for i, row in to_predict.iterrows():
+        result.append({"uuid": row.uuid, "default": row.default, "pd": row.pd})
+    return result
+
+
+def _columns(size, seed=0):
+    rng = np.random.default_rng(seed)
+    uuids = np.array([str(uuid.UUID(int=int(i))) for i in rng.integers(0, 2 ** 63, size)], dtype=object)
+    probabilities = np.round(rng.random(size), 5)
+    defaults = np.where(probabilities < 0.5, 0, 1)
+    return uuids, probabilities, defaults
+
+
+def _time(fn, repeat):
+    with app.app_context():
+        return min(timeit.repeat(lambda: jsonify(predictions=fn()), number=1, repeat=repeat))
+
+
+def run(sizes=SIZES):
+    """Return serialization timings in seconds per response shape and number of UUIDs."""
+    results = []
+    for size in sizes:
+        uuids, probabilities, defaults = _columns(size)
+        repeat = 3 if size >= 10000 else 20
+        results.append({
+            "uuids": size,
+            "iterrows": _time(lambda: _iterrows_response(uuids, probabilities, defaults), repeat),
+            "records": _time(lambda: build_response(uuids, probabilities, defaults, "records"), repeat),
+            "columns": _time(lambda: build_response(uuids, probabilities, defaults, "columns"), repeat),
+        })
+    return results
+
+
+if __name__ == '__main__':
+    print(f"{'uuids':>8} {'iterrows [ms]':>14} {'records [ms]':>13} {'columns [ms]':>13}")
+    for r in run():
+        print(f"{r['uuids']:>8} {r['iterrows'] * 1e3:>14.3f} {r['records'] * 1e3:>13.3f} {r['columns'] * 1e3:>13.3f}")
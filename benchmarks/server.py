@@ -0,0 +1,88 @@
+"""Load test the pre-fork server with an increasing number of workers.
+
+Starts `serve.py` once per worker count and sends /predictions requests from concurrent client
+processes for a fixed duration. Uses the configured model and `CSV_DATA`, e.g. with a local model
+
+    MODEL_DIR=/path/to/model python -m benchmarks.server
+"""
+import http.client
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from default_detection.data import CSV_DATA
+
+WORKER_COUNTS = [1, 2, 4]
+PORT = 5099
+
+
+def _client(args):
+    port, body, duration = args
+    latencies = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        connection.request("POST", "/predictions", body=body, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+        if response.status != 200:
+            raise RuntimeError(f"Request failed with status {response.status}")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _wait_until_ready(port, process, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("The server exited during startup")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/health-check")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError("The server did not start in time")
+
+
+def run(worker_counts=WORKER_COUNTS, uuids_per_request=100, concurrency=8, duration=10):
+    """Return throughput and latency of /predictions requests per number of workers."""
+    uuids = pd.read_csv(CSV_DATA, delimiter=";", usecols=["uuid"])["uuid"]
+    body = json.dumps({"uuids": [{"uuid": u} for u in uuids.sample(uuids_per_request, random_state=0)]})
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "serve.py")
+
+    results = []
+    for workers in worker_counts:
+        env = dict(os.environ, SERVER_WORKERS=str(workers), SERVER_PORT=str(PORT))
+        process = subprocess.Popen([sys.executable, script], env=env, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL)
+        try:
+            _wait_until_ready(PORT, process)
+            with multiprocessing.Pool(concurrency) as pool:
+                latencies = np.concatenate(pool.map(_client, [(PORT, body, duration)] * concurrency))
+        finally:
+            process.terminate()
+            process.wait()
+
+        results.append({
+            "workers": workers,
+            "requests_per_second": len(latencies) / duration,
+            "p50": np.percentile(latencies, 50),
+            "p99": np.percentile(latencies, 99),
+        })
+    return results
+
+
+if __name__ == '__main__':
+    print(f"{'workers':>8} {'requests/s':>11} {'p50 [ms]':>9} {'p99 [ms]':>9}")
+    for r in run():
+        print(f"{r['workers']:>8} {r['requests_per_second']:>11.1f} {r['p50'] * 1e3:>9.2f} {r['p99'] * 1e3:>9.2f}")
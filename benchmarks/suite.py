@@ -0,0 +1,377 @@
+"""End-to-end benchmarks on a synthetic data set, with results written to JSON for comparison between runs.
+
+Generates a data set with `benchmarks.data`, trains a small model on it and runs every benchmark in
+a fresh process, configured through `CSV_DATA`, `DATA_DIR` and `MODEL_DIR` like the service, so
+imports, caches and peak memory of one benchmark do not affect the next. Generated data and the
+model are kept in the work directory and reused by later runs with the same number of rows.
+
+    python -m benchmarks.suite --rows 100000 --output results.json
+    python -m benchmarks.suite --rows 100000 --output new.json --compare results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+BENCHMARKS = [
+    "cold_start", "load_data", "predictions", "get_all", "preprocessing_memory", "preprocessing_memory_chunked",
+    "trials",
+]
+BATCH_SIZES = [1, 10, 100, 1000]
+SEED = 0
+
+
+def run(rows, work_dir, benchmarks=BENCHMARKS, search_seconds=60, preprocessing_memory_mb=256):
+    """Run the benchmarks on a synthetic data set of the given size and return the results."""
+    from benchmarks import data
+
+    work_dir = os.path.abspath(os.path.join(work_dir, str(rows)))
+    os.makedirs(work_dir, exist_ok=True)
+    env = {
+        "CSV_DATA": os.path.join(work_dir, "dataset.csv"),
+        "DATA_DIR": os.path.join(work_dir, "models"),
+        "DATA_STORE_DIR": os.path.join(work_dir, "store"),
+    }
+
+    if not os.path.exists(env["CSV_DATA"]):
+        data.write_csv(env["CSV_DATA"] + ".tmp", rows, seed=SEED)
+        os.rename(env["CSV_DATA"] + ".tmp", env["CSV_DATA"])
+
+    model_dir = os.path.join(work_dir, "model")
+    if not os.path.exists(os.path.join(model_dir, "model.pk")):
+        trained = _run_benchmark("train_model", env)
+        shutil.rmtree(model_dir, ignore_errors=True)
+        shutil.copytree(trained["model_dir"], model_dir)
+    env["MODEL_DIR"] = model_dir
+
+    results = {}
+    for name in benchmarks:
+        if name == "cold_start":
+            # Cold start includes preprocessing the CSV into the store
+            shutil.rmtree(env["DATA_STORE_DIR"], ignore_errors=True)
+        results[name] = _run_benchmark(
+            name, env, {"search_seconds": search_seconds, "preprocessing_memory_mb": preprocessing_memory_mb}
+        )
+
+    return {
+        "rows": rows,
+        "started_at": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "commit": _git_commit(),
+        "results": results,
+    }
+
+
+def compare(previous, current):
+    """Return (metric, previous, current, ratio) for every metric found in both results."""
+    previous_metrics = dict(_flatten(previous["results"]))
+    return [
+        (metric, previous_metrics[metric], value, value / previous_metrics[metric] if previous_metrics[metric] else None)
+        for metric, value in _flatten(current["results"])
+        if metric in previous_metrics
+    ]
+
+
+def over_budget(results):
+    """Return a message for every benchmark whose peak memory increase exceeded its memory budget."""
+    return [
+        f"{name} peaked at {result['peak_increase_mb']:.0f} MB over its budget of {result['memory_mb']} MB"
+        for name, result in results["results"].items()
+        if result.get("memory_mb") and result["peak_increase_mb"] > result["memory_mb"]
+    ]
+
+
+def _flatten(results, prefix=""):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run_benchmark(name, env, options=None):
+    """Run one benchmark in a new Python process and return the JSON result it prints last."""
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-m", "benchmarks.suite", "--benchmark", name, "--options", json.dumps(options or {})],
+        env=dict(os.environ, **env),
+        stdout=subprocess.PIPE,
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    result = json.loads(process.stdout.decode().strip().splitlines()[-1])
+    print(f"{name} done in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+    return result
+
+
+# Benchmarks, each runs in its own process configured through the environment
+
+
+def _peak_rss_mb():
+    from default_detection.model.telemetry import peak_rss_mb
+
+    return peak_rss_mb()
+
+
+def _percentiles(seconds):
+    milliseconds = np.asarray(seconds) * 1e3
+    return {
+        "p50_ms": float(np.percentile(milliseconds, 50)),
+        "p95_ms": float(np.percentile(milliseconds, 95)),
+        "p99_ms": float(np.percentile(milliseconds, 99)),
+    }
+
+
+def _bench_train_model(options):
+    from default_detection.model.model_trainer import ModelTrainer
+
+    classification_model, _, _ = ModelTrainer(max_evals=3, max_time=600, n_workers=1).train_model()
+    return {"model_dir": classification_model.dir}
+
+
+def _bench_cold_start(options):
+    """Seconds from a new process to the first answered /predictions request, with an empty data store."""
+    started = time.perf_counter()
+    from default_detection.api import app, predictions
+    imported = time.perf_counter()
+    predictions.load_model()
+    model_loaded = time.perf_counter()
+    predictions.load_data()
+    data_loaded = time.perf_counter()
+
+    uuid = str(predictions._serving.uuids[0])
+    response = app.test_client().post("/predictions", json={"uuids": [{"uuid": uuid}]})
+    if response.status_code != 200:
+        raise RuntimeError(f"Request failed with status {response.status_code}")
+    answered = time.perf_counter()
+
+    return {
+        "import_seconds": imported - started,
+        "load_model_seconds": model_loaded - imported,
+        "load_data_seconds": data_loaded - model_loaded,
+        "first_request_seconds": answered - data_loaded,
+        "total_seconds": answered - started,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _bench_load_data(options):
+    """Seconds to load the model and the data from the populated data store."""
+    from default_detection.api import predictions
+
+    started = time.perf_counter()
+    predictions.load_model()
+    model_loaded = time.perf_counter()
+    predictions.load_data()
+    data_loaded = time.perf_counter()
+    return {
+        "load_model_seconds": model_loaded - started,
+        "load_data_seconds": data_loaded - model_loaded,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _bench_predictions(options, min_requests=20, max_seconds=5):
+    """Latency of /predictions requests per number of UUIDs, in process through the Flask test client."""
+    from default_detection.api import app, predictions
+
+    predictions.load_data()
+    client = app.test_client()
+    uuids = predictions._serving.uuids
+    rng = np.random.default_rng(SEED)
+
+    results = {}
+    for batch_size in BATCH_SIZES:
+        latencies = []
+        deadline = time.perf_counter() + max_seconds
+        while len(latencies) < min_requests or time.perf_counter() < deadline and len(latencies) < 1000:
+            body = {"uuids": [{"uuid": str(u)} for u in rng.choice(uuids, size=min(batch_size, len(uuids)))]}
+            start = time.perf_counter()
+            response = client.post("/predictions", json=body)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"Request failed with status {response.status_code}")
+        results[f"batch_{batch_size}"] = dict(_percentiles(latencies), requests=len(latencies))
+    return results
+
+
+def _bench_get_all(options):
+    """Rows per second of the streamed /get-all export of the whole test set per format."""
+    from default_detection.api import app, predictions
+
+    predictions.load_data()
+    client = app.test_client()
+    rows = len(predictions._serving.test_set_positions())
+
+    results = {}
+    for output_format in ["csv", "ndjson"]:
+        start = time.perf_counter()
+        response = client.get(f"/get-all?format={output_format}")
+        size = sum(len(chunk) for chunk in response.response)
+        seconds = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"Request failed with status {response.status_code}")
+        results[output_format] = {"rows": rows, "seconds": seconds, "rows_per_second": rows / seconds, "bytes": size}
+    return results
+
+
+def _bench_preprocessing_memory(options, memory_mb=0):
+    """Peak memory of reading, fitting and storing the preprocessing of the CSV into an empty store.
+
+    The increase is over the process with its imports, up to the end of storing, so it excludes
+    loading the stored data set that `load_preprocessed` returns, which `peak_rss_mb` includes.
+    """
+    import tempfile
+
+    from default_detection.data import CSV_DATA, store
+    from default_detection.model.telemetry import Telemetry
+
+    baseline = _peak_rss_mb()
+    store_dir = tempfile.mkdtemp(prefix="benchmark-store-")
+    telemetry = Telemetry()
+    try:
+        start = time.perf_counter()
+        data, _ = store.load_preprocessed(CSV_DATA, store_dir=store_dir, telemetry=telemetry, memory_mb=memory_mb)
+        seconds = time.perf_counter() - start
+        rows = len(data)
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+    peak = _peak_rss_mb()
+    return {
+        "rows": rows,
+        "seconds": seconds,
+        "memory_mb": memory_mb,
+        "baseline_rss_mb": baseline,
+        "peak_rss_mb": peak,
+        "peak_increase_mb": telemetry.stages["store"]["peak_rss_mb"] - baseline,
+        "csv_mb": os.path.getsize(CSV_DATA) / 2 ** 20,
+    }
+
+
+def _bench_preprocessing_memory_chunked(options):
+    """Peak memory of preprocessing the CSV in chunks within the memory budget of the options."""
+    return _bench_preprocessing_memory(options, memory_mb=options["preprocessing_memory_mb"])
+
+
+def _bench_trials(options):
+    """Hyper-search trials completed per minute within a fixed time budget."""
+    import tempfile
+
+    from default_detection import PRUNING_RUNGS, SEARCH_WORKERS
+    from default_detection.model.cv_datasets import CVDatasets
+    from default_detection.model.hyper_optimization import HyperOptimization
+    from default_detection.model.model_trainer import ModelTrainer
+    from default_detection.model.pruning import RungPruner
+
+    trainer = ModelTrainer()
+    data, features, categorical_features = trainer._process_data()
+    train = data[data["dataset"] == "train"]
+    datasets = CVDatasets(
+        train[features].to_numpy(dtype=np.float64),
+        train[trainer.target].to_numpy(dtype=np.float64),
+        features,
+        categorical_features,
+    )
+    optimization = HyperOptimization(
+        datasets, features, categorical_features, trainer.target, pruner=RungPruner() if PRUNING_RUNGS else None,
+    )
+
+    seconds = options["search_seconds"]
+    trials_dir = tempfile.mkdtemp(prefix="benchmark-trials-")
+    try:
+        start = time.perf_counter()
+        optimization.hyper_search(
+            max_evals=100000,
+            timeout=seconds,
+            n_workers=SEARCH_WORKERS,
+            trials_path=os.path.join(trials_dir, "trials.sqlite") if SEARCH_WORKERS > 1 else None,
+        )
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(trials_dir, ignore_errors=True)
+
+    trials = len(optimization.trials.trials)
+    return {
+        "workers": SEARCH_WORKERS,
+        "trials": trials,
+        "seconds": elapsed,
+        "trials_per_minute": trials * 60 / elapsed,
+    }
+
+
+def _print_results(results):
+    print(f"{'metric':<44} {'value':>12}")
+    for metric, value in _flatten(results["results"]):
+        print(f"{metric:<44} {value:>12.4g}")
+
+
+def _print_comparison(rows):
+    print(f"{'metric':<44} {'previous':>12} {'current':>12} {'ratio':>7}")
+    for metric, previous, current, ratio in rows:
+        ratio = f"{ratio:>6.2f}x" if ratio is not None else f"{'-':>7}"
+        print(f"{metric:<44} {previous:>12.4g} {current:>12.4g} {ratio}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000, help="rows of the synthetic data set, 10k to 10M")
+    parser.add_argument("--output", default="benchmark-results.json", help="JSON file to write the results to")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--work-dir", default=os.path.join("benchmarks", "work"),
+                        help="directory for the generated data, model and data store")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS, help="benchmarks to run")
+    parser.add_argument("--search-seconds", type=float, default=60, help="time budget of the trials benchmark")
+    parser.add_argument("--preprocessing-memory-mb", type=int, default=256,
+                        help="memory budget of the chunked preprocessing, its peak above it fails the run")
+    parser.add_argument("--benchmark", help=argparse.SUPPRESS)
+    parser.add_argument("--options", default="{}", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        # Benchmark process started by `_run_benchmark`
+        result = globals()[f"_bench_{args.benchmark}"](json.loads(args.options))
+        print(json.dumps(result))
+        return
+
+    results = run(args.rows, args.work_dir, args.only, args.search_seconds, args.preprocessing_memory_mb)
+    with open(args.output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    _print_results(results)
+
+    if args.compare:
+        with open(args.compare, 'r') as previous_file:
+            previous = json.load(previous_file)
+        if previous["rows"] != results["rows"]:
+            print(f"Warning: comparing runs on {previous['rows']} and {results['rows']} rows", file=sys.stderr)
+        print()
+        _print_comparison(compare(previous, results))
+
+    failures = over_budget(results)
+    for failure in failures:
+        print(f"Over budget: {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
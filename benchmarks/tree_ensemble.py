@@ -0,0 +1,49 @@
+"""Benchmark inference latency of the NumPy tree ensemble against the LightGBM booster.
+
+    python -m benchmarks.tree_ensemble
+"""
+import timeit
+
+import lightgbm as lgb
+import numpy as np
+
+from default_detection.model.tree_ensemble import TreeEnsemble
+
+BATCH_SIZES = [1, 10, 50, 1000]
+
+
+def _train_booster(n_rows=20000, n_features=60, n_rounds=500, seed=0):
+    rng = np.random.default_rng(seed)
+    features = rng.normal(size=(n_rows, n_features))
+    features[rng.random(features.shape) < 0.1] = np.nan
+    features[:, :5] = rng.integers(0, 20, size=(n_rows, 5))
+    target = (np.nan_to_num(features[:, 5:10]).sum(axis=1) + features[:, 0] % 3 + rng.normal(size=n_rows)) > 1
+
+    params = {"objective": "binary", "num_leaves": 64, "learning_rate": 0.05, "verbose": -1}
+    booster = lgb.train(params, lgb.Dataset(features, target.astype(float), categorical_feature=list(range(5))),
+                        num_boost_round=n_rounds)
+    return booster, features
+
+
+def run(batch_sizes=BATCH_SIZES):
+    """Return the latency in seconds of both engines and their largest difference per batch size."""
+    booster, features = _train_booster()
+    ensemble = TreeEnsemble.from_booster(booster)
+
+    results = []
+    for size in batch_sizes:
+        batch = features[:size]
+        repeat = 20 if size < 1000 else 5
+        results.append({
+            "batch_size": size,
+            "lightgbm": min(timeit.repeat(lambda: booster.predict(batch), number=10, repeat=repeat)) / 10,
+            "numpy": min(timeit.repeat(lambda: ensemble.predict(batch), number=10, repeat=repeat)) / 10,
+            "max_abs_diff": float(np.abs(booster.predict(batch) - ensemble.predict(batch)).max()),
+        })
+    return results
+
+
+if __name__ == '__main__':
+    print(f"{'batch':>6} {'lightgbm [ms]':>14} {'numpy [ms]':>11} {'max abs diff':>13}")
+    for r in run():
+        print(f"{r['batch_size']:>6} {r['lightgbm'] * 1e3:>14.3f} {r['numpy'] * 1e3:>11.3f} {r['max_abs_diff']:>13.2e}")
@@ -14,8 +14,75 @@ if not DATA_DIR:
 
 # Bucket to download model
 S3_BUCKET = os.getenv("S3_BUCKET", "labinot-development")
+
+# Local directory to load the model from instead of the bucket
+MODEL_DIR = os.getenv("MODEL_DIR", None)
+
+# Seconds between checks for a new model, 0 disables hot-swapping
+MODEL_POLL_INTERVAL = float(os.getenv("MODEL_POLL_INTERVAL", 0))
 RANDOM_STATE = os.getenv("RANDOM_STATE", 1337)
 
+# Parallel hyper-search, number of worker processes and SQLite file of the trials to resume from
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", 1))
+SEARCH_TRIALS_PATH = os.getenv("SEARCH_TRIALS_PATH", None)
+
+# Write a trace of the hyper-search trials with their telemetry next to the trained model
+TRAINING_TRACE = os.getenv("TRAINING_TRACE", "false").lower() in ("1", "true", "yes")
+
+# Pruning of hyper-search trials, boosting rounds at which trials are compared with earlier ones, e.g. 25,50,100,200,
+# and the percentile of their scores below which trials stop, no rungs disables pruning
+PRUNING_RUNGS = [int(rounds) for rounds in os.getenv("PRUNING_RUNGS", "").split(",") if rounds]
+PRUNING_PERCENTILE = float(os.getenv("PRUNING_PERCENTILE", 50))
+PRUNING_MIN_TRIALS = int(os.getenv("PRUNING_MIN_TRIALS", 5))
+
+# Warm start from an earlier model, "latest" in DATA_DIR or the directory of a model, unset trains from scratch. The
+# search starts from its best parameters and nearby points and stops once a trial reaches its AUC less the tolerance.
+# With boosting, its booster continues boosting for at most the given rounds on the new data instead of a search.
+WARM_START = os.getenv("WARM_START", "")
+WARM_START_POINTS = int(os.getenv("WARM_START_POINTS", 5))
+WARM_START_TOLERANCE = float(os.getenv("WARM_START_TOLERANCE", 0.001))
+WARM_START_BOOSTING = os.getenv("WARM_START_BOOSTING", "false").lower() in ("1", "true", "yes")
+WARM_START_ROUNDS = int(os.getenv("WARM_START_ROUNDS", 200))
+
+# Feature pruning after the hyper-search, fractions of the features to retrain the tuned model on, the most important
+# by gain, reported with their AUC, F1, latency and memory in the model metadata, no fractions disables it
+FEATURE_PRUNING_FRACTIONS = [float(f) for f in os.getenv("FEATURE_PRUNING_FRACTIONS", "").split(",") if f]
+
+# Serve predictions from a score table computed once per model
+MATERIALIZE_SCORES = os.getenv("MATERIALIZE_SCORES", "false").lower() in ("1", "true", "yes")
+SCORE_CHUNK_SIZE = int(os.getenv("SCORE_CHUNK_SIZE", 50000))
+
+# Reason codes, the most contributing features kept per row and a limit of top_k, computed for the loaded rows on first
+# request or for all of them when the model is loaded, and the most rows not loaded whose reason codes are kept
+REASON_CODES_TOP_K = int(os.getenv("REASON_CODES_TOP_K", 5))
+MATERIALIZE_REASON_CODES = os.getenv("MATERIALIZE_REASON_CODES", "false").lower() in ("1", "true", "yes")
+REASON_CODES_CACHE_SIZE = int(os.getenv("REASON_CODES_CACHE_SIZE", 10000))
+
+# Append-only file of ingested records shared by the server processes and replayed on start, in memory only when unset
+INGESTION_LOG = os.getenv("INGESTION_LOG", None)
+
+# Inference engine of the predictor, "lightgbm" or "numpy"
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "lightgbm")
+
+# Micro-batching of raw record scoring, wait in seconds
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 256))
+BATCH_MAX_WAIT = float(os.getenv("BATCH_MAX_WAIT", 0.005))
+
+# Pre-fork server, 0 workers starts one per CPU and 0 max requests never recycles workers
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", 5000))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", 0))
+SERVER_CPU_AFFINITY = os.getenv("SERVER_CPU_AFFINITY", "true").lower() in ("1", "true", "yes")
+WORKER_MAX_REQUESTS = int(os.getenv("WORKER_MAX_REQUESTS", 0))
+WORKER_GRACEFUL_TIMEOUT = float(os.getenv("WORKER_GRACEFUL_TIMEOUT", 30))
+
+# Directory of the metric files the pre-fork server processes share, a temporary directory when unset
+METRICS_DIR = os.getenv("METRICS_DIR", None)
+
+# Batch scoring of files, 0 workers starts one per CPU, the input is split into chunks of about this many bytes
+BATCH_SCORING_WORKERS = int(os.getenv("BATCH_SCORING_WORKERS", 0))
+BATCH_SCORING_CHUNK_BYTES = int(os.getenv("BATCH_SCORING_CHUNK_BYTES", 16 * 2 ** 20))
+
 # AWS credentials
 AWS_CREDENTIALS = {
     "aws_access_key_id": os.getenv("AWS_ACCESS_KEY_ID"),
@@ -0,0 +1,155 @@
+import collections
+import io
+import logging
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from default_detection import BATCH_SCORING_CHUNK_BYTES, BATCH_SCORING_WORKERS, DATA_DIR, MODEL_DIR
+from default_detection.api.model_cache import ModelCache
+from default_detection.api.predictor import Predictor
+from default_detection.data import CATEGORICAL_FEATURES, ENCODED_FEATURES, NUMERICAL_FEATURES
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ["csv", "parquet"]
+
+# Predictor of the worker process, loaded once by the pool initializer
+_predictor = None
+
+
+class BatchScorer(object):
+    """Score a `;` delimited CSV of raw records of any size with the fitted preprocessing of the model.
+
+    The input is split at line breaks into chunks of about `chunk_bytes`, which worker processes
+    read, preprocess, score and serialize on their own, so the parent only writes the results in
+    input order. At most two chunks per worker are in flight, which bounds memory independent of
+    the input size. Values must not contain line breaks.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, workers=BATCH_SCORING_WORKERS, chunk_bytes=BATCH_SCORING_CHUNK_BYTES):
+        self.model_dir = model_dir
+        self.workers = workers or os.cpu_count()
+        self.chunk_bytes = chunk_bytes
+
+    def score(self, input_path, output_path, output_format="csv"):
+        """Write uuid, pd and default of every input record to the output, return the number of rows."""
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {output_format!r}, expected one of {OUTPUT_FORMATS}")
+
+        model_dir = self.model_dir
+        if not model_dir:
+            # Download once, the workers only read the local files
+            model_dir = DATA_DIR
+            ModelCache().fetch(model_dir)
+        if not os.path.exists(os.path.join(model_dir, "preprocessing.json")):
+            raise ValueError("The model has no fitted preprocessing to score raw records")
+
+        start = time.perf_counter()
+        rows = 0
+        # The workers load the model themselves, the OpenMP pool of LightGBM does not survive a fork
+        with multiprocessing.Pool(self.workers, initializer=_load_predictor, initargs=(model_dir,)) as pool:
+            with _OutputWriter(output_path, output_format) as output:
+                pending = collections.deque()
+                for chunk in _chunks(input_path, self.chunk_bytes):
+                    pending.append(pool.apply_async(_score_chunk, (input_path, chunk, output_format)))
+                    if len(pending) >= 2 * self.workers:
+                        rows += output.write(*pending.popleft().get())
+                while pending:
+                    rows += output.write(*pending.popleft().get())
+
+        seconds = time.perf_counter() - start
+        logger.info(f"Scored {rows} rows in {seconds:.1f} s, {rows / seconds:.0f} rows/s with {self.workers} workers")
+        return rows
+
+
+def _chunks(path, chunk_bytes):
+    """Yield the header and (start, end) byte offsets of chunks of whole lines after the header."""
+    with open(path, 'rb') as input_file:
+        header = input_file.readline()
+        start = input_file.tell()
+        size = os.fstat(input_file.fileno()).st_size
+        while start < size:
+            input_file.seek(min(start + chunk_bytes, size))
+            # Extend the chunk to the end of the line it ends in
+            input_file.readline()
+            end = input_file.tell()
+            yield header, start, end
+            start = end
+
+
+def _load_predictor(model_dir):
+    global _predictor
+
+    # One thread per process, the pool provides the parallelism
+    _predictor = Predictor(model_dir=model_dir, num_threads=1)
+
+
+def _score_chunk(path, chunk, output_format):
+    """Read, preprocess and score a chunk, return it serialized for CSV or as columns and its rows."""
+    header, start, end = chunk
+    with open(path, 'rb') as input_file:
+        input_file.seek(start)
+        content = input_file.read(end - start)
+
+    raw = pd.read_csv(
+        io.BytesIO(header + content),
+        delimiter=";",
+        usecols=["uuid"] + NUMERICAL_FEATURES + CATEGORICAL_FEATURES,
+        dtype={column: object for column in ENCODED_FEATURES},
+    )
+    columns = {column: raw[column].to_numpy() for column in NUMERICAL_FEATURES + CATEGORICAL_FEATURES}
+    matrix = _predictor.preprocessor.transform_matrix(columns, _predictor.metadata["features"])
+
+    probabilities = np.round(_predictor.predict_features(matrix), 5)
+    predictions = pd.DataFrame({
+        "uuid": raw["uuid"].to_numpy(),
+        "pd": probabilities,
+        "default": np.where(probabilities < 0.5, 0, 1),
+    })
+
+    if output_format == "csv":
+        return predictions.to_csv(sep=";", index=False, header=False), len(predictions)
+    return predictions, len(predictions)
+
+
+class _OutputWriter(object):
+    """Append scored chunks to a CSV file or as row groups to a Parquet file."""
+
+    def __init__(self, path, output_format):
+        self.path = path
+        self.output_format = output_format
+        self._file = None
+        self._parquet_writer = None
+        self._schema = None
+
+    def __enter__(self):
+        if self.output_format == "csv":
+            self._file = open(self.path, 'w')
+            self._file.write("uuid;pd;default\n")
+        else:
+            # Optional dependency, only needed for columnar output
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            self._schema = pa.schema([("uuid", pa.string()), ("pd", pa.float64()), ("default", pa.int64())])
+            self._parquet_writer = pq.ParquetWriter(self.path, self._schema)
+        return self
+
+    def write(self, chunk, rows):
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            import pyarrow as pa
+
+            self._parquet_writer.write_table(pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False))
+        return rows
+
+    def __exit__(self, *_):
+        if self._file is not None:
+            self._file.close()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
@@ -0,0 +1,140 @@
+import collections
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from default_detection import BATCH_MAX_SIZE, BATCH_MAX_WAIT
+
+logger = logging.getLogger(__name__)
+
+_Request = collections.namedtuple("_Request", ["records", "future", "enqueued"])
+
+
+class MicroBatcher(object):
+    """Combine concurrent scoring requests into a single model call.
+
+    A background thread takes requests from a queue and scores them together once the batch holds
+    `max_batch_size` records or the oldest request has waited `max_wait` seconds.
+    """
+
+    def __init__(self, predict, max_batch_size=BATCH_MAX_SIZE, max_wait=BATCH_MAX_WAIT, window=1000):
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._batches = 0
+        self._requests = 0
+        self._records = 0
+        self._batch_sizes = collections.deque(maxlen=window)
+        self._queue_waits = collections.deque(maxlen=window)
+
+    def submit(self, records):
+        """Queue records for scoring and return a future of their predictions."""
+        self._ensure_running()
+        future = Future()
+        self._queue.put(_Request(records, future, time.monotonic()))
+        return future
+
+    def score(self, records, timeout=30):
+        """Score records and wait for their predictions."""
+        return self.submit(records).result(timeout=timeout)
+
+    def stats(self):
+        """Return batch size and queue wait statistics over the recent batches."""
+        with self._lock:
+            batch_sizes = np.asarray(self._batch_sizes, dtype=np.float64)
+            queue_waits = np.asarray(self._queue_waits, dtype=np.float64) * 1000
+            stats = {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "queue_size": self._queue.qsize(),
+                "batches": self._batches,
+                "requests": self._requests,
+                "records": self._records,
+            }
+
+        stats["batch_size"] = _summary(batch_sizes)
+        stats["queue_wait_ms"] = _summary(queue_waits)
+        return stats
+
+    def _ensure_running(self):
+        # Threads do not survive a fork, so each process starts its own
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0].records)
+            deadline = batch[0].enqueued + self.max_wait
+
+            while size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request.records)
+
+            self._process(batch)
+
+    def _process(self, batch):
+        dispatched = time.monotonic()
+        records = [record for request in batch for record in request.records]
+
+        try:
+            predictions = self.predict(records)
+        except Exception as e:
+            if len(batch) == 1:
+                _fail(batch[0], e)
+            else:
+                # Score the requests one by one, so the error only reaches the request that caused it
+                logger.warning("Failed to score batch of %d requests, scoring them one by one", len(batch))
+                for request in batch:
+                    try:
+                        request.future.set_result(self.predict(request.records))
+                    except Exception as request_error:
+                        _fail(request, request_error)
+        else:
+            start = 0
+            for request in batch:
+                end = start + len(request.records)
+                request.future.set_result(predictions[start:end])
+                start = end
+
+        with self._lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._records += len(records)
+            self._batch_sizes.append(len(records))
+            self._queue_waits.extend(dispatched - request.enqueued for request in batch)
+
+
+def _fail(request, error):
+    logger.error("Failed to score request of %d records", len(request.records), exc_info=error)
+    request.future.set_exception(error)
+
+
+def _summary(values):
+    if not len(values):
+        return {"mean": None, "p50": None, "p95": None, "max": None}
+    return {
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "max": float(values.max()),
+    }
@@ -0,0 +1,137 @@
+import json
+import uuid
+
+import numpy as np
+from werkzeug.exceptions import BadRequest, UnsupportedMediaType
+
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+JSON = "application/json"
+
+FORMATS = {
+    MSGPACK: "msgpack",
+    "application/x-msgpack": "msgpack",
+    ARROW: "arrow",
+}
+CONTENT_TYPES = {
+    "msgpack": MSGPACK,
+    "arrow": ARROW,
+}
+
+
+def request_format(mimetype):
+    """Return the binary format of a request body with the given mimetype, None for JSON."""
+    return FORMATS.get(mimetype)
+
+
+def response_format(body_format, accept_mimetypes):
+    """Return the binary format of the response, None for JSON.
+
+    A binary type or JSON named in the Accept header wins, otherwise the response has the format of
+    the request body.
+    """
+    for mimetype, quality in accept_mimetypes:
+        if quality > 0 and (mimetype in FORMATS or mimetype == JSON):
+            return FORMATS.get(mimetype)
+    return body_format
+
+
+def decode_uuids(body, body_format):
+    """Return the UUIDs of a binary /predictions request body and whether they were packed.
+
+    A msgpack body is a map with `uuids`, either an array of strings or 16 bytes per UUID in one
+    bin. An Arrow IPC stream has a `uuid` column of strings or of 16 byte fixed size binaries.
+    """
+    if body_format == "msgpack":
+        msgpack = _import("msgpack")
+        try:
+            data = msgpack.unpackb(body, raw=False)
+            uuids = data["uuids"]
+        except (ValueError, TypeError, KeyError, msgpack.UnpackException) as e:
+            raise BadRequest(f"Invalid msgpack body, expected a map with uuids: {e}")
+        if isinstance(uuids, bytes):
+            return unpack_uuids(uuids), True
+        if not isinstance(uuids, list):
+            raise BadRequest("uuids must be an array of strings or a bin of 16 bytes per UUID")
+        return uuids, False
+
+    pa = _import("pyarrow")
+    try:
+        table = pa.ipc.open_stream(body).read_all()
+        column = table.column("uuid")
+    except (pa.ArrowException, KeyError) as e:
+        raise BadRequest(f"Invalid Arrow stream, expected a uuid column: {e}")
+    if column.null_count:
+        raise BadRequest("The uuid column must not hold nulls")
+    if pa.types.is_fixed_size_binary(column.type) and column.type.byte_width == 16:
+        array = column.combine_chunks()
+        values = array.buffers()[1].to_pybytes()
+        return unpack_uuids(values[array.offset * 16:(array.offset + len(array)) * 16]), True
+    if not pa.types.is_string(column.type):
+        raise BadRequest("The uuid column must hold strings or 16 byte binaries")
+    return column.to_numpy().tolist(), False
+
+
+def encode_predictions(uuids, probabilities, defaults, unknown, output_format, packed=False):
+    """Serialize the uuid, pd and default columns and the unknown UUIDs in a binary format.
+
+    The msgpack response is `{"predictions": {"uuid": [...], "pd": [...], "default": [...]},
+    "unknown_uuids": [...]}`. The Arrow response is a stream of one record batch with the columns,
+    the unknown UUIDs are a JSON array in the `unknown_uuids` metadata of its schema. UUIDs are
+    packed into 16 bytes each if they were packed in the request.
+    """
+    if output_format == "msgpack":
+        msgpack = _import("msgpack")
+        return msgpack.packb({
+            "predictions": {
+                "uuid": pack_uuids(uuids) if packed else uuids.tolist(),
+                "pd": probabilities.tolist(),
+                "default": defaults.tolist(),
+            },
+            "unknown_uuids": pack_uuids(unknown) if packed else unknown,
+        })
+
+    pa = _import("pyarrow")
+    if packed:
+        uuid_column = pa.FixedSizeBinaryArray.from_buffers(
+            pa.binary(16), len(uuids), [None, pa.py_buffer(pack_uuids(uuids))]
+        )
+    else:
+        uuid_column = pa.array(uuids, type=pa.string())
+    batch = pa.RecordBatch.from_arrays(
+        [uuid_column, pa.array(probabilities, type=pa.float64()), pa.array(defaults, type=pa.int8())],
+        ["uuid", "pd", "default"],
+    )
+    schema = batch.schema.with_metadata({"unknown_uuids": json.dumps(unknown)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(batch.replace_schema_metadata(schema.metadata))
+    return sink.getvalue().to_pybytes()
+
+
+def unpack_uuids(packed):
+    """Return the canonical strings of UUIDs packed into 16 bytes each."""
+    if len(packed) % 16:
+        raise BadRequest("Packed uuids must be 16 bytes per UUID")
+    digits = np.frombuffer(packed.hex().encode(), dtype=np.uint8).reshape(-1, 32)
+    canonical = np.full((len(digits), 36), ord("-"), dtype=np.uint8)
+    for start, end, offset in [(0, 8, 0), (8, 12, 1), (12, 16, 2), (16, 20, 3), (20, 32, 4)]:
+        canonical[:, start + offset:end + offset] = digits[:, start:end]
+    return canonical.view("S36").ravel().astype(str).tolist()
+
+
+def pack_uuids(uuids):
+    """Pack canonical UUID strings into 16 bytes each."""
+    try:
+        return bytes.fromhex("".join(uuids).replace("-", ""))
+    except ValueError:
+        # Not all canonical, parse them one by one
+        return b"".join(uuid.UUID(u).bytes for u in uuids)
+
+
+def _import(name):
+    # Optional dependencies, only needed by callers of the binary formats
+    try:
+        return __import__(name)
+    except ImportError:
+        raise UnsupportedMediaType(f"{name} is not installed on this server")
@@ -1,24 +1,123 @@
-from flask import jsonify, request, render_template
-from werkzeug.exceptions import HTTPException
+from flask import Response, jsonify, request, render_template, url_for
+from werkzeug.exceptions import BadRequest, HTTPException
 
-from default_detection.api import app
-from default_detection.api.predictions import predict_default_probability, predict_test_set_default_probability
+from default_detection import REASON_CODES_TOP_K
+from default_detection.api import app, binary, export, instrumentation
+from default_detection.api.predictions import (
+    batcher_stats,
+    build_response,
+    explain_raw_records,
+    explain_uuids,
+    ingest_records,
+    model_info,
+    predict_raw_default_probability,
+    iter_test_set_default_probability,
+    predict_default_probability,
+    predict_uuids,
+    predict_test_set_default_probability,
+)
 
 
 @app.route("/predictions", methods=["POST"])
 def predictions():
+    stages = instrumentation.StageTimer(instrumentation.PREDICTION_STAGE_SECONDS)
+    body_format = binary.request_format(request.mimetype)
+    try:
+        output_format = binary.response_format(body_format, request.accept_mimetypes)
+        if body_format is not None or output_format is not None:
+            return _binary_predictions(body_format, output_format, stages)
+
+        data = request.get_json()
+        stages.lap("parse")
+        orient = request.args.get("orient", "records")
+        if orient not in ("records", "columns"):
+            raise BadRequest(f"Unknown orient {orient!r}, expected 'records' or 'columns'")
+
+        result, unknown = predict_default_probability(data["uuids"], orient=orient, stages=stages)
+        response = jsonify(predictions=result, unknown_uuids=unknown)
+        stages.lap("respond")
+        stages.record()
+        return response
+    except Exception as e:
+        app.logger.error(e, exc_info=True)
+        return handle_error(e)
+
+
+def _binary_predictions(body_format, output_format, stages):
+    """Answer /predictions in msgpack or Arrow IPC, with packed UUIDs in and columns out."""
+    if body_format is None:
+        ids, packed = [i["uuid"] for i in request.get_json()["uuids"]], False
+    else:
+        ids, packed = binary.decode_uuids(request.get_data(), body_format)
+    stages.lap("parse")
+
+    uuids, probabilities, defaults, unknown = predict_uuids(ids, stages)
+    if output_format is None:
+        result = build_response(uuids, probabilities, defaults, orient="columns")
+        stages.lap("serialize")
+        response = jsonify(predictions=result, unknown_uuids=unknown)
+    else:
+        body = binary.encode_predictions(uuids, probabilities, defaults, unknown, output_format, packed)
+        stages.lap("serialize")
+        response = Response(body, mimetype=binary.CONTENT_TYPES[output_format])
+    stages.lap("respond")
+    stages.record()
+    return response
+
+
+@app.route("/reason-codes", methods=["POST"])
+def reason_codes():
     data = request.get_json()
     try:
-        result = predict_default_probability(data["uuids"])
+        top_k = _int_arg("top_k", REASON_CODES_TOP_K)
+        if "records" in data:
+            return jsonify(reason_codes=explain_raw_records(data["records"], top_k))
+
+        result, unknown = explain_uuids([i["uuid"] for i in data["uuids"]], top_k)
+        return jsonify(reason_codes=result, unknown_uuids=unknown)
+    except ValueError as e:
+        return handle_error(BadRequest(str(e)))
+    except Exception as e:
+        app.logger.error(e, exc_info=True)
+        return handle_error(e)
+
+
+@app.route("/score", methods=["POST"])
+def score():
+    data = request.get_json()
+    try:
+        result = predict_raw_default_probability(data["records"])
         return jsonify(predictions=result)
+    except ValueError as e:
+        return handle_error(BadRequest(str(e)))
     except Exception as e:
         app.logger.error(e, exc_info=True)
-        handle_error(e)
+        return handle_error(e)
+
+
+@app.route("/ingest", methods=["POST"])
+def ingest():
+    data = request.get_json()
+    try:
+        return jsonify(ingest_records(data["records"]))
+    except ValueError as e:
+        return handle_error(BadRequest(str(e)))
+    except Exception as e:
+        app.logger.error(e, exc_info=True)
+        return handle_error(e)
+
+
+@app.route("/score/stats", methods=["GET"])
+def score_stats():
+    return jsonify(batcher_stats())
 
 
 @app.route("/get-all", methods=["GET"])
 def get_all_predictions():
     try:
+        if "format" in request.args:
+            return _stream_all_predictions()
+
         result = predict_test_set_default_probability()
         return render_template(
             "predictions.html",
@@ -27,7 +126,46 @@ def get_all_predictions():
 
     except Exception as e:
         app.logger.error(e, exc_info=True)
-        handle_error(e)
+        return handle_error(e)
+
+
+def _stream_all_predictions():
+    """Stream a page of the test set predictions in chunks without a Content-Length."""
+    output_format = request.args["format"]
+    if output_format not in export.FORMATS:
+        raise BadRequest(f"Unknown format {output_format!r}, expected one of {sorted(export.FORMATS)}")
+
+    cursor = _int_arg("cursor", 0)
+    # A page of no rows would point the next cursor at itself
+    limit = _int_arg("limit", None, minimum=1)
+
+    next_cursor, chunks = iter_test_set_default_probability(cursor=cursor, limit=limit)
+    stylesheet = url_for('static', filename='style.css')
+
+    response = Response(export.stream(chunks, output_format, stylesheet), mimetype=export.FORMATS[output_format])
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return response
+
+
+def _int_arg(name, default, minimum=0):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    # isdigit() also accepts digits like "²" that int() rejects
+    if not value.isdecimal() or int(value) < minimum:
+        raise BadRequest(f"{name} must be an integer of at least {minimum}")
+    return int(value)
+
+
+@app.route("/model", methods=["GET"])
+def model():
+    return jsonify(model_info())
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(instrumentation.REGISTRY.exposition(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/health-check", methods=["GET"])
@@ -41,3 +179,6 @@ def handle_error(e):
     if isinstance(e, HTTPException):
         code = e.code
     return jsonify(error=str(e)), code
+
+
+app.wsgi_app = instrumentation.RequestMetrics(app, app.wsgi_app)
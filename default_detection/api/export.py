@@ -0,0 +1,59 @@
+import html
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "html": "text/html",
+}
+
+
+def stream(chunks, output_format, stylesheet=None):
+    """Serialize data frame chunks one at a time in the requested output format."""
+    if output_format == "csv":
+        return _stream_csv(chunks)
+    if output_format == "ndjson":
+        return _stream_ndjson(chunks)
+    if output_format == "html":
+        return _stream_html(chunks, stylesheet)
+    raise ValueError(f"Unknown format {output_format!r}, expected one of {sorted(FORMATS)}")
+
+
+def _stream_csv(chunks):
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(sep=";", index=False, header=header)
+        header = False
+
+
+def _stream_ndjson(chunks):
+    for chunk in chunks:
+        if len(chunk):
+            yield chunk.to_json(orient="records", lines=True).rstrip("\n") + "\n"
+
+
+def _stream_html(chunks, stylesheet):
+    head = '<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="UTF-8">\n<title>Predictions</title>\n'
+    if stylesheet:
+        head += f'<link rel=stylesheet type=text/css href="{html.escape(stylesheet)}">\n'
+    yield head + '</head>\n<body>\n<h2>Test set</h2>\n'
+
+    columns = None
+    for chunk in chunks:
+        if columns is None:
+            columns = list(chunk.columns)
+            yield (
+                '<table border="1" class="dataframe data">\n<thead>\n<tr><th></th>'
+                + "".join(f"<th>{html.escape(str(c))}</th>" for c in columns)
+                + "</tr>\n</thead>\n<tbody>\n"
+            )
+        yield "".join(_html_rows(chunk, columns))
+
+    if columns is None:
+        yield '<table border="1" class="dataframe data">\n<tbody>\n'
+    yield "</tbody>\n</table>\n</body>\n</html>\n"
+
+
+def _html_rows(chunk, columns):
+    values = [chunk[c].astype(str).map(html.escape).to_numpy() for c in columns]
+    for i, index in enumerate(chunk.index.astype(str)):
+        yield "<tr><th>" + html.escape(index) + "</th>" + "".join(f"<td>{v[i]}</td>" for v in values) + "</tr>\n"
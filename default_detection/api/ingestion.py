@@ -0,0 +1,101 @@
+import fcntl
+import json
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class DeltaRows(object):
+    """Rows ingested after the data set was loaded, with their features and scores.
+
+    The arrays have spare capacity and double when full, so appending costs the size of the delta
+    and not of the data set. Appended rows are written before `size` grows, and arrays are replaced
+    rather than resized, so readers of rows below `size` never see partial rows.
+    """
+
+    def __init__(self, n_features, capacity=1024):
+        self.size = 0
+        self.uuids = np.empty(capacity, dtype=object)
+        self.features = np.empty((capacity, n_features), dtype=np.float64)
+        self.probabilities = np.empty(capacity, dtype=np.float64)
+        self.defaults = np.empty(capacity, dtype=np.int8)
+        self.missing_target = np.empty(capacity, dtype=bool)
+        self.superseded = np.empty(capacity, dtype=bool)
+
+    def append(self, uuids, features, probabilities, defaults, missing_target):
+        """Append rows and return the position of the first one among the ingested rows."""
+        start, end = self.size, self.size + len(uuids)
+        if end > len(self.uuids):
+            self._grow(end)
+
+        self.uuids[start:end] = uuids
+        self.features[start:end] = features
+        self.probabilities[start:end] = probabilities
+        self.defaults[start:end] = defaults
+        self.missing_target[start:end] = missing_target
+        self.superseded[start:end] = False
+        self.size = end
+        return start
+
+    def _grow(self, size):
+        capacity = max(size, 2 * len(self.uuids))
+        for name in ["uuids", "features", "probabilities", "defaults", "missing_target", "superseded"]:
+            values = getattr(self, name)
+            grown = np.empty((capacity,) + values.shape[1:], dtype=values.dtype)
+            grown[:self.size] = values[:self.size]
+            setattr(self, name, grown)
+
+
+class IngestionLog(object):
+    """Append-only JSON lines file of ingested records, shared by all server processes.
+
+    Every process applies the batches appended since it last read the log, so records ingested
+    through any worker reach all workers, and a restarted or hot-swapped model replays them all.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+
+    def append(self, records):
+        """Append a batch of records in one write under an exclusive lock."""
+        batch = json.dumps({"records": records}) + "\n"
+        with open(self.path, 'a') as log_file:
+            fcntl.flock(log_file, fcntl.LOCK_EX)
+            try:
+                log_file.write(batch)
+            finally:
+                fcntl.flock(log_file, fcntl.LOCK_UN)
+
+    def has_new(self):
+        try:
+            return os.stat(self.path).st_size > self.offset
+        except FileNotFoundError:
+            return False
+
+    def read_new(self):
+        """Yield the batches of records appended since the last read.
+
+        The offset moves past each batch as it is yielded, so a batch that fails to apply is skipped
+        and does not take the batches after it along. Lines that are not valid batches are skipped.
+        """
+        with open(self.path, 'rb') as log_file:
+            log_file.seek(self.offset)
+            data = log_file.read()
+
+        # A batch being written is left for the next read
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].split(b"\n")[:-1]:
+            start = self.offset
+            self.offset += len(line) + 1
+            if not line.strip():
+                continue
+            try:
+                records = json.loads(line)["records"]
+            except (ValueError, KeyError, TypeError):
+                logger.error(f"Skipping an invalid line of the ingestion log {self.path} at offset {start}")
+                continue
+            yield records
@@ -0,0 +1,344 @@
+import bisect
+import glob
+import itertools
+import mmap
+import os
+import threading
+import time
+
+import numpy as np
+
+# Upper bounds of the histogram buckets
+LATENCY_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+LOAD_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600]
+BATCH_SIZE_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+ENDPOINTS = [
+    "predictions", "reason_codes", "score", "score_stats", "ingest", "get_all_predictions", "model", "health_check",
+    "metrics", "other",
+]
+STATUS_CLASSES = ["2xx", "3xx", "4xx", "5xx"]
+PREDICTION_STAGES = ["parse", "lookup", "predict", "serialize", "respond"]
+
+
+class Registry(object):
+    """Values of all metrics of the process in one flat array of doubles.
+
+    With a directory, the array is a memory-mapped file per process and the exposition sums the
+    files of all processes, so the workers of the pre-fork server report as one. Forked processes
+    start from zero in a file of their own. Files of exited processes are merged into one archive,
+    without their gauges. Updates index a memoryview, which costs less than indexing NumPy arrays
+    on the request path. Metrics are registered when their module is imported, before any update.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.size = 0
+        self.directory = None
+        self._values = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def register(self, metric):
+        metric.offset = self.size
+        self.size += metric.size
+        self.metrics.append(metric)
+        self._values = None
+        return metric
+
+    def use_directory(self, directory):
+        """Share the metrics through files in the directory, values recorded so far are kept."""
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, "*.bin")):
+            os.remove(path)
+
+        with self._lock:
+            previous = self._values
+            self.directory = directory
+            self._values = None
+            if previous is not None:
+                self._array()[:] = previous
+
+    def add(self, index, amount):
+        with self._lock:
+            values = self._values
+            if values is None:
+                values = self._array()
+            values[index] += amount
+
+    def observe(self, bucket_index, sum_index, value):
+        """Count an observation in its histogram bucket and add it to the sum."""
+        with self._lock:
+            values = self._values
+            if values is None:
+                values = self._array()
+            values[bucket_index] += 1
+            values[sum_index] += value
+
+    def observe_many(self, updates):
+        """Record (bucket index, sum index, value) observations under a single lock."""
+        with self._lock:
+            values = self._values
+            if values is None:
+                values = self._array()
+            for bucket_index, sum_index, value in updates:
+                values[bucket_index] += 1
+                values[sum_index] += value
+
+    def collect(self):
+        """Return the values summed over all processes."""
+        with self._lock:
+            values = np.array(self._array(), dtype=np.float64)
+
+        if self.directory is not None:
+            own = self._path(os.getpid())
+            for path in glob.glob(os.path.join(self.directory, "*.bin")):
+                if path != own:
+                    other = np.fromfile(path, dtype=np.float64)
+                    if len(other) == self.size:
+                        values += other
+        return values
+
+    def mark_dead(self, pid):
+        """Merge the file of an exited process into the archive, dropping its gauges."""
+        if self.directory is None or not os.path.exists(self._path(pid)):
+            return
+
+        values = np.fromfile(self._path(pid), dtype=np.float64)
+        if len(values) == self.size:
+            for metric in self.metrics:
+                if isinstance(metric, Gauge):
+                    values[metric.offset:metric.offset + metric.size] = 0
+
+            archive = self._path("archive")
+            if os.path.exists(archive):
+                values += np.fromfile(archive, dtype=np.float64)
+            # Written next to the archive and moved into place, readers never see a partial file
+            values.tofile(archive + ".tmp")
+            os.replace(archive + ".tmp", archive)
+        os.remove(self._path(pid))
+
+    def exposition(self):
+        """Return all metrics in the Prometheus text format."""
+        values = self.collect()
+        return "".join(metric.exposition(values) for metric in self.metrics)
+
+    def _array(self):
+        if self._values is None:
+            if self.directory is None:
+                buffer = bytearray(8 * self.size)
+            else:
+                with open(self._path(os.getpid()), 'w+b') as values_file:
+                    values_file.truncate(8 * self.size)
+                    buffer = mmap.mmap(values_file.fileno(), 8 * self.size)
+            self._values = memoryview(buffer).cast("d")
+        return self._values
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _reset(self):
+        # The child must not count into the file of its parent
+        self._lock = threading.Lock()
+        self._values = None
+
+
+REGISTRY = Registry()
+
+
+class _Metric(object):
+    """Metric with one series per combination of the label values, which are fixed up front."""
+
+    kind = None
+    values_per_series = 1
+
+    def __init__(self, name, documentation, labels=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = [label for label, _ in labels]
+        self.series = list(itertools.product(*[values for _, values in labels])) or [()]
+        self.offset = 0
+        self.size = len(self.series) * self.values_per_series
+        self.registry = registry
+        registry.register(self)
+        self._indexes = {series: self.offset + i * self.values_per_series for i, series in enumerate(self.series)}
+
+    def _index(self, label_values):
+        return self._indexes[label_values]
+
+    def _labels(self, series, extra=None):
+        pairs = list(zip(self.label_names, series))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+    def exposition(self, values):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for series in self.series:
+            index = self._index(series)
+            lines.extend(self._series_lines(series, values[index:index + self.values_per_series]))
+        return "\n".join(lines) + "\n"
+
+    def _series_lines(self, series, values):
+        return [f"{self.name}{self._labels(series)} {_format(values[0])}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        self.registry.add(self._indexes[label_values], amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *label_values, amount=1):
+        self.registry.add(self._indexes[label_values], amount)
+
+    def dec(self, *label_values, amount=1):
+        self.registry.add(self._indexes[label_values], -amount)
+
+
+class Histogram(_Metric):
+    """Histogram with fixed buckets, stored as the count per bucket and the sum of the observations."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets, labels=(), registry=REGISTRY):
+        self.buckets = list(buckets)
+        # Count per bucket including +Inf, then the sum
+        self.values_per_series = len(self.buckets) + 2
+        self._sum_offset = len(self.buckets) + 1
+        super().__init__(name, documentation, labels, registry)
+
+    def observe(self, value, *label_values):
+        index = self._indexes[label_values]
+        self.registry.observe(index + bisect.bisect_left(self.buckets, value), index + self._sum_offset, value)
+
+    def observe_many(self, observations):
+        """Record (value, label values) observations at once."""
+        updates = []
+        for value, label_values in observations:
+            index = self._indexes[label_values]
+            updates.append((index + bisect.bisect_left(self.buckets, value), index + self._sum_offset, value))
+        self.registry.observe_many(updates)
+
+    def _series_lines(self, series, values):
+        counts = np.cumsum(values[:-1])
+        lines = [
+            f"{self.name}_bucket{self._labels(series, ('le', bound))} {_format(count)}"
+            for bound, count in zip([_format(b) for b in self.buckets] + ["+Inf"], counts)
+        ]
+        lines.append(f"{self.name}_sum{self._labels(series)} {_format(values[-1])}")
+        lines.append(f"{self.name}_count{self._labels(series)} {_format(counts[-1])}")
+        return lines
+
+
+class RequestMetrics(object):
+    """WSGI middleware counting requests in flight, their latency and their responses per endpoint.
+
+    Endpoints are found by path from the static routes of the Flask app, without Flask request
+    proxies. Latency is measured until the response starts, streamed bodies are not included.
+    """
+
+    def __init__(self, flask_app, wsgi_app):
+        self.flask_app = flask_app
+        self.wsgi_app = wsgi_app
+        self._endpoints = None
+
+    def __call__(self, environ, start_response):
+        start = time.perf_counter()
+        if self._endpoints is None:
+            self._endpoints = {
+                rule.rule: rule.endpoint if rule.endpoint in ENDPOINTS else "other"
+                for rule in self.flask_app.url_map.iter_rules()
+            }
+        endpoint = self._endpoints.get(environ.get("PATH_INFO"), "other")
+        status = []
+
+        def record_status(status_line, headers, exc_info=None):
+            status.append(status_line)
+            return start_response(status_line, headers, exc_info)
+
+        IN_FLIGHT_REQUESTS.inc()
+        try:
+            return self.wsgi_app(environ, record_status)
+        finally:
+            IN_FLIGHT_REQUESTS.dec()
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint)
+            status_class = status[0][0] + "xx" if status else "5xx"
+            RESPONSES.inc(endpoint, status_class if status_class in STATUS_CLASSES else "5xx")
+
+
+class StageTimer(object):
+    """Time consecutive stages of a request with one clock reading per stage.
+
+    Each lap observes the seconds since the previous lap, or since the timer started, for the
+    stage label of a histogram. The laps are recorded together by `record`, so timing the stages
+    costs one lock for the request.
+    """
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.laps = []
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.laps.append((now - self._last, (stage,)))
+        self._last = now
+
+    def record(self):
+        self.histogram.observe_many(self.laps)
+        self.laps = []
+
+
+def _format(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+REQUEST_SECONDS = Histogram(
+    "default_detection_request_seconds",
+    "Time to handle a request until the response starts, streamed bodies are not included.",
+    LATENCY_BUCKETS,
+    labels=[("endpoint", ENDPOINTS)],
+)
+RESPONSES = Counter(
+    "default_detection_responses_total",
+    "Responses by endpoint and status class.",
+    labels=[("endpoint", ENDPOINTS), ("status", STATUS_CLASSES)],
+)
+IN_FLIGHT_REQUESTS = Gauge(
+    "default_detection_in_flight_requests",
+    "Requests being handled.",
+)
+PREDICTION_STAGE_SECONDS = Histogram(
+    "default_detection_prediction_stage_seconds",
+    "Time spent in each stage of a /predictions request.",
+    LATENCY_BUCKETS,
+    labels=[("stage", PREDICTION_STAGES)],
+)
+PREDICTION_BATCH_SIZE = Histogram(
+    "default_detection_prediction_batch_size",
+    "UUIDs per /predictions request.",
+    BATCH_SIZE_BUCKETS,
+)
+SCORE_BATCH_SIZE = Histogram(
+    "default_detection_score_batch_size",
+    "Records per model call of the /score micro-batcher.",
+    BATCH_SIZE_BUCKETS,
+)
+MODEL_LOAD_SECONDS = Histogram(
+    "default_detection_model_load_seconds",
+    "Time to download and load a model.",
+    LOAD_BUCKETS,
+)
+DATA_LOAD_SECONDS = Histogram(
+    "default_detection_data_load_seconds",
+    "Time to load and index the data for a model.",
+    LOAD_BUCKETS,
+)
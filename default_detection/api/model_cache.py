@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from default_detection import AWS_CREDENTIALS, DATA_DIR, S3_BUCKET
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILES = ["model.pk", "model-metadata.json", "preprocessing.json"]
+OPTIONAL_MODEL_FILES = ["preprocessing.json"]
+
+
+class ModelCache(object):
+    """Local content-addressed cache of the model files in S3.
+
+    Objects are stored under their ETag, so a file is only downloaded when its ETag changed and a
+    current cache costs one HEAD request per file. Downloads run concurrently and are written to a
+    temporary file that is moved into place, so concurrent workers never see partial files. Objects
+    of earlier versions are deleted once the current version is in place.
+    """
+
+    def __init__(self, bucket=S3_BUCKET, prefix="model/", cache_dir=None, credentials=AWS_CREDENTIALS):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache_dir = cache_dir or os.path.join(DATA_DIR, "cache")
+        self.credentials = credentials
+        self._client = None
+
+    def fetch(self, target_dir, filenames=MODEL_FILES, optional=OPTIONAL_MODEL_FILES):
+        """Make the current version of the files available in the target directory.
+
+        Returns the paths of the files by name, optional files missing in S3 are left out.
+        """
+        os.makedirs(os.path.join(self.cache_dir, "objects"), exist_ok=True)
+        os.makedirs(target_dir, exist_ok=True)
+
+        with ThreadPoolExecutor(max_workers=len(filenames)) as executor:
+            object_paths = list(executor.map(lambda f: self._fetch_file(f, target_dir, f in optional), filenames))
+
+        self._remove_objects(keep=object_paths)
+        return {
+            filename: os.path.join(target_dir, filename)
+            for filename, object_path in zip(filenames, object_paths) if object_path is not None
+        }
+
+    def etag(self, filename):
+        """Return the ETag of a file in S3 with a single HEAD request."""
+        return self.client.head_object(Bucket=self.bucket, Key=self.prefix + filename)["ETag"].strip('"')
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client(
+                "s3",
+                aws_access_key_id=self.credentials["aws_access_key_id"],
+                aws_secret_access_key=self.credentials["aws_secret_access_key"]
+            )
+        return self._client
+
+    def _fetch_file(self, filename, target_dir, optional):
+        from botocore.exceptions import ClientError
+
+        key = self.prefix + filename
+        target_path = os.path.join(target_dir, filename)
+
+        try:
+            etag = self.etag(filename)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ("404", "NoSuchKey"):
+                raise
+            if not optional:
+                logger.error("The object s3://%s/%s does not exist.", self.bucket, key)
+                raise
+            # Do not leave a file of a previous model behind
+            if os.path.exists(target_path):
+                os.remove(target_path)
+            return None
+
+        object_path = os.path.join(self.cache_dir, "objects", re.sub('[^A-Za-z0-9_-]+', '', etag))
+        if os.path.exists(object_path):
+            logger.info("Using cached %s", filename)
+        else:
+            logger.info("Downloading %s...", filename)
+            self._download(key, etag, object_path)
+
+        _link(object_path, target_path)
+        return object_path
+
+    def _remove_objects(self, keep):
+        """Delete the cached objects of earlier versions, which no fetched file links to any more."""
+        objects_dir = os.path.join(self.cache_dir, "objects")
+        keep = {os.path.basename(path) for path in keep if path is not None}
+        for name in os.listdir(objects_dir):
+            # Temporary files are downloads in progress
+            if name in keep or name.startswith(".tmp-"):
+                continue
+            logger.info("Removing cached object %s", name)
+            try:
+                os.remove(os.path.join(objects_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def _download(self, key, etag, object_path):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(object_path), prefix=".tmp-")
+        os.close(fd)
+        try:
+            # A single GET pinned to the ETag, a changed object fails instead of mixing versions
+            response = self.client.get_object(Bucket=self.bucket, Key=key, IfMatch=etag)
+            with open(tmp_path, 'wb') as file:
+                shutil.copyfileobj(response["Body"], file, 1 << 20)
+
+            # The ETag of objects not uploaded in parts is the MD5 of their content
+            if re.fullmatch("[0-9a-f]{32}", etag) and _md5(tmp_path) != etag:
+                raise IOError(f"Checksum mismatch for s3://{self.bucket}/{key}")
+
+            os.replace(tmp_path, object_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def _link(source, target):
+    """Atomically replace the target with a hard link to the source, or a copy if links fail."""
+    if os.path.exists(target) and os.path.samefile(source, target):
+        return
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp-")
+    os.close(fd)
+    os.remove(tmp_path)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, target)
+
+
+def _md5(path):
+    digest = hashlib.md5()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,68 @@
+import json
+import logging
+import os
+import threading
+
+from default_detection import MODEL_DIR, MODEL_POLL_INTERVAL
+from default_detection.api import predictions
+from default_detection.api.model_cache import ModelCache
+from default_detection.api.predictor import Predictor
+
+logger = logging.getLogger(__name__)
+
+
+class ModelWatcher(object):
+    """Background thread polling for a new model and hot-swapping it in.
+
+    Polls the model metadata in the local model directory, or its ETag in the bucket, and when it
+    changed loads the new model off the request path and swaps it in if its id differs from the
+    active model.
+    """
+
+    def __init__(self, interval=MODEL_POLL_INTERVAL, model_dir=MODEL_DIR):
+        self.interval = interval
+        self.model_dir = model_dir
+        self._version = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start polling in a daemon thread."""
+        self._version = self._current_version()
+        self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def check(self):
+        """Swap in the model if its version changed, return whether a new model was activated."""
+        version = self._current_version()
+        if self._version is None:
+            # The first check only records the version of the model that is already active
+            self._version = version
+            return False
+        if version == self._version:
+            return False
+
+        classifier = Predictor()
+        self._version = version
+        if classifier.metadata["id"] == predictions.model_info()["id"]:
+            return False
+
+        predictions.swap_model(classifier)
+        return True
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as _:
+                logger.error("Failed to check for a new model", exc_info=True)
+
+    def _current_version(self):
+        if self.model_dir:
+            with open(os.path.join(self.model_dir, "model-metadata.json"), 'r') as metadata_file:
+                return json.load(metadata_file)["id"]
+        return ModelCache().etag("model-metadata.json")
@@ -1,69 +1,643 @@
+import datetime
 import logging
+import threading
+import time
 
 import numpy as np
 import pandas as pd
 
+from default_detection import (
+    INGESTION_LOG,
+    MATERIALIZE_REASON_CODES,
+    MATERIALIZE_SCORES,
+    REASON_CODES_CACHE_SIZE,
+    REASON_CODES_TOP_K,
+    SCORE_CHUNK_SIZE,
+)
+from default_detection.api import instrumentation
+from default_detection.api.ingestion import DeltaRows, IngestionLog
+from default_detection.api.batcher import MicroBatcher
 from default_detection.api.predictor import Predictor
-from default_detection.data import CSV_DATA, preprocessing
+from default_detection.api.reason_codes import NO_REASON, ReasonCodeCache, ReasonCodeTable
+from default_detection.data import CSV_DATA, CATEGORICAL_FEATURES, ENCODED_FEATURES, NUMERICAL_FEATURES, store
 
 logger = logging.getLogger(__name__)
-_default_classifier = None
-_data = pd.DataFrame()
+_serving = None
+_batcher = None
+# Held while records are ingested into the active model and while a new model replays them and is activated
+_swap_lock = threading.Lock()
+
+
+class _Serving(object):
+    """The active model together with the data prepared for it.
+
+    Requests take a single reference to the serving object, so replacing it swaps the model, data,
+    UUID index, feature matrix and scores at once while in-flight requests finish on the old one.
+
+    Ingested records are preprocessed with the fitted preprocessing of the model, scored once and
+    appended after the loaded rows as `delta`. Row positions beyond the loaded rows refer to the
+    delta. A record with a known UUID is appended as well and supersedes the previous row.
+
+    Reason codes of the loaded rows are kept in a table of the model once computed, those of
+    ingested rows and raw records in a bounded least recently used cache.
+    """
+
+    def __init__(self, classifier):
+        self.classifier = classifier
+        self.data = pd.DataFrame()
+        self.index = {}
+        self.uuids = np.empty(0, dtype=object)
+        self.features = np.empty((0, 0))
+        self.scores = None
+        self.reason_codes = ReasonCodeTable(classifier.metadata["id"], 0, REASON_CODES_TOP_K)
+        self.recent_reason_codes = ReasonCodeCache(REASON_CODES_CACHE_SIZE)
+        self.delta = DeltaRows(len(classifier.metadata["features"]))
+        self.superseded = None
+        self.ingested = []
+        self.ingestion_log = IngestionLog(INGESTION_LOG) if INGESTION_LOG else None
+        self.timings = dict(classifier.timings)
+        self.activated_at = None
+        self._ingest_lock = threading.RLock()
+        instrumentation.MODEL_LOAD_SECONDS.observe(sum(classifier.timings.values()))
+
+    def load_data(self):
+        """Load the data preprocessed for the model and build the lookup tables."""
+        start = time.perf_counter()
+        data, _ = store.load_preprocessed(CSV_DATA, self.classifier.preprocessor)
+        self.data = data.reset_index(drop=True)
+        self._build_index()
+        self.timings["data_load_seconds"] = time.perf_counter() - start
+        instrumentation.DATA_LOAD_SECONDS.observe(self.timings["data_load_seconds"])
+
+        if MATERIALIZE_SCORES:
+            self.materialize_scores()
+        if MATERIALIZE_REASON_CODES:
+            self.materialize_reason_codes()
+        self.catch_up()
+
+    def _build_index(self):
+        """Build the UUID to row position index and the model feature matrix."""
+        logger.info("Indexing data")
+        self.uuids = self.data["uuid"].to_numpy(dtype=object)
+        self.index = {uuid: position for position, uuid in enumerate(self.uuids)}
+        self.features = np.ascontiguousarray(
+            self.data[self.classifier.metadata["features"]].to_numpy(dtype=np.float64)
+        )
+        self.reason_codes = ReasonCodeTable(self.classifier.metadata["id"], len(self.features), REASON_CODES_TOP_K)
+
+    def materialize_scores(self, chunk_size=SCORE_CHUNK_SIZE):
+        """Score the complete data set once with the model and keep the result in memory."""
+        start = time.perf_counter()
+        model_id = self.classifier.metadata["id"]
+        logger.info(f"Materializing scores of {len(self.features)} rows for model {model_id}")
+
+        probabilities = np.empty(len(self.features), dtype=np.float64)
+        for chunk_start in range(0, len(self.features), chunk_size):
+            chunk_end = chunk_start + chunk_size
+            probabilities[chunk_start:chunk_end] = self.classifier.predict_features(
+                self.features[chunk_start:chunk_end]
+            )
+
+        probabilities = np.round(probabilities, 5)
+        self.scores = {
+            "id": model_id,
+            "pd": probabilities,
+            "default": (probabilities >= 0.5).astype(np.int8),
+        }
+        self.timings["materialize_seconds"] = time.perf_counter() - start
+
+    def materialize_reason_codes(self, chunk_size=SCORE_CHUNK_SIZE):
+        """Compute the reason codes of the complete data set once with the model and keep them in memory."""
+        start = time.perf_counter()
+        logger.info(f"Materializing reason codes of {len(self.features)} rows for model {self.reason_codes.id}")
+        for chunk_start in range(0, len(self.features), chunk_size):
+            positions = np.arange(chunk_start, min(chunk_start + chunk_size, len(self.features)))
+            self.reason_codes.fill(positions, *self._reason_codes_at(positions))
+        self.timings["materialize_reason_codes_seconds"] = time.perf_counter() - start
+
+    def explain(self, positions, top_k):
+        """Return the feature positions and contributions of the `top_k` reasons of the rows at the positions.
+
+        Loaded rows missing from the reason code table are computed in one batch and kept.
+        """
+        ingested = positions >= len(self.features)
+        if not ingested.any():
+            features, contributions = self.reason_codes.get(positions, self._reason_codes_at)
+            return features[:, :top_k], contributions[:, :top_k]
+
+        features = np.empty((len(positions), REASON_CODES_TOP_K), dtype=np.int32)
+        contributions = np.empty((len(positions), REASON_CODES_TOP_K), dtype=np.float32)
+        features[~ingested], contributions[~ingested] = self.reason_codes.get(
+            positions[~ingested], self._reason_codes_at
+        )
+        features[ingested], contributions[ingested] = self.explain_features(
+            self.delta.features[positions[ingested] - len(self.features)], REASON_CODES_TOP_K
+        )
+        return features[:, :top_k], contributions[:, :top_k]
+
+    def explain_features(self, matrix, top_k):
+        """Return the reason codes of the rows of a feature matrix, through the cache of recent rows."""
+        if not len(matrix):
+            return np.empty((0, top_k), dtype=np.int32), np.empty((0, top_k), dtype=np.float32)
+        features, contributions = self.recent_reason_codes.get(
+            matrix, lambda missing: self.classifier.reason_codes(missing, REASON_CODES_TOP_K)
+        )
+        return features[:, :top_k], contributions[:, :top_k]
+
+    def _reason_codes_at(self, positions):
+        return self.classifier.reason_codes(self.features[positions], REASON_CODES_TOP_K)
+
+    def lookup(self, ids):
+        """Return row positions of known UUIDs along with the UUIDs that are unknown."""
+        positions = []
+        unknown = []
+        for uuid in ids:
+            position = self.index.get(uuid)
+            if position is None:
+                unknown.append(uuid)
+            else:
+                positions.append(position)
+        return np.asarray(positions, dtype=np.int64), unknown
+
+    def predict(self, positions):
+        """Return rounded probabilities of default and default flags for the given row positions.
+
+        Ingested rows are served from the scores computed when they were ingested.
+        """
+        ingested = positions >= len(self.features)
+        if not ingested.any():
+            return self._predict_loaded(positions)
+
+        probabilities = np.empty(len(positions), dtype=np.float64)
+        defaults = np.empty(len(positions), dtype=np.int8)
+        loaded = ~ingested
+        probabilities[loaded], defaults[loaded] = self._predict_loaded(positions[loaded])
+
+        delta_positions = positions[ingested] - len(self.features)
+        probabilities[ingested] = self.delta.probabilities[delta_positions]
+        defaults[ingested] = self.delta.defaults[delta_positions]
+        return probabilities, defaults
+
+    def _predict_loaded(self, positions):
+        """Predict loaded rows, from the materialized scores of the model if any, otherwise live."""
+        if self.scores is None or self.scores["id"] != self.classifier.metadata["id"]:
+            probabilities = np.round(self.classifier.predict_features(self.features[positions]), 5)
+            return probabilities, np.where(probabilities < 0.5, 0, 1)
+
+        probabilities = np.empty(len(positions), dtype=np.float64)
+        defaults = np.empty(len(positions), dtype=np.int8)
+
+        materialized = positions < len(self.scores["pd"])
+        probabilities[materialized] = self.scores["pd"][positions[materialized]]
+        defaults[materialized] = self.scores["default"][positions[materialized]]
+
+        if not materialized.all():
+            live = positions[~materialized]
+            probabilities[~materialized] = np.round(self.classifier.predict_features(self.features[live]), 5)
+            defaults[~materialized] = np.where(probabilities[~materialized] < 0.5, 0, 1)
+
+        return probabilities, defaults
+
+    def uuids_at(self, positions):
+        """Return the UUIDs of the rows at the given positions."""
+        ingested = positions >= len(self.uuids)
+        if not ingested.any():
+            return self.uuids[positions]
+
+        uuids = np.empty(len(positions), dtype=object)
+        uuids[~ingested] = self.uuids[positions[~ingested]]
+        uuids[ingested] = self.delta.uuids[positions[ingested] - len(self.uuids)]
+        return uuids
+
+    def prediction_frame(self, positions):
+        probabilities, defaults = self.predict(positions)
+        return pd.DataFrame(
+            {
+                "uuid": self.uuids_at(positions),
+                "pd": probabilities,
+                "default": defaults,
+            },
+            index=positions,
+        )
+
+    def test_set_positions(self):
+        """Return row positions of records without a known target, superseded ones included.
+
+        Rows keep their positions and ingested rows are appended, so offsets into the result stay
+        valid across ingestions. Superseded rows are left out of the output with `current`.
+        """
+        missing_target = np.flatnonzero(self.data["default"].isnull().to_numpy())
+        size = self.delta.size
+        if not size:
+            return missing_target
+        return np.concatenate([missing_target, np.flatnonzero(self.delta.missing_target[:size]) + len(self.features)])
+
+    def current(self, positions):
+        """Return the positions of rows that are not superseded by an ingested record."""
+        ingested = positions >= len(self.features)
+        superseded = np.zeros(len(positions), dtype=bool)
+        if self.superseded is not None:
+            superseded[~ingested] = self.superseded[positions[~ingested]]
+        superseded[ingested] = self.delta.superseded[positions[ingested] - len(self.features)]
+        return positions[~superseded]
+
+    def ingest(self, records, matrix=None):
+        """Preprocess, score and append validated raw records, returning the number of updated UUIDs.
+
+        `matrix` holds the features of the records if they are already preprocessed. Nothing is
+        changed if preprocessing or scoring fails.
+        """
+        classifier = self.classifier
+        if matrix is None:
+            matrix = classifier.preprocessor.transform_matrix(_raw_columns(records), classifier.metadata["features"])
+        probabilities = np.round(classifier.predict_features(matrix), 5)
+        uuids = [record["uuid"] for record in records]
+        missing_target = [record.get("default") is None for record in records]
+
+        updated = 0
+        with self._ingest_lock:
+            start = len(self.features) + self.delta.append(
+                uuids, matrix, probabilities, np.where(probabilities < 0.5, 0, 1), missing_target
+            )
+            for position, uuid in enumerate(uuids, start):
+                previous = self.index.get(uuid)
+                if previous is not None:
+                    self._supersede(previous)
+                    updated += 1
+                self.index[uuid] = position
+        return updated
+
+    def catch_up(self):
+        """Ingest the records other processes appended to the ingestion log since the last call."""
+        if self.ingestion_log is None or not self.ingestion_log.has_new():
+            return
+
+        # Batches are applied in the order of the log, later records supersede earlier ones
+        ingested = 0
+        with self._ingest_lock:
+            for records in self.ingestion_log.read_new():
+                # A batch that cannot be applied is skipped rather than blocking the batches after it
+                try:
+                    self.ingest(records)
+                except Exception:
+                    logger.error(f"Skipping a batch of {len(records)} records of the ingestion log", exc_info=True)
+                    continue
+                ingested += len(records)
+        logger.info(f"Ingested {ingested} records from the ingestion log")
+
+    def _supersede(self, position):
+        if position >= len(self.features):
+            self.delta.superseded[position - len(self.features)] = True
+            return
+        if self.superseded is None:
+            self.superseded = np.zeros(len(self.features), dtype=bool)
+        self.superseded[position] = True
+
+    def warm_up(self, n_rows=100):
+        """Run the prediction paths once so the first requests do not pay for lazy initialization."""
+        start = time.perf_counter()
+        positions = np.arange(min(n_rows, len(self.features)))
+        self.predict(positions)
+        self.classifier.predict_features(self.features[positions[:1]])
+        self.timings["warm_up_seconds"] = time.perf_counter() - start
 
 
 def load_model():
     """Load the model if not already loaded."""
-    global _default_classifier
+    global _serving
 
-    if not _default_classifier:
-        _default_classifier = Predictor()
+    if not _serving:
+        _serving = _Serving(Predictor())
+        _serving.activated_at = datetime.datetime.now().isoformat()
 
 
 def load_data():
     """Load the data if not already loaded."""
-    global _data
+    load_model()
+
+    if _serving.data.empty:
+        _serving.load_data()
+    else:
+        _serving.catch_up()
+
+
+def materialize_scores(chunk_size=SCORE_CHUNK_SIZE):
+    """Score the complete data set once with the active model and keep the result in memory."""
+    load_data()
+    _serving.materialize_scores(chunk_size)
+
+
+def swap_model(classifier):
+    """Prepare the data and scores for a new model off the request path and activate it at once.
+
+    Requests that already started finish on the previous model.
+    """
+    global _serving
+
+    load_model()
+    previous = _serving
+    serving = _Serving(classifier)
+    if not previous.data.empty:
+        serving.load_data()
+        serving.warm_up()
+
+    # Records are not ingested into the previous model between the replay and the activation
+    with _swap_lock:
+        previous = _serving
+        if not previous.data.empty:
+            # Without a log the records ingested into this process are scored again with the new model
+            ingested = list(previous.ingested)
+            for records in ingested:
+                serving.ingest(records)
+            serving.ingested = ingested
+
+        serving.activated_at = datetime.datetime.now().isoformat()
+        _serving = serving
+    logger.info(f"Activated model {classifier.metadata['id']}, replacing {previous.classifier.metadata['id']}")
 
-    if _data.empty:
-        logger.info("Reading data")
-        raw_data = pd.read_csv(CSV_DATA, delimiter=";")
 
-        logger.info("Preprocessing data")
-        _data, _, _ = preprocessing.preprocess_dataset(raw_data)
+def set_num_threads(num_threads):
+    """Set the number of threads LightGBM predicts with in this process."""
+    load_model()
+    _serving.classifier.num_threads = num_threads
 
 
-def predict_default_probability(uuids):
-    """Predict probability of default for specified UUIDs."""
+def model_info():
+    """Return the version, load timings and activation time of the active model."""
     load_model()
+    serving = _serving
+    return {
+        "id": serving.classifier.metadata["id"],
+        "engine": serving.classifier.engine,
+        "features": len(serving.classifier.metadata["features"]),
+        "activated_at": serving.activated_at,
+        "materialized_scores": serving.scores is not None,
+        "materialized_reason_codes": serving.reason_codes.complete and len(serving.features) > 0,
+        "timings": serving.timings,
+    }
+
+
+def predict_default_probability(uuids, orient="records", stages=None):
+    """Predict probability of default for specified UUIDs.
+
+    Returns the predictions for known UUIDs and the list of UUIDs that are not in the data. The
+    predictions are a list of records or, with `orient="columns"`, a dict of columns. The lookup,
+    predict and serialize stages are timed with the stage timer of the request, which records them.
+    """
+    record_stages = stages is None
+    if record_stages:
+        stages = instrumentation.StageTimer(instrumentation.PREDICTION_STAGE_SECONDS)
+
+    known, probabilities, defaults, unknown = predict_uuids([i["uuid"] for i in uuids], stages)
+    response = build_response(known, probabilities, defaults, orient)
+    stages.lap("serialize")
+    if record_stages:
+        stages.record()
+    return response, unknown
+
+
+def predict_uuids(ids, stages):
+    """Return the known UUIDs with their probabilities of default and default flags, and the unknown UUIDs.
+
+    Both the JSON and the binary formats of /predictions look up and predict here, timing the lookup
+    and predict stages with the stage timer of the request.
+    """
     load_data()
+    serving = _serving
+    instrumentation.PREDICTION_BATCH_SIZE.observe(len(ids))
 
-    ids = [i["uuid"] for i in uuids]
-    to_predict = _data.query(f"uuid.isin({ids})").copy()
+    positions, unknown = serving.lookup(ids)
+    if unknown:
+        logger.warning(f"{len(unknown)} unknown UUIDs requested")
+    stages.lap("lookup")
 
-    logger.info(f"Predicting for {len(to_predict)} rows")
-    to_predict.loc[:, 'pd'] = np.round(_default_classifier.predict(to_predict), 5)
-    to_predict.loc[:, 'default'] = np.where(to_predict["pd"] < 0.5, 0, 1)
+    logger.info(f"Predicting for {len(positions)} rows")
+    probabilities, defaults = serving.predict(positions)
+    stages.lap("predict")
+    return serving.uuids_at(positions), probabilities, defaults, unknown
 
-    result = []
-    for i, row in to_predict.iterrows():
-        result.append(
-            {
-                "uuid": row.uuid,
-                "default": row.default,
-                "pd": row.pd
-            }
+
+def build_response(uuids, probabilities, defaults, orient="records"):
+    """Build a JSON serializable response from the uuid, pd and default columns."""
+    columns = {
+        "uuid": uuids.tolist(),
+        "pd": probabilities.tolist(),
+        "default": defaults.tolist(),
+    }
+    if orient == "columns":
+        return columns
+    if orient != "records":
+        raise ValueError(f"Unknown orient {orient!r}, expected 'records' or 'columns'")
+
+    return [
+        {"uuid": uuid, "default": default, "pd": probability}
+        for uuid, probability, default in zip(columns["uuid"], columns["pd"], columns["default"])
+    ]
+
+
+def explain_uuids(ids, top_k=REASON_CODES_TOP_K):
+    """Return the reason codes of known UUIDs with their probabilities of default, and the unknown UUIDs.
+
+    Each known UUID has a record with its `pd` and `reasons`, the `top_k` features that raise its
+    probability of default the most with their contributions in log-odds, largest first.
+    """
+    load_data()
+    serving = _serving
+    _validate_top_k(top_k)
+
+    positions, unknown = serving.lookup(ids)
+    if unknown:
+        logger.warning(f"{len(unknown)} unknown UUIDs requested")
+
+    probabilities, _ = serving.predict(positions)
+    features, contributions = serving.explain(positions, top_k)
+    return _reason_code_records(serving, serving.uuids_at(positions), probabilities, features, contributions), unknown
+
+
+def explain_raw_records(records, top_k=REASON_CODES_TOP_K):
+    """Return the reason codes of new records given as dicts of raw features with their probabilities of default."""
+    load_model()
+    serving = _serving
+    classifier = serving.classifier
+
+    if classifier.preprocessor is None:
+        raise ValueError("The active model has no fitted preprocessing to explain raw records")
+    columns = _validate_records(records)
+    _validate_top_k(top_k)
+
+    matrix = classifier.preprocessor.transform_matrix(columns, classifier.metadata["features"])
+    probabilities = np.round(classifier.predict_features(matrix), 5)
+    features, contributions = serving.explain_features(matrix, top_k)
+    uuids = np.array([record.get("uuid") for record in records], dtype=object)
+    return _reason_code_records(serving, uuids, probabilities, features, contributions)
+
+
+def _validate_top_k(top_k):
+    if not 1 <= top_k <= REASON_CODES_TOP_K:
+        raise ValueError(f"top_k must be between 1 and {REASON_CODES_TOP_K}")
+
+
+def _reason_code_records(serving, uuids, probabilities, features, contributions):
+    names = serving.classifier.metadata["features"]
+    contributions = np.round(contributions.astype(np.float64), 5).tolist()
+    return [
+        {
+            "uuid": uuid,
+            "pd": probability,
+            "reasons": [
+                {"feature": names[feature], "contribution": contribution}
+                for feature, contribution in zip(row_features, row_contributions)
+                if feature != NO_REASON
+            ],
+        }
+        for uuid, probability, row_features, row_contributions in zip(
+            uuids.tolist(), probabilities.tolist(), features.tolist(), contributions
         )
-    return result
+    ]
 
 
 def predict_test_set_default_probability():
     """Predict probability of default for the whole test set."""
+    load_data()
+    serving = _serving
+
+    positions = serving.current(serving.test_set_positions())
+
+    logger.info(f"Predicting test set, {len(positions)} rows")
+    return serving.prediction_frame(positions)
+
+
+def iter_test_set_default_probability(cursor=0, limit=None, chunk_size=SCORE_CHUNK_SIZE):
+    """Predict probability of default for a page of the test set in chunks.
+
+    The page starts at test set row `cursor` and holds at most `limit` rows. Returns the cursor of
+    the next page, None for the last page, and a generator yielding data frames of at most
+    `chunk_size` predictions. Cursors count rows superseded by ingested records, which are left
+    out of the page, so they stay valid while records are ingested.
+    """
+    load_data()
+    serving = _serving
+
+    positions = serving.test_set_positions()
+    end = len(positions) if limit is None else min(cursor + limit, len(positions))
+    next_cursor = end if end < len(positions) else None
+
+    logger.info(f"Streaming test set rows {cursor} to {end}")
+    return next_cursor, _iter_predictions(serving, positions[cursor:end], chunk_size)
+
+
+def _iter_predictions(serving, positions, chunk_size):
+    for start in range(0, len(positions), chunk_size):
+        yield serving.prediction_frame(serving.current(positions[start:start + chunk_size]))
+
+
+def predict_raw_default_probability(records):
+    """Predict probability of default for new records given as dicts of raw features.
+
+    Records of concurrent calls are combined into a single model call by the micro-batcher.
+    """
     load_model()
+
+    if _serving.classifier.preprocessor is None:
+        raise ValueError("The active model has no fitted preprocessing to score raw records")
+    # Validated per request, so one bad record fails only its own request and not the batch it joins
+    _validate_records(records)
+
+    logger.info(f"Scoring {len(records)} raw records")
+    probabilities = _get_batcher().score(records)
+    defaults = np.where(probabilities < 0.5, 0, 1)
+
+    return [
+        {"uuid": record.get("uuid"), "default": default, "pd": probability}
+        for record, probability, default in zip(records, probabilities.tolist(), defaults.tolist())
+    ]
+
+
+def ingest_records(records):
+    """Add new records or replace records with known UUIDs, given as dicts of raw features with a `uuid`.
+
+    The records are preprocessed with the fitted preprocessing of the model and scored once, without
+    touching the loaded data. With an ingestion log they are appended to it and reach every server
+    process, otherwise they live in this process until it exits. Returns the numbers of ingested and
+    updated records and of the rows served afterwards.
+    """
     load_data()
 
-    to_predict = _data[_data.default.isnull()].copy()
+    # A model swap either replays the records or waits until they are ingested into the new model
+    with _swap_lock:
+        serving = _serving
+
+        if serving.classifier.preprocessor is None:
+            raise ValueError("The active model has no fitted preprocessing to ingest raw records")
+        columns = _validate_records(records)
+        if not all(isinstance(record.get("uuid"), str) for record in records):
+            raise ValueError("Every record needs a uuid string")
+
+        # Preprocessed before they are logged, so a batch in the log never fails to apply
+        matrix = serving.classifier.preprocessor.transform_matrix(columns, serving.classifier.metadata["features"])
+
+        logger.info(f"Ingesting {len(records)} records")
+        if serving.ingestion_log is not None:
+            updated = sum(record["uuid"] in serving.index for record in records)
+            serving.ingestion_log.append(records)
+            serving.catch_up()
+        else:
+            updated = serving.ingest(records, matrix)
+            serving.ingested.append(records)
+
+    return {
+        "ingested": len(records),
+        "updated": updated,
+        "rows": len(serving.index),
+    }
+
+
+def batcher_stats():
+    """Return the batch size and queue wait statistics of the micro-batcher."""
+    return _get_batcher().stats()
+
+
+def _get_batcher():
+    global _batcher
+
+    if _batcher is None:
+        _batcher = MicroBatcher(_score_records)
+    return _batcher
+
+
+def _validate_records(records):
+    """Return the raw feature columns of the records, raising ValueError for any record that cannot be scored."""
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        raise ValueError("records must be a list of objects")
+    for record in records:
+        if record.get("has_paid") not in (True, False, 0, 1):
+            raise ValueError("has_paid must be a boolean")
+    return _raw_columns(records)
+
+
+def _score_records(records):
+    """Preprocess raw records with the fitted preprocessing and score them in one model call."""
+    instrumentation.SCORE_BATCH_SIZE.observe(len(records))
+    classifier = _serving.classifier
+    matrix = classifier.preprocessor.transform_matrix(_raw_columns(records), classifier.metadata["features"])
+    return np.round(classifier.predict_features(matrix), 5)
 
-    logger.info(f"Predicting test set, {len(to_predict)} rows")
-    to_predict.loc[:, 'pd'] = np.round(_default_classifier.predict(to_predict), 5)
-    to_predict.loc[:, 'default'] = np.where(to_predict["pd"] < 0.5, 0, 1)
 
-    return to_predict[["uuid", "pd", "default"]]
+def _raw_columns(records):
+    """Return the raw feature columns of records given as dicts, raising ValueError for values of the wrong type."""
+    columns = {}
+    for column in NUMERICAL_FEATURES + CATEGORICAL_FEATURES:
+        values = [record.get(column) for record in records]
+        if column in ENCODED_FEATURES:
+            # Categories are looked up in a dict, so they have to be hashable
+            if not all(value is None or isinstance(value, (str, int, float)) for value in values):
+                raise ValueError(f"{column} must be a string")
+            columns[column] = np.array(values, dtype=object)
+        elif column == "has_paid":
+            columns[column] = np.array(values, dtype=bool)
+        else:
+            try:
+                columns[column] = np.array(values, dtype=np.float64)
+            except (TypeError, ValueError):
+                raise ValueError(f"{column} must be a number") from None
+    return columns
@@ -0,0 +1,100 @@
+import collections
+import threading
+
+import numpy as np
+
+
+# Feature position of the slots of a row with fewer positive contributions than reason codes
+NO_REASON = -1
+
+
+def top_contributions(contributions, top_k):
+    """Return the positions and values of the `top_k` largest positive contributions of every row, largest first.
+
+    Contributions that do not raise the score are no reasons, their slots are padded with the
+    position `NO_REASON` and a contribution of 0.
+    """
+    top_k = min(top_k, contributions.shape[1])
+    if top_k < contributions.shape[1]:
+        candidates = np.argpartition(-contributions, top_k - 1, axis=1)[:, :top_k]
+    else:
+        candidates = np.broadcast_to(np.arange(top_k), (len(contributions), top_k))
+    values = np.take_along_axis(contributions, candidates, axis=1)
+    order = np.argsort(-values, axis=1, kind="stable")
+    features = np.take_along_axis(candidates, order, axis=1)
+    values = np.take_along_axis(values, order, axis=1)
+
+    positive = values > 0
+    return np.where(positive, features, NO_REASON), np.where(positive, values, 0.0)
+
+
+class ReasonCodeTable(object):
+    """Reason codes of the loaded rows for one model, computed in batches on first use and kept.
+
+    Holds the feature positions and contributions of the `top_k` largest positive contributions of
+    every row, padded with `NO_REASON`.
+    Rows are written before they are marked as computed, so concurrent readers never see partial
+    rows and at worst compute a row twice. Once computed, a lookup is an indexing of arrays, like the
+    materialized scores.
+    """
+
+    def __init__(self, model_id, n_rows, top_k):
+        self.id = model_id
+        self.top_k = top_k
+        self.features = np.zeros((n_rows, top_k), dtype=np.int32)
+        self.contributions = np.zeros((n_rows, top_k), dtype=np.float32)
+        self.computed = np.zeros(n_rows, dtype=bool)
+
+    @property
+    def complete(self):
+        return bool(self.computed.all())
+
+    def get(self, positions, compute):
+        """Return the reason codes of the rows, computing missing rows in one call of `compute(positions)`."""
+        missing = np.unique(positions[~self.computed[positions]])
+        if len(missing):
+            self.fill(missing, *compute(missing))
+        return self.features[positions], self.contributions[positions]
+
+    def fill(self, positions, features, contributions):
+        self.features[positions] = features
+        self.contributions[positions] = contributions
+        self.computed[positions] = True
+
+
+class ReasonCodeCache(object):
+    """Least recently used reason codes of rows that are not loaded, keyed by their feature values.
+
+    Serves rows ingested after loading and raw records, so the same record asked for again is not
+    explained again. Holds at most `size` rows.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, matrix, compute):
+        """Return the reason codes of the non-empty feature matrix, computing missing rows in one call.
+
+        `compute(matrix)` returns the feature positions and contributions of the reasons of every row.
+        """
+        keys = [row.tobytes() for row in matrix]
+        with self._lock:
+            entries = [self._entries.get(key) for key in keys]
+            for key, entry in zip(keys, entries):
+                if entry is not None:
+                    self._entries.move_to_end(key)
+
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        if missing:
+            features, contributions = compute(matrix[missing])
+            with self._lock:
+                for i, row_features, row_contributions in zip(missing, features, contributions):
+                    entries[i] = self._entries[keys[i]] = (row_features, row_contributions)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        return np.stack([entry[0] for entry in entries]), np.stack([entry[1] for entry in entries])
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,240 @@
+import gc
+import logging
+import os
+import random
+import shutil
+import signal
+import socket
+import tempfile
+import time
+
+from werkzeug.serving import make_server
+
+from default_detection import (
+    METRICS_DIR,
+    MODEL_POLL_INTERVAL,
+    SERVER_CPU_AFFINITY,
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_WORKERS,
+    WORKER_GRACEFUL_TIMEOUT,
+    WORKER_MAX_REQUESTS,
+)
+from default_detection.api import app, instrumentation, predictions
+from default_detection.api.model_watcher import ModelWatcher
+
+logger = logging.getLogger(__name__)
+
+
+class PreforkServer(object):
+    """Production server loading the model and data once and forking workers that share them.
+
+    The master process loads the data and model, binds the socket and forks the workers, which
+    inherit the loaded objects copy-on-write and accept connections on the shared socket. Each
+    worker is pinned to its own CPUs and predicts with as many LightGBM threads as it has CPUs, so
+    workers do not oversubscribe cores.
+
+    Workers are recycled gracefully: a worker that served `max_requests` requests, or that receives
+    SIGTERM, finishes its current request and exits and the master forks a replacement. SIGHUP
+    recycles all workers one by one, as does a new model found by polling every `poll_interval`
+    seconds, so new workers fork from the master with the new model. SIGTERM or SIGINT stop the
+    server, workers still busy after `graceful_timeout` seconds are killed.
+
+    All processes write their metrics to files in `metrics_dir`, a temporary directory by default,
+    so /metrics served by any worker reports the whole server.
+
+    LightGBM must run single threaded in the master, OpenMP thread pools do not survive a fork and
+    workers hang in their first prediction otherwise. `serve.py` sets `OMP_NUM_THREADS=1` before
+    LightGBM is imported.
+    """
+
+    def __init__(self, application=app, host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS,
+                 max_requests=WORKER_MAX_REQUESTS, graceful_timeout=WORKER_GRACEFUL_TIMEOUT,
+                 cpu_affinity=SERVER_CPU_AFFINITY, poll_interval=MODEL_POLL_INTERVAL, metrics_dir=METRICS_DIR):
+        self.application = application
+        self.host = host
+        self.port = port
+        self.cpus = _available_cpus()
+        self.workers = workers or len(self.cpus)
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.cpu_affinity = cpu_affinity
+        self.poll_interval = poll_interval
+        self.metrics_dir = metrics_dir
+        self.threads = max(1, len(self.cpus) // self.workers)
+        self.socket = None
+        self._workers = {}
+        self._retiring = set()
+        self._stopping = False
+        self._reload = False
+        self._requests = 0
+
+    def serve(self):
+        """Load the model and data, fork the workers and supervise them until stopped."""
+        metrics_dir = self.metrics_dir or tempfile.mkdtemp(prefix="metrics-")
+        instrumentation.REGISTRY.use_directory(metrics_dir)
+
+        predictions.load_data()
+        predictions.load_model()
+
+        self.socket = self._bind()
+        logger.info(f"Listening on http://{self.host}:{self.socket.getsockname()[1]} with {self.workers} workers, "
+                    f"{self.threads} LightGBM threads each")
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+
+        watcher = ModelWatcher(interval=self.poll_interval) if self.poll_interval > 0 else None
+        next_poll = time.monotonic()
+
+        # Keep the garbage collector of the workers from writing to the shared objects
+        gc.freeze()
+        for number in range(self.workers):
+            self._spawn(number)
+
+        try:
+            while not self._stopping:
+                self._reap()
+
+                if self._reload:
+                    self._reload = False
+                    self.recycle()
+
+                if watcher is not None and time.monotonic() >= next_poll:
+                    next_poll = time.monotonic() + self.poll_interval
+                    try:
+                        if watcher.check():
+                            gc.freeze()
+                            self.recycle()
+                    except Exception as _:
+                        logger.error("Failed to check for a new model", exc_info=True)
+
+                time.sleep(0.1)
+        finally:
+            self._shutdown()
+            if not self.metrics_dir:
+                shutil.rmtree(metrics_dir, ignore_errors=True)
+
+    def recycle(self):
+        """Replace all workers one by one, each old worker finishes its current request first."""
+        logger.info("Recycling workers")
+        for pid, number in list(self._workers.items()):
+            if pid in self._retiring:
+                continue
+            self._spawn(number)
+            self._retire(pid)
+
+    def _bind(self):
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(128)
+        # All workers wait for the same socket, those that lose the race for a connection move on
+        sock.setblocking(False)
+        return sock
+
+    def _spawn(self, number):
+        pid = os.fork()
+        if pid:
+            self._workers[pid] = number
+            return pid
+
+        exit_code = 0
+        try:
+            self._work(number)
+        except Exception as _:
+            logger.error("Worker %s failed", number, exc_info=True)
+            exit_code = 1
+        finally:
+            # Never return into the master code
+            os._exit(exit_code)
+
+    def _work(self, number):
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        self._workers = {}
+        self._retiring = set()
+
+        pinned = self.cpu_affinity and self.workers * self.threads <= len(self.cpus)
+        if pinned and hasattr(os, "sched_setaffinity"):
+            cpus = self.cpus[number * self.threads:(number + 1) * self.threads]
+            os.sched_setaffinity(0, cpus)
+        predictions.set_num_threads(self.threads)
+
+        # Spread recycling of the workers over time
+        max_requests = self.max_requests + random.randint(0, self.max_requests // 10) if self.max_requests else 0
+
+        server = make_server(self.host, self.port, self._count_requests, fd=self.socket.fileno())
+        server.timeout = 1
+        logger.info(f"Worker {number} started with pid {os.getpid()}")
+
+        while not self._stopping and not (max_requests and self._requests >= max_requests):
+            server.handle_request()
+
+        logger.info(f"Worker {number} exiting after {self._requests} requests")
+
+    def _count_requests(self, environ, start_response):
+        self._requests += 1
+        return self.application(environ, start_response)
+
+    def _retire(self, pid):
+        self._retiring.add(pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def _reap(self):
+        """Collect exited workers and replace those that were not retired."""
+        while self._workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if not pid:
+                return
+
+            number = self._workers.pop(pid, None)
+            instrumentation.REGISTRY.mark_dead(pid)
+            if pid in self._retiring:
+                self._retiring.discard(pid)
+                continue
+            if number is None:
+                continue
+
+            if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+                logger.info(f"Worker {number} recycled")
+            else:
+                logger.error(f"Worker {number} with pid {pid} died with status {status}")
+            if not self._stopping:
+                self._spawn(number)
+
+    def _shutdown(self):
+        logger.info("Stopping workers")
+        for pid in list(self._workers):
+            self._retire(pid)
+
+        deadline = time.monotonic() + self.graceful_timeout
+        while self._workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+
+        for pid in list(self._workers):
+            logger.warning(f"Killing worker with pid {pid}")
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            instrumentation.REGISTRY.mark_dead(pid)
+        self._workers = {}
+        self.socket.close()
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _handle_reload(self, signum, frame):
+        self._reload = True
+
+
+def _available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
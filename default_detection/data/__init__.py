@@ -5,6 +5,14 @@ CSV_DATA = os.getenv("CSV_DATA", None)
 if not CSV_DATA:
     CSV_DATA = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "dataset.csv"))
 
+# Cache of preprocessed data sets
+DATA_STORE_DIR = os.getenv("DATA_STORE_DIR", None)
+if not DATA_STORE_DIR:
+    DATA_STORE_DIR = os.path.join(os.path.dirname(CSV_DATA), "store")
+
+# Memory budget in MB to preprocess the CSV into the store in chunks within, 0 to read it at once
+PREPROCESSING_MEMORY_MB = int(os.getenv("PREPROCESSING_MEMORY_MB", 0))
+
 NUMERICAL_FEATURES = [
     "account_amount_added_12_24m",
     "account_days_in_dc_12_24m",
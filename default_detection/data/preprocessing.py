@@ -1,57 +1,194 @@
+import json
 import re
 
-import category_encoders as ce
+import numpy as np
 import pandas as pd
 
 from default_detection.data import ENCODED_FEATURES, NUMERICAL_FEATURES, BINNED_FEATURES
 
+# Features where nulls are imputed with 0
+IMPUTED_FEATURES = [
+    "account_status",
+    "account_worst_status_12_24m",
+    "account_worst_status_6_12m",
+    "account_worst_status_3_6m",
+    "account_worst_status_0_3m"
+]
+
 
 def preprocess_dataset(data):
     """Apply data preprocessing such as imputation and one-hot-encoding"""
-    df = data.copy()
+    preprocessor = Preprocessor()
+    df = preprocessor.fit_transform(data)
+    return df, preprocessor.features, preprocessor.categorical_features
+
+
+class Preprocessor(object):
+    """Preprocessing fitted once on a data set and applied to any number of records afterwards.
+
+    Stores the decile bin edges of the binned features, the category vocabularies of the one-hot
+    encoded features and the renamed output column names, so that training and serving produce
+    the same features and new records can be preprocessed without refitting.
+    """
+
+    def __init__(self, bin_edges=None, categories=None, columns=None, features=None, categorical_features=None):
+        self.bin_edges = bin_edges
+        self.categories = categories
+        self.columns = columns
+        self.features = features
+        self.categorical_features = categorical_features
+        self._code_maps = {}
+
+    def fit(self, data):
+        """Fit bin edges and category vocabularies on the data."""
+        return self.fit_chunks([data])
+
+    def fit_chunks(self, chunks, columns=None):
+        """Fit on the data read as an iterable of data frames, as if on their concatenation.
+
+        Only the values of the binned features are kept for all rows, for their exact deciles.
+        `columns` are the raw columns of the data, by default those of the chunks, so chunks may be
+        read with only the binned and encoded features.
+        """
+        binned = {column: [] for column in BINNED_FEATURES}
+        uniques = {column: [] for column in ENCODED_FEATURES}
+        for chunk in chunks:
+            if columns is None:
+                columns = list(chunk.columns)
+            for column in BINNED_FEATURES:
+                binned[column].append(chunk[column].to_numpy(dtype=np.float64))
+            for column in ENCODED_FEATURES:
+                uniques[column].append(pd.unique(chunk[column].dropna()))
+
+        self.bin_edges = {}
+        for column, values in binned.items():
+            _, bins = pd.qcut(np.concatenate(values), q=10, labels=False, retbins=True, duplicates="drop")
+            self.bin_edges[column] = bins.tolist()
+
+        # Categories in order of their first appearance in the data
+        self.categories = {column: pd.unique(np.concatenate(values)).tolist() for column, values in uniques.items()}
+        self._code_maps = {}
+
+        names = []
+        for column in columns:
+            if column in self.categories:
+                names.extend(self._encoded_names(column))
+            else:
+                names.append(column)
+        names.extend(f"{column}_bin" for column in BINNED_FEATURES)
+        self.columns = [_rename(name) for name in names]
+
+        new_features = [_rename(f"{column}_bin") for column in BINNED_FEATURES]
+        self.features = [c for c in self.columns if c not in {"uuid", "default"}]
+        self.categorical_features = [
+            c for c in self.features if c not in set(NUMERICAL_FEATURES + new_features)
+        ]
+        return self
+
+    def transform(self, data):
+        """Preprocess a data frame of raw records."""
+        return pd.DataFrame(self.transform_columns(data), index=data.index)
+
+    def transform_columns(self, data):
+        """Preprocess a data frame of raw records into a dict of output columns in their order.
+
+        Indicators are uint8 and bins float32, other columns keep the arrays of the data where possible.
+        """
+        columns = self._transform_columns({c: data[c].to_numpy() for c in data.columns}, len(data))
+        return {c: columns[c] for c in self.columns if c in columns}
+
+    def transform_matrix(self, columns, features):
+        """Preprocess raw columns, a dict of equally long arrays, into a matrix ordered by features."""
+        n_rows = len(next(iter(columns.values()))) if columns else 0
+        transformed = self._transform_columns(columns, n_rows)
+        matrix = np.empty((n_rows, len(features)), dtype=np.float64)
+        for i, feature in enumerate(features):
+            matrix[:, i] = transformed[feature]
+        return matrix
+
+    def fit_transform(self, data):
+        return self.fit(data).transform(data)
+
+    def config(self):
+        """Return the fitted state as a JSON serializable dict."""
+        return {
+            "bin_edges": self.bin_edges,
+            "categories": self.categories,
+            "columns": self.columns,
+            "features": self.features,
+            "categorical_features": self.categorical_features,
+        }
+
+    def save(self, path):
+        """Save the fitted preprocessing as JSON."""
+        with open(path, 'w') as preprocessing_file:
+            json.dump(self.config(), preprocessing_file)
+
+    @classmethod
+    def load(cls, path):
+        """Load fitted preprocessing saved with `save`."""
+        with open(path, 'r') as preprocessing_file:
+            return cls(**json.load(preprocessing_file))
 
-    # Convert to int
-    df["has_paid"] = df["has_paid"].astype(int)
+    def _transform_columns(self, columns, n_rows):
+        transformed = {}
+        for column, values in columns.items():
+            if column in self.categories:
+                _, _, names = self._code_map(column)
+                for name, indicator in zip(names, self._one_hot(column, values)):
+                    transformed[name] = indicator
+            elif column == "has_paid":
+                transformed[column] = np.asarray(values).astype(int)
+            elif column in IMPUTED_FEATURES:
+                transformed[column] = np.where(pd.isnull(values), 0, values).astype(np.float64)
+            else:
+                transformed[column] = values
 
-    # Bin numerical features
-    df, new_features = _bin_features(df)
+        for column in BINNED_FEATURES:
+            transformed[f"{column}_bin"] = self._bin(column, columns[column])
 
-    # Encode data
-    encoder = ce.one_hot.OneHotEncoder(
-        cols=ENCODED_FEATURES,
-        use_cat_names=True,
-        handle_unknown="indicator",
-        handle_missing="indicator"
-    )
-    df = encoder.fit_transform(df)
+        return transformed
 
-    # Rename invalid column names
-    df = df.rename(columns=lambda x: re.sub('[^A-Za-z0-9_]+', '', x))
+    def _bin(self, column, values):
+        """Return the decile of each value, values outside the fitted range go to the outer bins."""
+        values = np.asarray(values, dtype=np.float64)
+        edges = np.asarray(self.bin_edges[column])
+        codes = np.searchsorted(edges[1:-1], values, side="left").astype(np.float32)
+        codes[np.isnan(values)] = np.nan
+        return codes
 
-    # Impute nulls
-    target_features = [
-        "account_status",
-        "account_worst_status_12_24m",
-        "account_worst_status_6_12m",
-        "account_worst_status_3_6m",
-        "account_worst_status_0_3m"
-    ]
-    df.loc[:, target_features] = df[target_features].fillna(0)
+    def _one_hot(self, column, values):
+        """Return indicator columns for each category, missing values and unknown categories."""
+        index, codes_by_category, names = self._code_map(column)
+        n_categories = len(codes_by_category)
 
-    features = list(set(df.columns.to_list()) - {"uuid", "default"})
-    categorical_features = list(set(features) - set(NUMERICAL_FEATURES + new_features))
-    return df, features, categorical_features
+        # Hashing through a dict is cheaper than building an indexer for a handful of records
+        if len(values) <= 1024:
+            codes = np.array([codes_by_category.get(v, -1) for v in values], dtype=np.int64)
+        else:
+            codes = index.get_indexer(values)
+        codes[codes == -1] = n_categories + 1
+        codes[pd.isnull(values)] = n_categories
 
+        indicators = np.zeros((n_categories + 2, len(codes)), dtype=np.uint8)
+        indicators[codes, np.arange(len(codes))] = 1
+        return indicators
 
-def _bin_features(df):
-    def _bin(column, df):
-        df[f"{column}_bin"], bins = pd.qcut(df[column], q=10, labels=False, retbins=True, duplicates="drop")
-        return df, f"{column}_bin"
+    def _code_map(self, column):
+        """Return the category index, category codes and renamed indicator columns of a feature."""
+        if column not in self._code_maps:
+            vocabulary = self.categories[column]
+            self._code_maps[column] = (
+                pd.Index(vocabulary),
+                {category: code for code, category in enumerate(vocabulary)},
+                [_rename(name) for name in self._encoded_names(column)],
+            )
+        return self._code_maps[column]
 
-    new_features = []
+    def _encoded_names(self, column):
+        return [f"{column}_{category}" for category in self.categories[column]] + [f"{column}_nan", f"{column}_-1"]
 
-    for f in BINNED_FEATURES:
-        df, new_f = _bin(f, df)
-        new_features.append(new_f)
 
-    return df, new_features
+def _rename(column):
+    """Remove characters that are invalid in feature names."""
+    return re.sub('[^A-Za-z0-9_]+', '', column)
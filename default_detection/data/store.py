@@ -0,0 +1,417 @@
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from default_detection.data import (
+    BINNED_FEATURES,
+    CATEGORICAL_FEATURES,
+    DATA_STORE_DIR,
+    ENCODED_FEATURES,
+    NUMERICAL_FEATURES,
+    PREPROCESSING_MEMORY_MB,
+    preprocessing,
+)
+
+logger = logging.getLogger(__name__)
+
+# Bump when the stored layout or the preprocessing code changes
+STORE_VERSION = 1
+
+INTEGER_DTYPES = [np.uint8, np.int8, np.int16, np.int32, np.int64]
+
+# Rows read to estimate the memory of a chunk of the CSV
+SAMPLE_ROWS = 1000
+
+# Memory of preprocessing a chunk as a multiple of the memory of its raw data frame
+CHUNK_MEMORY_FACTOR = 4
+
+# Memory in MB of the CSV parser and of reading in chunks whatever their size
+CHUNK_MEMORY_RESERVE_MB = 32
+
+# Fewest rows per chunk whatever the memory budget
+MIN_CHUNK_ROWS = 1000
+
+
+def load_preprocessed(csv_path, preprocessor=None, store_dir=DATA_STORE_DIR, telemetry=None,
+                      memory_mb=PREPROCESSING_MEMORY_MB):
+    """Return the preprocessed data set and its fitted preprocessing, reading the CSV only once.
+
+    The preprocessed data is cached as one memory-mapped file per column with compact dtypes and
+    strings such as UUIDs stored as categoricals, keyed by a hash of the CSV and the preprocessing.
+    Without a preprocessor the preprocessing is fitted on the data, otherwise the given fitted
+    preprocessing is applied. With a memory budget in MB the CSV is read in chunks instead, once to
+    fit and once to preprocess it, see `_save_chunked`. With a training telemetry, reading,
+    preprocessing and storing are timed as stages.
+    """
+    stage = telemetry.stage if telemetry is not None else lambda name: contextlib.nullcontext({})
+    directory = os.path.join(store_dir, _cache_key(csv_path, preprocessor))
+
+    if os.path.exists(os.path.join(directory, "columns.json")):
+        logger.info("Loading preprocessed data from %s", directory)
+        with stage("load_store"):
+            return _load(directory)
+
+    if memory_mb:
+        try:
+            _save_chunked(csv_path, preprocessor, directory, memory_mb, stage)
+        except OSError:
+            logger.warning("Failed to store preprocessed data in %s, preprocessing it at once", directory,
+                           exc_info=True)
+        else:
+            with stage("load_store"):
+                return _load(directory)
+
+    logger.info("Reading data")
+    with stage("read_csv") as record:
+        raw_data = pd.read_csv(csv_path, delimiter=";")
+        record["rows"] = len(raw_data)
+
+    logger.info("Preprocessing data")
+    with stage("preprocess"):
+        if preprocessor is None:
+            preprocessor = preprocessing.Preprocessor().fit(raw_data)
+        # Columns kept as they are share the arrays of the raw data, a data frame would copy them all
+        columns = preprocessor.transform_columns(raw_data)
+
+    try:
+        with stage("store"):
+            _save(columns, len(raw_data), preprocessor, directory)
+    except OSError:
+        logger.warning("Failed to store preprocessed data in %s", directory, exc_info=True)
+        return pd.DataFrame(columns, index=raw_data.index), preprocessor
+
+    # Return the memory-mapped data so the process does not hold a second copy
+    with stage("load_store"):
+        return _load(directory)
+
+
+def _cache_key(csv_path, preprocessor):
+    digest = hashlib.sha256()
+    with open(csv_path, 'rb') as csv_file:
+        for block in iter(lambda: csv_file.read(1 << 20), b""):
+            digest.update(block)
+
+    if preprocessor is None:
+        config = {
+            "numerical_features": NUMERICAL_FEATURES,
+            "categorical_features": CATEGORICAL_FEATURES,
+            "encoded_features": ENCODED_FEATURES,
+            "binned_features": BINNED_FEATURES,
+            "imputed_features": preprocessing.IMPUTED_FEATURES,
+        }
+    else:
+        config = preprocessor.config()
+    config["version"] = STORE_VERSION
+    digest.update(json.dumps(config, sort_keys=True).encode())
+
+    return digest.hexdigest()[:32]
+
+
+def _save(columns, n_rows, preprocessor, directory):
+    """Write the columns, a dict of arrays, to a temporary directory and move it into place in one step."""
+    with _replacing(directory) as tmp_dir:
+        layout = []
+        for i, (column, values) in enumerate(columns.items()):
+            filename = f"{i}.npy"
+            if not pd.api.types.is_numeric_dtype(values):
+                categorical = pd.Categorical(values)
+                np.save(os.path.join(tmp_dir, filename), categorical.codes)
+                np.save(os.path.join(tmp_dir, f"{i}.categories.npy"), categorical.categories.to_numpy(dtype=str))
+                layout.append({"name": column, "file": filename, "categorical": True})
+            else:
+                np.save(os.path.join(tmp_dir, filename), _compact(values))
+                layout.append({"name": column, "file": filename, "categorical": False})
+        _save_layout(tmp_dir, n_rows, layout, preprocessor)
+
+
+def _save_chunked(csv_path, preprocessor, directory, memory_mb, stage):
+    """Preprocess the CSV into the store in chunks sized to hold about `memory_mb` MB at a time.
+
+    The first pass fits the preprocessing unless given one, reading only the binned and encoded
+    features. The second preprocesses every chunk and appends its output columns to temporary
+    files, keeping what decides their compact dtypes, and the third writes each column out in its
+    dtype. Numbers are stored exactly as by `_save`, strings as categoricals with their categories in
+    order of appearance rather than sorted. Besides the chunks, fitting holds 8 bytes per row for
+    every binned feature and storing 8 bytes per row for every string column.
+    """
+    chunk_rows = _chunk_rows(csv_path, memory_mb)
+
+    def read_chunks(**kwargs):
+        return pd.read_csv(csv_path, delimiter=";", chunksize=chunk_rows, **kwargs)
+
+    if preprocessor is None:
+        logger.info("Fitting the preprocessing in chunks of %d rows", chunk_rows)
+        with stage("fit"):
+            header = list(pd.read_csv(csv_path, delimiter=";", nrows=0).columns)
+            preprocessor = preprocessing.Preprocessor().fit_chunks(
+                read_chunks(usecols=BINNED_FEATURES + ENCODED_FEATURES), columns=header
+            )
+
+    with _replacing(directory) as tmp_dir:
+        logger.info("Preprocessing data in chunks of %d rows", chunk_rows)
+        columns = {}
+        n_rows = 0
+        try:
+            with stage("preprocess") as record:
+                for chunk in read_chunks():
+                    for name, values in preprocessor.transform_columns(chunk).items():
+                        if name not in columns:
+                            columns[name] = _ChunkedColumn(os.path.join(tmp_dir, f"{len(columns)}.chunks"))
+                        columns[name].append(values)
+                    n_rows += len(chunk)
+                record.update({"rows": n_rows, "chunk_rows": chunk_rows})
+        finally:
+            for column in columns.values():
+                column.close()
+
+        with stage("store"):
+            layout = []
+            for i, (name, column) in enumerate(columns.items()):
+                layout.append(dict(name=name, **column.save(tmp_dir, f"{i}.npy", n_rows)))
+                os.remove(column.path)
+            _save_layout(tmp_dir, n_rows, layout, preprocessor)
+
+
+def _chunk_rows(csv_path, memory_mb):
+    """Return the rows per chunk to preprocess the CSV in about `memory_mb` MB, from a sample of its rows."""
+    with open(csv_path, 'rb') as csv_file:
+        sample = b"".join(itertools.islice(csv_file, SAMPLE_ROWS + 1))
+    sample_data = pd.read_csv(io.BytesIO(sample), delimiter=";")
+    if not len(sample_data):
+        return MIN_CHUNK_ROWS
+
+    # The binned features and the hashes of string columns are held for all rows
+    rows = os.path.getsize(csv_path) * len(sample_data) / len(sample)
+    strings = sum(not pd.api.types.is_numeric_dtype(sample_data[c]) for c in sample_data if c not in ENCODED_FEATURES)
+    held = rows * 8 * (len(BINNED_FEATURES) + strings)
+
+    row_bytes = sample_data.memory_usage(deep=True).sum() / len(sample_data)
+    available = (memory_mb - CHUNK_MEMORY_RESERVE_MB) * 2 ** 20 - held
+    chunk_rows = int(available / (CHUNK_MEMORY_FACTOR * row_bytes))
+    if chunk_rows < MIN_CHUNK_ROWS:
+        logger.warning("A memory budget of %d MB is too small for about %.0f rows, using chunks of %d rows",
+                       memory_mb, rows, MIN_CHUNK_ROWS)
+        return MIN_CHUNK_ROWS
+    return chunk_rows
+
+
+class _ChunkedColumn(object):
+    """An output column appended chunk by chunk to a temporary file and saved in one compact dtype."""
+
+    def __init__(self, path):
+        self.path = path
+        self.n_chunks = 0
+        self.categorical = None
+        self.dtype = _CompactDtype()
+        # Of string columns, the hashes and nulls of all rows and the longest string
+        self.hashes = []
+        self.nulls = []
+        self.max_length = 1
+        self._file = open(path, 'wb')
+
+    def append(self, values):
+        if self.categorical is None:
+            self.categorical = not pd.api.types.is_numeric_dtype(values)
+
+        if self.categorical:
+            nulls = pd.isnull(values)
+            self.hashes.append(pd.util.hash_array(np.asarray(values, dtype=object)))
+            self.nulls.append(nulls)
+            values = np.asarray(values).astype(str)
+            if not nulls.all():
+                self.max_length = max(self.max_length, int(np.char.str_len(values[~nulls]).max()))
+        else:
+            self.dtype.update(values)
+        np.save(self._file, values)
+        self.n_chunks += 1
+
+    def close(self):
+        self._file.close()
+
+    def save(self, directory, filename, n_rows):
+        """Write the column as a .npy file in the directory and return its layout."""
+        if not self.categorical:
+            dtype = self.dtype.result()
+            _save_npy(os.path.join(directory, filename), dtype, n_rows, self._chunks())
+            return {"file": filename, "categorical": False}
+
+        codes, first_rows = _codes_by_appearance(np.concatenate(self.hashes), np.concatenate(self.nulls))
+        self.hashes, self.nulls = [], []
+        _save_npy(os.path.join(directory, filename), codes.dtype, n_rows, [codes])
+
+        def categories():
+            offset = 0
+            for chunk in self._chunks():
+                yield chunk[first_rows[offset:offset + len(chunk)]]
+                offset += len(chunk)
+
+        categories_file = filename.replace(".npy", ".categories.npy")
+        _save_npy(os.path.join(directory, categories_file), f"U{self.max_length}", int(first_rows.sum()), categories())
+        return {"file": filename, "categorical": True}
+
+    def _chunks(self):
+        with open(self.path, 'rb') as chunks_file:
+            for _ in range(self.n_chunks):
+                yield np.load(chunks_file)
+
+
+def _codes_by_appearance(hashes, nulls):
+    """Return the categorical codes of string values by their hashes and which rows are first of their category.
+
+    Categories are numbered in order of appearance, nulls have code -1. Distinct strings of equal
+    64 bit hash would share a category, which is negligibly unlikely for any data set that fits on disk.
+    """
+    if not nulls.any():
+        ordered = np.sort(hashes)
+        if not np.any(ordered[1:] == ordered[:-1]):
+            # All distinct such as UUIDs, every row has a category of its own
+            return np.arange(len(hashes), dtype=_codes_dtype(len(hashes))), np.ones(len(hashes), dtype=bool)
+
+    valid_rows = np.flatnonzero(~nulls)
+    unique, first, inverse = np.unique(hashes[valid_rows], return_index=True, return_inverse=True)
+    order = np.empty(len(unique), dtype=np.int64)
+    order[np.argsort(first)] = np.arange(len(unique))
+
+    codes = np.full(len(hashes), -1, dtype=_codes_dtype(len(unique)))
+    codes[valid_rows] = order[inverse.ravel()]
+    first_rows = np.zeros(len(hashes), dtype=bool)
+    first_rows[valid_rows[first]] = True
+    return codes, first_rows
+
+
+def _codes_dtype(n_categories):
+    # The dtype pandas chooses for the codes of a categorical
+    for dtype in [np.int8, np.int16, np.int32]:
+        if n_categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _save_npy(path, dtype, n_rows, chunks):
+    """Write chunks of a column as one .npy file, without holding the column or mapping the file."""
+    dtype = np.dtype(dtype)
+    with open(path, 'wb') as npy_file:
+        np.lib.format.write_array_header_1_0(npy_file, {
+            "descr": np.lib.format.dtype_to_descr(dtype),
+            "fortran_order": False,
+            "shape": (n_rows,),
+        })
+        for chunk in chunks:
+            npy_file.write(np.ascontiguousarray(chunk, dtype=dtype).tobytes())
+
+
+def _save_layout(directory, n_rows, layout, preprocessor):
+    with open(os.path.join(directory, "columns.json"), 'w') as columns_file:
+        json.dump({"n_rows": n_rows, "columns": layout}, columns_file)
+    preprocessor.save(os.path.join(directory, "preprocessing.json"))
+
+
+@contextlib.contextmanager
+def _replacing(directory):
+    """Yield a temporary directory to write the store to, moved into place in one step when done."""
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+
+    try:
+        yield tmp_dir
+        os.rename(tmp_dir, directory)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        # Another process stored the same data first
+        if not os.path.exists(os.path.join(directory, "columns.json")):
+            raise
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def _load(directory):
+    with open(os.path.join(directory, "columns.json"), 'r') as columns_file:
+        layout = json.load(columns_file)
+
+    columns = {}
+    for column in layout["columns"]:
+        values = np.load(os.path.join(directory, column["file"]), mmap_mode="r")
+        if column["categorical"]:
+            categories = np.load(os.path.join(directory, column["file"].replace(".npy", ".categories.npy")))
+            values = pd.Categorical.from_codes(values, categories=categories.astype(object))
+        columns[column["name"]] = values
+
+    data = pd.DataFrame(columns, index=pd.RangeIndex(layout["n_rows"]))
+    preprocessor = preprocessing.Preprocessor.load(os.path.join(directory, "preprocessing.json"))
+    return data, preprocessor
+
+
+def _compact(values):
+    """Return the values in the smallest dtype that represents them exactly."""
+    return values.astype(_CompactDtype().update(values).result(), copy=False)
+
+
+class _CompactDtype(object):
+    """The smallest dtype that represents all values of a column exactly, updated chunk by chunk.
+
+    Integral columns take the smallest integer dtype of their range, other floating point columns
+    float32 if that is exact. Integral columns with nulls stay floating point so nulls remain missing
+    values for the model. Chunks of integers and floats combine to floats, like a whole column would.
+    """
+
+    def __init__(self):
+        self.dtype = None
+        self.nan = False
+        self.integral = True
+        self.float32 = True
+        self.low = None
+        self.high = None
+
+    def update(self, values):
+        self.dtype = values.dtype if self.dtype is None else np.result_type(self.dtype, values.dtype)
+        if values.dtype == bool or values.dtype.kind not in "iuf" or not len(values):
+            return self
+
+        if values.dtype.kind == "f":
+            nan = np.isnan(values)
+            valid = values[~nan] if nan.any() else values
+            self.nan = self.nan or bool(nan.any())
+            self.integral = self.integral and np.array_equal(valid, np.round(valid))
+            float32 = values.astype(np.float32)
+            self.float32 = self.float32 and np.array_equal(np.isnan(float32), nan) and np.array_equal(
+                float32[~nan], valid
+            )
+        else:
+            valid = values
+
+        if len(valid):
+            low, high = valid.min(), valid.max()
+            if values.dtype.kind in "iu" and (low < -2 ** 24 or high > 2 ** 24):
+                # Only integers up to 2 ** 24 are all exact in float32
+                self.float32 = self.float32 and np.array_equal(values.astype(np.float32), values)
+            self.low = low if self.low is None else min(self.low, low)
+            self.high = high if self.high is None else max(self.high, high)
+        return self
+
+    def result(self):
+        dtype = self.dtype
+        if dtype == bool or dtype.kind not in "iuf":
+            return dtype
+
+        if dtype.kind == "f" and (self.nan or not self.integral):
+            return np.dtype(np.float32) if self.float32 else dtype
+
+        if self.low is None:
+            return dtype
+
+        for integer_dtype in INTEGER_DTYPES:
+            info = np.iinfo(integer_dtype)
+            if info.min <= self.low and self.high <= info.max:
+                return np.dtype(integer_dtype)
+        return dtype
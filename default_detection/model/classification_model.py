@@ -13,11 +13,14 @@ logger = logging.getLogger(__name__)
 
 
 class ClassificationModel(object):
-    def __init__(self, data=None, features=None, categorical_features=None, target="default"):
+    def __init__(self, data=None, features=None, categorical_features=None, target="default", preprocessor=None,
+                 parent_dir=DATA_DIR):
         self.data = data
         self.features = features
         self.categorical_features = categorical_features
         self.target = target
+        self.preprocessor = preprocessor
+        self.parent_dir = parent_dir
         self.model = None
         self.datetime_str = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
         self.id = str(uuid.uuid4())[:8]
@@ -25,7 +28,7 @@ class ClassificationModel(object):
     @property
     def dir(self):
         """Directory where the model and metadata get stored."""
-        destination_dir = os.path.join(DATA_DIR, self.datetime_str + "-" + self.id)
+        destination_dir = os.path.join(self.parent_dir, self.datetime_str + "-" + self.id)
         if not os.path.exists(destination_dir):
             os.makedirs(destination_dir)
         return destination_dir
@@ -40,23 +43,31 @@ class ClassificationModel(object):
         """Path where the model metadata is stored."""
         return os.path.join(self.dir, "model-metadata.json")
 
-    def train(self, lgb_train, params):
+    @property
+    def preprocessing_path(self):
+        """Path where the fitted preprocessing is stored."""
+        return os.path.join(self.dir, "preprocessing.json")
+
+    def train(self, lgb_train, params, init_model=None):
+        """Train on the data set, continuing to boost from the initial model if given."""
         logger.info("Starting model training on complete data set...")
         self.model = lgb.train(
             params,
             lgb_train,
             feature_name=self.features,
             categorical_feature=self.categorical_features,
+            init_model=init_model,
             verbose_eval=False,
         )
         return self.model
 
-    def save_state(self, params, scores):
+    def save_state(self, params, scores, evaluation=None, telemetry=None, warm_start=None, feature_pruning=None):
         """Save the model and its corresponding metadata."""
         try:
             logger.info("Saving state to %s", self.dir)
             self._save_model()
-            self._save_metadata(params, scores)
+            self._save_preprocessing()
+            self._save_metadata(params, scores, evaluation, telemetry, warm_start, feature_pruning)
         except Exception as _:
             logger.error("Failed to save object.", exc_info=True)
             raise
@@ -66,13 +77,20 @@ class ClassificationModel(object):
         with open(self.estimator_path, 'wb') as model_file:
             dill.dump(self.model, model_file)
 
-    def _save_metadata(self, params, scores):
-        """Construct and save metadata."""
+    def _save_preprocessing(self):
+        """Save the fitted preprocessing next to the model."""
+        if self.preprocessor is not None:
+            self.preprocessor.save(self.preprocessing_path)
+
+    def _save_metadata(self, params, scores, evaluation=None, telemetry=None, warm_start=None, feature_pruning=None):
+        """Construct and save metadata, with telemetry, warm start and feature pruning of the training run if given."""
 
         evaluation_scores = {
             "f1_score": scores["f1"],
             "auc_score": scores["auc"],
         }
+        if evaluation is not None:
+            evaluation_scores["out_of_fold"] = evaluation
 
         metadata = {
             "id": self.id,
@@ -82,6 +100,12 @@ class ClassificationModel(object):
             "categorical_features": self.categorical_features,
             "target": self.target
         }
+        if telemetry is not None:
+            metadata["telemetry"] = telemetry
+        if warm_start is not None:
+            metadata["warm_start"] = warm_start
+        if feature_pruning is not None:
+            metadata["feature_pruning"] = feature_pruning
 
         with open(self.metadata_path, 'w') as model_meta_file:
             json.dump(metadata, model_meta_file)
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import lightgbm as lgb
+import numpy as np
+from sklearn.model_selection import StratifiedKFold
+
+from default_detection import DATA_DIR, RANDOM_STATE
+from default_detection.model.pruning import TrialPruned
+
+logger = logging.getLogger(__name__)
+
+
+class CVDatasets(object):
+    """Binned LightGBM datasets of the training data and of fixed stratified cross validation folds.
+
+    The datasets are built once, saved in LightGBM's binary format under a hash of the data, the
+    folds and the dataset parameters, and loaded from there by every trial of the hyper-search and
+    by the final training, so neither the fold splits nor the feature binning are repeated.
+    """
+
+    def __init__(self, features_matrix, label, features, categorical_features, nfold=3, seed=RANDOM_STATE,
+                 params=None, cache_dir=None):
+        self.features_matrix = np.ascontiguousarray(features_matrix, dtype=np.float64)
+        self.label = np.ascontiguousarray(label, dtype=np.float64)
+        self.features = features
+        self.categorical_features = categorical_features
+        self.nfold = nfold
+        self.seed = int(seed)
+        self.params = params or {"verbose": -1}
+        self.directory = os.path.join(cache_dir or os.path.join(DATA_DIR, "datasets"), self.key)
+        self._train = None
+        self._folds = None
+        # Rounds boosted by the last `cv`, including those after the best round
+        self.boosted_rounds = 0
+
+    @property
+    def key(self):
+        """Hash of everything the binned datasets depend on."""
+        digest = hashlib.sha256()
+        # Hash the contiguous buffers in place, tobytes() would copy the whole matrix
+        digest.update(self.features_matrix.data)
+        digest.update(self.label.data)
+        digest.update(json.dumps({
+            "features": self.features,
+            "categorical_features": self.categorical_features,
+            "nfold": self.nfold,
+            "seed": self.seed,
+            "params": self.params,
+            "lightgbm": lgb.__version__,
+        }, sort_keys=True).encode())
+        return digest.hexdigest()[:32]
+
+    @property
+    def train(self):
+        """Dataset of all training data."""
+        if self._train is None:
+            self.build()
+            self._train = self._load("train.bin")
+        return self._train
+
+    @property
+    def folds(self):
+        """List of (train, valid) datasets of the cross validation folds."""
+        if self._folds is None:
+            self.build()
+            self._folds = [
+                (self._load(f"fold-{i}-train.bin"), self._load(f"fold-{i}-valid.bin")) for i in range(self.nfold)
+            ]
+        return self._folds
+
+    def splits(self):
+        """Return the (train, valid) row indices of the folds."""
+        folds = StratifiedKFold(n_splits=self.nfold, shuffle=True, random_state=self.seed)
+        return list(folds.split(np.zeros(len(self.label)), self.label))
+
+    def build(self):
+        """Bin and save the datasets unless they are saved already."""
+        if os.path.exists(os.path.join(self.directory, "train.bin")):
+            return
+
+        logger.info(f"Building binned datasets in {self.directory}")
+        parent = os.path.dirname(self.directory)
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+
+        try:
+            train = lgb.Dataset(
+                self.features_matrix,
+                self.label,
+                feature_name=self.features,
+                categorical_feature=self.categorical_features,
+                params=self.params,
+                free_raw_data=False,
+            ).construct()
+            train.save_binary(os.path.join(tmp_dir, "train.bin"))
+
+            # Folds are binned with the bins of the training data, like the subsets `lgb.cv` creates.
+            # Actual subsets can not be loaded back from their binary files.
+            for i, (train_index, valid_index) in enumerate(self.splits()):
+                for name, index in [("train", train_index), ("valid", valid_index)]:
+                    lgb.Dataset(
+                        self.features_matrix[index],
+                        self.label[index],
+                        reference=train,
+                        feature_name=self.features,
+                        categorical_feature=self.categorical_features,
+                        params=self.params,
+                    ).construct().save_binary(os.path.join(tmp_dir, f"fold-{i}-{name}.bin"))
+
+            os.rename(tmp_dir, self.directory)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            # Another process saved the same datasets first
+            if not os.path.exists(os.path.join(self.directory, "train.bin")):
+                raise
+
+    def cv(self, params, num_boost_round=500, early_stopping_rounds=None, feval=None, pruner=None, history=()):
+        """Cross validate on the fixed folds like `lgb.cv` with stratified folds.
+
+        Boosts all folds one round at a time and stops once the mean of the first metric did not
+        improve for `early_stopping_rounds` rounds. Returns the `<metric>-mean` and `<metric>-stdv`
+        of every round up to the best one. With a pruner, the mean of the first metric is checked
+        against the history of earlier trials after each round and `TrialPruned` is raised with the
+        scores so far if the pruner stops the trial.
+        """
+        boosters = []
+        for train, valid in self.folds:
+            booster = lgb.Booster(params=params, train_set=train)
+            booster.add_valid(valid, "valid")
+            boosters.append(booster)
+
+        results = {}
+        best_score, best_round = None, 0
+        self.boosted_rounds = 0
+        for i in range(num_boost_round):
+            self.boosted_rounds = i + 1
+            evaluations = []
+            for booster in boosters:
+                booster.update()
+                evaluations.append(booster.eval_valid(feval))
+
+            for j, (_, metric, _, higher_better) in enumerate(evaluations[0]):
+                scores = [evaluation[j][2] for evaluation in evaluations]
+                results.setdefault(f"{metric}-mean", []).append(np.mean(scores))
+                results.setdefault(f"{metric}-stdv", []).append(np.std(scores))
+
+                # Early stopping on the first metric only
+                if j == 0:
+                    score = np.mean(scores) if higher_better else -np.mean(scores)
+                    if best_score is None or score > best_score:
+                        best_score, best_round = score, i
+
+            if early_stopping_rounds and i - best_round >= early_stopping_rounds:
+                break
+
+            first_metric = f"{evaluations[0][0][1]}-mean"
+            if pruner is not None and pruner.should_prune(i + 1, results[first_metric][-1], history):
+                raise TrialPruned(results, i + 1)
+
+        if early_stopping_rounds:
+            results = {name: values[:best_round + 1] for name, values in results.items()}
+        return results
+
+    def out_of_fold_predict(self, params, num_boost_round=100):
+        """Return predictions for every training row from the model trained on the other folds."""
+        predictions = np.empty(len(self.label), dtype=np.float64)
+        for (train, _), (_, valid_index) in zip(self.folds, self.splits()):
+            booster = lgb.train(
+                params,
+                train,
+                num_boost_round=num_boost_round,
+                feature_name=self.features,
+                categorical_feature=self.categorical_features,
+            )
+            predictions[valid_index] = booster.predict(self.features_matrix[valid_index])
+        return predictions
+
+    def _load(self, filename):
+        return lgb.Dataset(
+            os.path.join(self.directory, filename),
+            feature_name=self.features,
+            categorical_feature=self.categorical_features,
+            params=self.params,
+        ).construct()
@@ -0,0 +1,115 @@
+import logging
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from default_detection.model import metrics
+from default_detection.model.classification_model import ClassificationModel
+from default_detection.model.cv_datasets import CVDatasets
+
+logger = logging.getLogger(__name__)
+
+# Rows per prediction call the inference latency is measured at
+LATENCY_BATCH_SIZES = [1, 1000]
+
+# Prediction calls per latency measurement, the median is reported
+LATENCY_REPEATS = 20
+
+
+def rank_features(booster, features):
+    """Return the features by decreasing gain importance in the booster and how many it splits on."""
+    gain = booster.feature_importance(importance_type="gain")
+    order = np.argsort(-gain, kind="stable")
+    return [features[i] for i in order], int(np.count_nonzero(gain))
+
+
+def subset_sizes(n_features, n_used, fractions):
+    """Return the decreasing numbers of features to retrain on, fewer than all of them.
+
+    The features the model splits on come first, as dropping the others costs no accuracy, then
+    the given fractions of all features, at least one.
+    """
+    sizes = {n_used} | {max(1, math.ceil(fraction * n_features)) for fraction in fractions}
+    return sorted((size for size in sizes if 0 < size < n_features), reverse=True)
+
+
+def prune(datasets, params, model, evaluation, fractions, target="default"):
+    """Retrain the tuned model on ever fewer of its most important features and report every subset.
+
+    Features are ranked by their gain in the trained model. Every subset is evaluated out of fold
+    with the tuned parameters like the model, trained on all rows and saved with the fitted
+    preprocessing in `pruned/` of the model directory, from where it can be served in its place.
+    Returns the table of the model and the subsets by decreasing number of features: out of fold
+    AUC and F1, median prediction latency from a data frame of all features like `Predictor.predict`,
+    bytes of features per served row and size of the model.
+    """
+    ranked, n_used = rank_features(model.model, datasets.features)
+    frame = pd.DataFrame(datasets.features_matrix[:max(LATENCY_BATCH_SIZES)], columns=datasets.features)
+    report = [_subset_report(model.model, datasets.features, frame, evaluation, model_dir=None)]
+
+    for size in subset_sizes(len(datasets.features), n_used, fractions):
+        start = time.perf_counter()
+        # Keep the order of the features in the data set
+        subset = [feature for feature in datasets.features if feature in set(ranked[:size])]
+        columns = [datasets.features.index(feature) for feature in subset]
+        subset_datasets = CVDatasets(
+            datasets.features_matrix[:, columns],
+            datasets.label,
+            subset,
+            [feature for feature in datasets.categorical_features if feature in subset],
+            nfold=datasets.nfold,
+            seed=datasets.seed,
+            params=datasets.params,
+        )
+
+        logger.info(f"Retraining on the {size} most important of {len(datasets.features)} features")
+        subset_evaluation = metrics.evaluate(subset_datasets.label, subset_datasets.out_of_fold_predict(params))
+        pruned = ClassificationModel(
+            subset_datasets.train,
+            subset,
+            subset_datasets.categorical_features,
+            target,
+            model.preprocessor,
+            parent_dir=os.path.join(model.dir, "pruned"),
+        )
+        pruned.train(subset_datasets.train, params)
+        pruned.save_state(
+            params,
+            {"auc": subset_evaluation["auc"], "f1": subset_evaluation["f1"]},
+            subset_evaluation,
+            feature_pruning={"pruned_from": model.id},
+        )
+
+        row = _subset_report(pruned.model, subset, frame, subset_evaluation, os.path.relpath(pruned.dir, model.dir))
+        row["train_seconds"] = time.perf_counter() - start
+        report.append(row)
+        logger.info(f"{size} features: AUC {row['auc']:.4f}, F1 {row['f1']:.4f}, "
+                    f"{row['latency_ms'][str(LATENCY_BATCH_SIZES[0])]:.3f} ms per row")
+    return report
+
+
+def _subset_report(booster, features, frame, evaluation, model_dir):
+    return {
+        "features": len(features),
+        "auc": evaluation["auc"],
+        "f1": evaluation["f1"],
+        "best_f1": evaluation["best_f1"],
+        "latency_ms": {str(size): _latency_ms(booster, frame.iloc[:size], features) for size in LATENCY_BATCH_SIZES},
+        "feature_bytes_per_row": 8 * len(features),
+        "model_bytes": len(booster.model_to_string()),
+        "model_dir": model_dir,
+        "feature_names": features,
+    }
+
+
+def _latency_ms(booster, frame, features):
+    """Median milliseconds to select the features of the rows of a data frame and predict them."""
+    seconds = []
+    for _ in range(LATENCY_REPEATS):
+        start = time.perf_counter()
+        booster.predict(frame[features])
+        seconds.append(time.perf_counter() - start)
+    return float(np.median(seconds)) * 1e3
@@ -1,11 +1,35 @@
+import hashlib
+import json
 import logging
+import multiprocessing
+import os
+import time
 
-import lightgbm as lgb
 import numpy as np
-from hyperopt import fmin, hp, atpe, STATUS_OK, STATUS_FAIL, Trials
-from sklearn.metrics import f1_score
+from hyperopt import (
+    fmin, hp, atpe, Ctrl, Domain, JOB_STATE_DONE, JOB_STATE_ERROR, JOB_STATE_NEW, JOB_STATE_RUNNING, STATUS_OK,
+    STATUS_FAIL, Trials
+)
+from hyperopt.base import spec_from_misc
+from hyperopt.fmin import generate_trial
+from hyperopt.utils import coarse_utcnow
 
-from default_detection import RANDOM_STATE
+from default_detection import DATA_DIR, RANDOM_STATE
+from default_detection.model import metrics, telemetry
+from default_detection.model.pruning import TrialPruned
+from default_detection.model.trials_store import TrialsStore
+
+# Search space of the tuned parameters
+MAX_DEPTHS = [3, 5, 7, 9, 11, -1]
+NUM_LEAVES_RANGE = (25, 512)
+FLOAT_RANGES = {
+    'min_split_gain': (0.1, 5),
+    'subsample': (0.5, 0.8),
+    'colsample_bytree': (0.3, 0.6),
+    'reg_alpha': (0, 0.5),
+    'reg_lambda': (0.5, 10),
+    "scale_pos_weight": (1, 100),
+}
 
 
 def construct_scores(trials):
@@ -30,50 +54,203 @@ def construct_scores(trials):
 
 
 class HyperOptimization(object):
-    def __init__(self, lgb_train, features, categorical_features, target):
+    def __init__(self, datasets, features, categorical_features, target, pruner=None):
         self.trials = Trials()
         self.logger = logging.getLogger(__name__)
-        self.lgb_train = lgb_train
+        self.datasets = datasets
+        self.pruner = pruner
+        self._store = None
         self.features = features
         self.target = target
         self.categorical_features = categorical_features
 
-    def process(self, space, trials, algo, max_evals, timeout):
-        """Minimize the objective function and return the best parameters."""
+    def process(self, space, trials, algo, max_evals, timeout, initial_points=(), target_loss=None):
+        """Minimize the objective function and return the best parameters.
+
+        Initial points are evaluated first. With a target loss, trials are evaluated one at a time
+        and the search stops once a trial reached it.
+        """
         try:
-            results = fmin(
-                fn=self.objective_function,
-                space=space,
-                algo=algo,
-                max_evals=max_evals,
-                timeout=timeout,
-                trials=trials
-            )
+            deadline = time.monotonic() + timeout if timeout else None
+            domain = Domain(self.objective_function, space)
+            for point in initial_points:
+                if self._should_stop(trials, max_evals, deadline, target_loss):
+                    return None
+                trial = generate_trial(trials.new_trial_ids(1)[0], point)
+                self._evaluate(domain, trial)
+                trials.insert_trial_docs([trial])
+                trials.refresh()
+
+            if target_loss is None:
+                return fmin(
+                    fn=self.objective_function,
+                    space=space,
+                    algo=algo,
+                    max_evals=max_evals,
+                    timeout=None if deadline is None else max(deadline - time.monotonic(), 0),
+                    trials=trials
+                )
+
+            results = None
+            while not self._should_stop(trials, max_evals, deadline, target_loss):
+                results = fmin(
+                    fn=self.objective_function,
+                    space=space,
+                    algo=algo,
+                    max_evals=len(trials.trials) + 1,
+                    timeout=None if deadline is None else deadline - time.monotonic(),
+                    trials=trials,
+                    show_progressbar=False,
+                )
         except Exception as e:
             self.logger.exception("Failure while evaluating minimizing objective")
             return {'status': STATUS_FAIL,
                     'exception': str(e)}
         return results
 
+    def _should_stop(self, trials, max_evals, deadline, target_loss):
+        """Whether the search evaluated all trials, ran out of time or reached the target loss."""
+        if len(trials.trials) >= max_evals or (deadline is not None and time.monotonic() >= deadline):
+            return True
+        return target_loss is not None and self._reached(trials, target_loss)
+
+    def _reached(self, trials, target_loss):
+        losses = [loss for loss in trials.losses() if loss is not None]
+        if losses and min(losses) <= target_loss:
+            self.logger.info(f"Stopping the search after {len(losses)} trials, a trial reached the target")
+            return True
+        return False
+
+    def parallel_process(self, space, algo, max_evals, timeout, n_workers, trials_path, initial_points=(),
+                         target_loss=None):
+        """Evaluate trials in worker processes sharing a SQLite trials store, return the trials.
+
+        Trials are suggested in batches of one trial per worker and a batch is suggested once the
+        previous one completed, with a seed derived from `RANDOM_STATE` and the trial id, so the
+        search does not depend on which worker finishes first and resumes where the store left off.
+        The cores are split between the workers. Initial points are the first trials, and the
+        search stops after the batch in which a trial reached the target loss.
+        """
+        store = TrialsStore(trials_path, self._experiment_key(space))
+        store.requeue()
+        n_done = store.count()
+        if n_done:
+            self.logger.info(f"Resuming hyper-search after {n_done} trials from {trials_path}")
+
+        # Fork the workers before LightGBM runs in this process, OpenMP does not survive a fork, and
+        # build the datasets they load in a process of its own for the same reason
+        context = multiprocessing.get_context("fork")
+        builder = context.Process(target=self.datasets.build)
+        builder.start()
+        builder.join()
+        if builder.exitcode != 0:
+            raise RuntimeError("Failed to build the cross validation datasets")
+
+        stopped = context.Event()
+        n_jobs = max(1, (os.cpu_count() or 1) // n_workers)
+        workers = [
+            context.Process(target=self._work, args=(store, dict(space, n_jobs=n_jobs), stopped), daemon=True)
+            for _ in range(n_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        domain = Domain(self.objective_function, space)
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            while True:
+                self._wait_for_trials(store, workers)
+
+                n_trials = store.count()
+                if n_trials >= max_evals or (deadline is not None and time.monotonic() >= deadline):
+                    break
+                if target_loss is not None and self._reached(store.trials(), target_loss):
+                    break
+
+                tid = store.next_tid()
+                new_ids = list(range(tid, tid + min(n_workers, max_evals - n_trials)))
+                if tid < len(initial_points):
+                    store.insert([generate_trial(i, point) for i, point in zip(new_ids, initial_points[tid:])])
+                    continue
+                seed = np.random.RandomState([int(RANDOM_STATE), tid]).randint(2 ** 31 - 1)
+                store.insert(algo(new_ids, domain, store.trials(), seed))
+        finally:
+            stopped.set()
+            for worker in workers:
+                worker.join(timeout=5)
+                if worker.is_alive():
+                    worker.terminate()
+
+        return store.trials()
+
+    def _work(self, store, space, stopped):
+        """Evaluate trials reserved from the store until the search stopped."""
+        self._store = store
+        domain = Domain(self.objective_function, space)
+        parent = os.getppid()
+        # Also stop when the search process died without stopping the workers
+        while not stopped.is_set() and os.getppid() == parent:
+            trial = store.reserve(os.getpid())
+            if trial is None:
+                time.sleep(0.1)
+                continue
+
+            self._evaluate(domain, trial)
+            store.complete(trial)
+
+    def _evaluate(self, domain, trial):
+        """Evaluate a trial document and record its result or error in it."""
+        trial["book_time"] = coarse_utcnow()
+        try:
+            trial["result"] = domain.evaluate(spec_from_misc(trial["misc"]), Ctrl(None, current_trial=trial))
+            trial["state"] = JOB_STATE_DONE
+        except Exception as e:
+            self.logger.exception(f"Failure while evaluating trial {trial['tid']}")
+            trial["state"] = JOB_STATE_ERROR
+            trial["misc"]["error"] = (str(type(e)), str(e))
+        trial["refresh_time"] = coarse_utcnow()
+
+    def _wait_for_trials(self, store, workers):
+        """Wait until the workers evaluated all queued trials."""
+        while store.count([JOB_STATE_NEW, JOB_STATE_RUNNING]):
+            if not all(worker.is_alive() for worker in workers):
+                raise RuntimeError("A hyper-search worker died, rerun the search to resume it")
+            time.sleep(0.2)
+
+    def _experiment_key(self, space):
+        """Key trials by the search space and training data, a changed setup starts a new search."""
+        digest = hashlib.sha256()
+        # The string of a search expression is its graph, its repr only holds the object address
+        digest.update(json.dumps({name: str(value) for name, value in space.items()}, sort_keys=True).encode())
+        digest.update(json.dumps([self.features, self.categorical_features, self.target]).encode())
+        digest.update(self.datasets.key.encode())
+        if self.pruner is not None:
+            digest.update(json.dumps(self.pruner.config(), sort_keys=True).encode())
+        return digest.hexdigest()[:16]
+
     def objective_function(self, params):
         """Objective function to minimize."""
 
         # Convert parameters to int since hyperopt converts to float values
         params['max_depth'] = int(params['max_depth'])
         params['num_leaves'] = int(params['num_leaves'])
+        start, cpu_start = time.perf_counter(), time.process_time()
 
-        # Compute cross validation scores with early stopping rounds
-        scores = lgb.cv(
-            params=params,
-            num_boost_round=500,
-            train_set=self.lgb_train,
-            nfold=3,
-            feature_name=self.features,
-            categorical_feature=self.categorical_features,
-            stratified=True,
-            early_stopping_rounds=150,
-            feval=self.f1_score_valid,
-        )
+        # Compute cross validation scores with early stopping rounds on the prebuilt stratified folds,
+        # pruned trials keep the scores up to the round they were stopped at
+        try:
+            scores = self.datasets.cv(
+                params=params,
+                num_boost_round=500,
+                early_stopping_rounds=150,
+                feval=self.f1_score_valid,
+                pruner=self.pruner,
+                history=self._history() if self.pruner is not None else (),
+            )
+            pruned_at = None
+        except TrialPruned as e:
+            self.logger.info(str(e))
+            scores, pruned_at = e.results, e.rounds
 
         # Save the scores
         loss = -1 * scores['auc-mean'][-1]
@@ -86,30 +263,41 @@ class HyperOptimization(object):
             "auc": scores["auc-mean"],
             'loss_variance': variance,
             'params': params,
+            'pruned_at': pruned_at,
+            'telemetry': telemetry.trial_telemetry(start, cpu_start, self.datasets.boosted_rounds),
             'status': STATUS_OK
         }
 
         return results
 
-    def hyper_search(self, max_evals=100, timeout=600, algo=atpe.suggest):
-        """Return the best parameters found from hyper search."""
+    def _history(self):
+        """Return the AUC by round and pruning round of the completed trials."""
+        trials = self._store.trials() if self._store is not None else self.trials
+        return [
+            (trial['result']['auc'], trial['result'].get('pruned_at'))
+            for trial in trials.trials
+            if trial['result'].get('status') == STATUS_OK
+        ]
+
+    def hyper_search(self, max_evals=100, timeout=600, algo=atpe.suggest, n_workers=1, trials_path=None,
+                     initial_points=(), target_auc=None):
+        """Return the best parameters found from hyper search.
+
+        With more than one worker or a trials path, trials run in parallel worker processes and are
+        stored in the SQLite file at `trials_path`, from which an interrupted search resumes. Initial
+        points, in the representation of the search space, are evaluated first, and the search stops
+        early once a trial reached `target_auc`.
+        """
         self.logger.info("Starting hyper-search.")
 
         # Parameter space for discrete parameters
         integer_params = {
-            'max_depth': hp.choice('max_depth', [3, 5, 7, 9, 11, -1]),
-            'num_leaves': hp.quniform('num_leaves', 25, 512, 1),
+            'max_depth': hp.choice('max_depth', MAX_DEPTHS),
+            'num_leaves': hp.quniform('num_leaves', *NUM_LEAVES_RANGE, 1),
         }
 
         # Parameter space for continuous parameters
-        float_params = {
-            'min_split_gain': hp.uniform('min_split_gain', 0.1, 5),
-            'subsample': hp.uniform('subsample', 0.5, 0.8),
-            'colsample_bytree': hp.uniform('colsample_bytree', 0.3, 0.6),
-            'reg_alpha': hp.uniform('reg_alpha', 0, 0.5),
-            'reg_lambda': hp.uniform('reg_lambda', 0.5, 10),
-            "scale_pos_weight": hp.uniform('scale_pos_weight', 1, 100),
-        }
+        float_params = {name: hp.uniform(name, low, high) for name, (low, high) in FLOAT_RANGES.items()}
 
         # Parameters to keep fixed
         fix_params = {
@@ -128,12 +316,27 @@ class HyperOptimization(object):
         params.update(float_params)
         params.update(fix_params)
 
-        # Optimize over parameter space
-        self.process(space=params, trials=self.trials, algo=algo, max_evals=max_evals, timeout=timeout)
+        # Optimize over parameter space, the loss is the negative AUC
+        target_loss = None if target_auc is None else -target_auc
+        if n_workers > 1 or trials_path:
+            self.trials = self.parallel_process(
+                space=params,
+                algo=algo,
+                max_evals=max_evals,
+                timeout=timeout,
+                n_workers=n_workers,
+                trials_path=trials_path or os.path.join(DATA_DIR, "trials.sqlite"),
+                initial_points=list(initial_points),
+                target_loss=target_loss,
+            )
+        else:
+            self.process(space=params, trials=self.trials, algo=algo, max_evals=max_evals, timeout=timeout,
+                         initial_points=initial_points, target_loss=target_loss)
         self.logger.info('Finished hyper-search.')
 
         # Update with tuned parameter values and increase estimators
         optimized_params = self.trials.best_trial['result']['params']
+        optimized_params['n_jobs'] = fix_params['n_jobs']
         optimized_params['n_estimators'] = len(self.trials.best_trial['result']['auc'])
 
         # Construct sklearn scores in style of cv_results_ from sklearn
@@ -148,6 +351,4 @@ class HyperOptimization(object):
 
     @staticmethod
     def f1_score_valid(y_hat, lgb_data):
-        y_true = lgb_data.get_label()
-        y_hat = np.where(y_hat < 0.5, 0, 1)
-        return 'f1', f1_score(y_true, y_hat), True
+        return 'f1', metrics.f1_score_at(lgb_data.get_label(), y_hat, threshold=0.5), True
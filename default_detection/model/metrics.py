@@ -0,0 +1,98 @@
+"""Binary classification metrics in NumPy, equivalent to their `sklearn.metrics` counterparts.
+
+The metrics skip the input validation and label handling of sklearn, which dominate its cost for
+the arrays scored after every boosting round of the hyper-search. Labels are 0/1 arrays, scores
+are probabilities.
+"""
+import numpy as np
+
+
+def confusion_counts(y_true, y_pred):
+    """Return the true positives, false positives and false negatives of 0/1 predictions."""
+    y_true = np.asarray(y_true, dtype=np.float64)
+    y_pred = np.asarray(y_pred, dtype=np.float64)
+    tp = float(np.dot(y_true, y_pred))
+    return tp, float(y_pred.sum()) - tp, float(y_true.sum()) - tp
+
+
+def f1_score(y_true, y_pred):
+    """F1 score of the positive class, 0 if there are no true or predicted positives."""
+    tp, fp, fn = confusion_counts(y_true, y_pred)
+    denominator = 2 * tp + fp + fn
+    return 2 * tp / denominator if denominator else 0.0
+
+
+def f1_score_at(y_true, scores, threshold=0.5):
+    """F1 score of the predictions `scores >= threshold`."""
+    return f1_score(y_true, np.asarray(scores) >= threshold)
+
+
+def roc_auc_score(y_true, scores):
+    """Area under the ROC curve, tied scores count half as in sklearn."""
+    _, tps, fps = _cumulative_counts(y_true, scores)
+    if tps[-1] == 0 or fps[-1] == 0:
+        raise ValueError("ROC AUC is not defined when only one class is present")
+
+    # Trapezoids between the distinct thresholds of the ROC curve
+    tps = np.concatenate([[0.0], tps])
+    fps = np.concatenate([[0.0], fps])
+    return float(np.dot(np.diff(fps), tps[1:] + tps[:-1]) / (2 * tps[-1] * fps[-1]))
+
+
+def threshold_sweep(y_true, scores):
+    """Return precision, recall and F1 at every distinct score used as threshold, from one sort.
+
+    Returns a dict of arrays ordered by decreasing threshold, where predictions at a threshold are
+    `scores >= threshold`.
+    """
+    thresholds, tps, fps = _cumulative_counts(y_true, scores)
+    positives = tps[-1]
+
+    precision = tps / (tps + fps)
+    recall = tps / positives if positives else np.zeros_like(tps)
+    denominator = tps + fps + positives
+    f1 = np.divide(2 * tps, denominator, out=np.zeros_like(tps), where=denominator > 0)
+    return {"threshold": thresholds, "precision": precision, "recall": recall, "f1": f1}
+
+
+def best_threshold(y_true, scores):
+    """Return the threshold with the highest F1 score and that score."""
+    sweep = threshold_sweep(y_true, scores)
+    best = int(np.argmax(sweep["f1"]))
+    return float(sweep["threshold"][best]), float(sweep["f1"][best])
+
+
+def evaluate(y_true, scores, threshold=0.5):
+    """Return AUC, F1, precision and recall at the threshold and the threshold with the best F1."""
+    tp, fp, fn = confusion_counts(y_true, np.asarray(scores) >= threshold)
+    best, best_f1 = best_threshold(y_true, scores)
+    return {
+        "auc": roc_auc_score(y_true, scores),
+        "f1": 2 * tp / (2 * tp + fp + fn) if tp + fp + fn else 0.0,
+        "precision": tp / (tp + fp) if tp + fp else 0.0,
+        "recall": tp / (tp + fn) if tp + fn else 0.0,
+        "threshold": threshold,
+        "best_threshold": best,
+        "best_f1": best_f1,
+    }
+
+
+def _cumulative_counts(y_true, scores):
+    """Return the distinct scores in decreasing order and the positives and negatives scored at least as high."""
+    y_true = np.asarray(y_true, dtype=np.float64)
+    scores = np.asarray(scores, dtype=np.float64)
+    if not len(scores):
+        raise ValueError("Metrics are not defined for empty arrays")
+
+    # Tied scores are aggregated below, so their order does not matter and the sort need not be stable
+    order = np.argsort(scores)[::-1]
+    scores = scores[order]
+    y_true = y_true[order]
+
+    # Last position of each run of tied scores
+    distinct = np.flatnonzero(np.diff(scores))
+    ends = np.append(distinct, len(scores) - 1)
+
+    tps = np.cumsum(y_true)[ends]
+    fps = (ends + 1) - tps
+    return scores[ends], tps, fps.astype(np.float64)
@@ -1,21 +1,53 @@
 import logging
+import os
 
 import lightgbm as lgb
-import pandas as pd
-
-from default_detection.data import preprocessing, CSV_DATA
+import numpy as np
+
+from default_detection import (
+    FEATURE_PRUNING_FRACTIONS,
+    PRUNING_RUNGS,
+    RANDOM_STATE,
+    SEARCH_TRIALS_PATH,
+    SEARCH_WORKERS,
+    TRAINING_TRACE,
+    WARM_START,
+    WARM_START_BOOSTING,
+    WARM_START_POINTS,
+    WARM_START_ROUNDS,
+    WARM_START_TOLERANCE,
+)
+from default_detection.data import store, CSV_DATA
+from default_detection.model import feature_pruning, metrics, telemetry, warm_start
 from default_detection.model.classification_model import ClassificationModel
+from default_detection.model.cv_datasets import CVDatasets
 from default_detection.model.hyper_optimization import HyperOptimization
+from default_detection.model.pruning import RungPruner
 
 logger = logging.getLogger(__name__)
 
 
 class ModelTrainer(object):
-    """The wrapper class for handling the hyper-optimization."""
-    def __init__(self, target="default", max_evals=100, max_time=600):
+    """The wrapper class for handling the hyper-optimization.
+
+    With a warm start from an earlier model, the search starts from its best parameters and stops
+    once a trial reaches its AUC, or with `warm_start_boosting` its booster continues boosting on
+    the new data instead. After a search, the tuned model is retrained on the fractions
+    `feature_pruning_fractions` of its most important features, saved next to it.
+    """
+    def __init__(self, target="default", max_evals=100, max_time=600, n_workers=SEARCH_WORKERS,
+                 trials_path=SEARCH_TRIALS_PATH, warm_start=WARM_START, warm_start_boosting=WARM_START_BOOSTING,
+                 feature_pruning_fractions=FEATURE_PRUNING_FRACTIONS):
         self.target = target
         self.max_evals = max_evals
         self.max_time = max_time
+        self.n_workers = n_workers
+        self.trials_path = trials_path
+        self.warm_start = warm_start
+        self.warm_start_boosting = warm_start_boosting
+        self.feature_pruning_fractions = feature_pruning_fractions
+        self.preprocessor = None
+        self.telemetry = telemetry.Telemetry()
 
     def train_model(self):
         """Starts hyper-optimization."""
@@ -23,11 +55,9 @@ class ModelTrainer(object):
         return self._train_model(data, features, categorical_features)
 
     def _process_data(self):
-        logger.info("Reading data")
-        raw_data = pd.read_csv(CSV_DATA, delimiter=";")
-
-        logger.info("Preprocessing data")
-        data, features, categorical_features = preprocessing.preprocess_dataset(raw_data)
+        with self.telemetry.stage("load_data"):
+            data, self.preprocessor = store.load_preprocessed(CSV_DATA, telemetry=self.telemetry)
+        features, categorical_features = self.preprocessor.features, self.preprocessor.categorical_features
 
         # Split data
         data["dataset"] = 'train'
@@ -36,36 +66,114 @@ class ModelTrainer(object):
         return data, features, categorical_features
 
     def _train_model(self, data, features, categorical_features):
-        lgb_train = lgb.Dataset(
-            data.query("dataset == 'train'")[features],
-            data.query("dataset == 'train'")[self.target],
-            feature_name=features,
-            categorical_feature=categorical_features
-        )
-
-        params, scores = HyperOptimization(
-            lgb_train,
+        train = data[data["dataset"] == "train"]
+        datasets = CVDatasets(
+            train[features].to_numpy(dtype=np.float64),
+            train[self.target].to_numpy(dtype=np.float64),
             features,
             categorical_features,
-            self.target
-        ).hyper_search(max_evals=self.max_evals, timeout=self.max_time)
+        )
+
+        previous = warm_start.PreviousRun.find(self.warm_start) if self.warm_start else None
+        continued, trials, init_model, warm_start_info = None, None, None, None
+        if previous is not None:
+            target_auc = previous.auc - WARM_START_TOLERANCE
+            logger.info(f"Warm starting from model {previous.id} with a target AUC of {target_auc:.5f}")
+            warm_start_info = {"previous_id": previous.id, "previous_auc": previous.auc, "target_auc": target_auc}
+            if self.warm_start_boosting:
+                with self.telemetry.stage("continue_boosting") as record:
+                    continued = self._continue_boosting(datasets, train["uuid"], previous, target_auc)
+                    record["boosted_rounds"] = continued[0]["n_estimators"] if continued else 0
+
+        if continued is not None:
+            params, scores, evaluation = continued
+            init_model = previous.booster
+            warm_start_info.update(mode="boosting", initial_rounds=init_model.current_iteration())
+            lgb_train = lgb.Dataset(
+                datasets.features_matrix,
+                datasets.label,
+                reference=datasets.train,
+                feature_name=features,
+                categorical_feature=categorical_features,
+                params=datasets.params,
+                free_raw_data=False,
+            )
+        else:
+            if warm_start_info is not None:
+                warm_start_info["mode"] = "search"
+            hyper_optimization = HyperOptimization(
+                datasets,
+                features,
+                categorical_features,
+                self.target,
+                pruner=RungPruner() if PRUNING_RUNGS else None,
+            )
+            with self.telemetry.stage("hyper_search") as record:
+                params, scores = hyper_optimization.hyper_search(
+                    max_evals=self.max_evals,
+                    timeout=self.max_time,
+                    n_workers=self.n_workers,
+                    trials_path=self.trials_path,
+                    initial_points=[] if previous is None else previous.search_points(
+                        min(WARM_START_POINTS, self.max_evals), seed=int(RANDOM_STATE)
+                    ),
+                    target_auc=None if previous is None else target_auc,
+                )
+                trials = hyper_optimization.trials
+                record["trials"] = len(trials.trials)
+            lgb_train = datasets.train
 
         classification_model = ClassificationModel(
             lgb_train,
             features,
             categorical_features,
             self.target,
+            self.preprocessor,
         )
 
         logger.info("Training on optimized parameters")
-        classification_model.train(lgb_train, params)
+        with self.telemetry.stage("train") as record:
+            classification_model.train(lgb_train, params, init_model=init_model)
+            record["boosted_rounds"] = classification_model.model.current_iteration()
+
+        # Continued boosting was evaluated on the held out unseen rows
+        if continued is None:
+            logger.info("Evaluating optimized parameters out of fold")
+            with self.telemetry.stage("evaluate"):
+                evaluation = metrics.evaluate(datasets.label, datasets.out_of_fold_predict(params))
+
+        pruning_report = None
+        if continued is None and self.feature_pruning_fractions:
+            logger.info("Retraining on the most important features")
+            with self.telemetry.stage("feature_pruning") as record:
+                pruning_report = feature_pruning.prune(
+                    datasets, params, classification_model, evaluation, self.feature_pruning_fractions, self.target
+                )
+                record["subsets"] = len(pruning_report) - 1
+
+        summary = self.telemetry.summary(trials)
+        if TRAINING_TRACE and trials is not None:
+            trace_path = os.path.join(classification_model.dir, "training-trace.jsonl")
+            telemetry.write_trace(trace_path, trials)
+            summary["trace_file"] = os.path.basename(trace_path)
 
         logger.info("Storing results")
-        classification_model.save_state(params, scores)
+        classification_model.save_state(params, scores, evaluation, summary, warm_start_info, pruning_report)
+        warm_start.save_training_rows(classification_model.dir, train["uuid"])
 
         return classification_model, params, scores
 
-
-if __name__ == '__main__':
-    trainer = ModelTrainer(max_evals=500, max_time=5400)
-    trainer.train_model()
+    def _continue_boosting(self, datasets, uuids, previous, target_auc):
+        """Continue boosting the previous booster, return None if the search has to run instead."""
+        if not previous.matches(datasets.features, datasets.categorical_features):
+            logger.warning(f"Features changed since model {previous.id}, searching instead of continuing to boost")
+            return None
+
+        unseen = previous.unseen(uuids)
+        continued = None
+        if unseen is not None:
+            continued = warm_start.continue_boosting(datasets, unseen, previous, target_auc, WARM_START_ROUNDS)
+        if continued is None:
+            logger.warning(f"Model {previous.id} saved no training rows or too few rows are new to validate "
+                           f"continued boosting, searching instead")
+        return continued
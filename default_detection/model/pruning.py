@@ -0,0 +1,49 @@
+import numpy as np
+
+from default_detection import PRUNING_MIN_TRIALS, PRUNING_PERCENTILE, PRUNING_RUNGS
+
+
+class TrialPruned(Exception):
+    """Raised by the cross validation when the pruner stopped the trial, holds the partial scores."""
+
+    def __init__(self, results, rounds):
+        super().__init__(f"Trial pruned after {rounds} rounds")
+        self.results = results
+        self.rounds = rounds
+
+
+class RungPruner(object):
+    """Stop unpromising trials at rung checkpoints, in the style of a median pruner or ASHA.
+
+    At each rung, a number of boosting rounds, the mean validation score of a trial is compared with
+    the scores of the earlier trials that reached the rung. The trial stops if it falls below the
+    given percentile of them, the median by default or the 66th percentile to keep the top third as
+    ASHA does. Rungs with fewer than `min_trials` earlier scores never prune.
+    """
+
+    def __init__(self, rungs=PRUNING_RUNGS, percentile=PRUNING_PERCENTILE, min_trials=PRUNING_MIN_TRIALS):
+        self.rungs = sorted(rungs)
+        self.percentile = percentile
+        self.min_trials = min_trials
+
+    def config(self):
+        return {"rungs": self.rungs, "percentile": self.percentile, "min_trials": self.min_trials}
+
+    def should_prune(self, rounds, score, history):
+        """Return whether a trial with the score after the number of rounds should stop.
+
+        The history holds a (scores by round, pruned after rounds or None) tuple per earlier trial.
+        Trials that stopped early count with their last score, trials pruned before the rung do not
+        count.
+        """
+        if rounds not in self.rungs:
+            return False
+
+        rung_scores = [
+            scores[min(rounds, len(scores)) - 1]
+            for scores, pruned_at in history
+            if len(scores) and (pruned_at is None or pruned_at >= rounds)
+        ]
+        if len(rung_scores) < self.min_trials:
+            return False
+        return score < np.percentile(rung_scores, self.percentile)
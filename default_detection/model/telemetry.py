@@ -0,0 +1,136 @@
+import contextlib
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+from hyperopt import STATUS_OK
+
+logger = logging.getLogger(__name__)
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Return the peak resident set size in MB, of this process or of its largest exited child."""
+    if who == resource.RUSAGE_SELF:
+        # Linux keeps ru_maxrss across exec, so a process started by a larger one would report the
+        # peak of its parent, the high water mark of the process status starts afresh
+        try:
+            with open("/proc/self/status") as status:
+                for line in status:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    peak = resource.getrusage(who).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def cpu_seconds():
+    """Return the CPU time of this process, all its threads, and its exited children."""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+class Telemetry(object):
+    """Wall time, CPU time and peak memory of the stages of a training run.
+
+    Stages are timed with `stage` and may nest. CPU time includes the threads of LightGBM and the
+    child processes that exited within the stage, such as the workers of a parallel search, so CPU
+    time above wall time shows parallelism. Peak memory is the peak of the process up to the end of
+    the stage. Trials report their own telemetry in their results, see `trial_summary`.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._start = time.perf_counter()
+        self._cpu_start = cpu_seconds()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the stage and yield its record, to which callers may add details."""
+        record = self.stages[name] = {}
+        start, cpu_start = time.perf_counter(), cpu_seconds()
+        try:
+            yield record
+        finally:
+            record["wall_seconds"] = time.perf_counter() - start
+            record["cpu_seconds"] = cpu_seconds() - cpu_start
+            record["peak_rss_mb"] = peak_rss_mb()
+            logger.info(f"Stage {name} took {record['wall_seconds']:.1f} s")
+
+    def summary(self, trials=None):
+        """Return the stages, totals and, given the hyperopt trials, the trial summary."""
+        summary = {
+            "stages": self.stages,
+            "wall_seconds": time.perf_counter() - self._start,
+            "cpu_seconds": cpu_seconds() - self._cpu_start,
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_rss_children_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+            "cpu_count": os.cpu_count(),
+            "platform": platform.platform(),
+        }
+        if trials is not None:
+            summary["trials"] = trial_summary(trials)
+        return summary
+
+
+def trial_telemetry(start, cpu_start, boosted_rounds):
+    """Return the telemetry of a trial that started at the given wall and CPU time."""
+    wall = time.perf_counter() - start
+    return {
+        "wall_seconds": wall,
+        "cpu_seconds": time.process_time() - cpu_start,
+        "boosted_rounds": boosted_rounds,
+        "rounds_per_second": boosted_rounds / wall if wall > 0 else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def trial_summary(trials):
+    """Summarize the telemetry in the results of the completed trials."""
+    results = [trial["result"] for trial in trials.trials if trial["result"].get("status") == STATUS_OK]
+    telemetry = [result["telemetry"] for result in results if "telemetry" in result]
+    if not telemetry:
+        return {"trials": len(results)}
+
+    wall = np.array([t["wall_seconds"] for t in telemetry])
+    rounds = np.array([t["boosted_rounds"] for t in telemetry])
+    return {
+        "trials": len(results),
+        "pruned": sum(result.get("pruned_at") is not None for result in results),
+        "boosted_rounds": int(rounds.sum()),
+        "rounds_per_second": float(rounds.sum() / wall.sum()) if wall.sum() > 0 else None,
+        "trial_seconds": {
+            "mean": float(wall.mean()),
+            "p50": float(np.percentile(wall, 50)),
+            "p95": float(np.percentile(wall, 95)),
+            "max": float(wall.max()),
+        },
+        "trial_cpu_seconds": float(sum(t["cpu_seconds"] for t in telemetry)),
+        "trial_peak_rss_mb": float(max(t["peak_rss_mb"] for t in telemetry)),
+    }
+
+
+def write_trace(path, trials):
+    """Write one JSON line per trial with its telemetry, result and parameters."""
+    with open(path, 'w') as trace_file:
+        for trial in trials.trials:
+            result = trial["result"]
+            auc = result.get("auc")
+            trace_file.write(json.dumps({
+                "tid": trial["tid"],
+                "status": result.get("status"),
+                "book_time": str(trial.get("book_time")),
+                "refresh_time": str(trial.get("refresh_time")),
+                "auc": auc[-1] if auc else None,
+                "rounds": len(auc) if auc else 0,
+                "pruned_at": result.get("pruned_at"),
+                "telemetry": result.get("telemetry"),
+                "params": result.get("params"),
+            }, default=str) + "\n")
+    logger.info(f"Wrote trace of {len(trials.trials)} trials to {path}")
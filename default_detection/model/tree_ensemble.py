@@ -0,0 +1,202 @@
+import numpy as np
+
+# Missing value handling of LightGBM splits
+MISSING_NONE = 0
+MISSING_ZERO = 1
+MISSING_NAN = 2
+
+# Values LightGBM treats as zero for zero as missing
+ZERO_THRESHOLD = 1e-35
+
+# (row, tree) pairs walked at once by predict, bounding its temporary arrays to a few MB per block of rows
+BLOCK_PAIRS = 1 << 18
+
+
+class TreeEnsemble(object):
+    """LightGBM booster flattened into array-backed node tables for NumPy inference.
+
+    All nodes of all trees are stored in flat arrays. Leaves point to themselves, so walking a
+    batch of rows through every tree at once is a fixed number of vectorized steps.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, default_left, missing_type, categorical,
+                 cat_index, cat_boundaries, cat_bitsets, roots, max_depth, sigmoid=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.default_left = default_left
+        self.missing_type = missing_type
+        self.categorical = categorical
+        self.cat_index = cat_index
+        self.cat_boundaries = cat_boundaries
+        self.cat_bitsets = cat_bitsets
+        self.roots = roots
+        self.max_depth = max_depth
+        self.sigmoid = sigmoid
+
+        # Lookup tables derived from the node tables for the tree walk
+        self._is_leaf = left == np.arange(len(left))
+        self._children = np.stack([right, left], axis=1).ravel()
+        self._has_zero_missing = bool((missing_type == MISSING_ZERO).any())
+        self._has_categorical = bool(categorical.any())
+
+        # Where NaN goes at each node, NaN is treated as zero unless a missing value type is set
+        self._nan_left = np.where(missing_type == MISSING_NONE, 0.0 <= threshold, default_left) & ~categorical
+
+        # Categorical nodes are decided through their bitset, never through the threshold
+        self._threshold = np.where(categorical, -np.inf, threshold)
+
+    @classmethod
+    def from_booster(cls, booster):
+        """Flatten a trained booster through its model dump."""
+        return cls.from_dump(booster.dump_model())
+
+    @classmethod
+    def from_dump(cls, dump):
+        """Flatten the JSON model dump of a booster."""
+        if dump.get("num_tree_per_iteration", 1) != 1:
+            raise ValueError("Only boosters with a single tree per iteration are supported")
+
+        tables = {name: [] for name in [
+            "feature", "threshold", "left", "right", "value", "default_left", "missing_type", "categorical", "cat"
+        ]}
+        cat_bitsets = []
+        cat_boundaries = [0]
+        roots = []
+        max_depth = 0
+
+        def add(node, depth):
+            nonlocal max_depth
+            max_depth = max(max_depth, depth)
+
+            index = len(tables["feature"])
+            for name, default in [("feature", 0), ("threshold", 0.0), ("value", 0.0), ("default_left", False),
+                                  ("missing_type", MISSING_NONE), ("categorical", False), ("cat", 0)]:
+                tables[name].append(default)
+            tables["left"].append(index)
+            tables["right"].append(index)
+
+            if "leaf_value" in node:
+                tables["value"][index] = node["leaf_value"]
+                return index
+
+            tables["feature"][index] = node["split_feature"]
+            tables["default_left"][index] = node["default_left"]
+            tables["missing_type"][index] = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}[
+                node["missing_type"]
+            ]
+
+            if node["decision_type"] == "==":
+                categories = [int(c) for c in str(node["threshold"]).split("||")]
+                bitset = np.zeros(max(categories) // 32 + 1, dtype=np.uint32)
+                for category in categories:
+                    bitset[category // 32] |= np.uint32(1 << (category % 32))
+                tables["categorical"][index] = True
+                tables["cat"][index] = len(cat_boundaries) - 1
+                cat_bitsets.extend(bitset.tolist())
+                cat_boundaries.append(len(cat_bitsets))
+            elif node["decision_type"] == "<=":
+                tables["threshold"][index] = float(node["threshold"])
+            else:
+                raise ValueError(f"Unsupported decision type {node['decision_type']}")
+
+            tables["left"][index] = add(node["left_child"], depth + 1)
+            tables["right"][index] = add(node["right_child"], depth + 1)
+            return index
+
+        for tree in dump["tree_info"]:
+            roots.append(add(tree["tree_structure"], 0))
+
+        sigmoid = None
+        objective = dump.get("objective", "").split()
+        if objective and objective[0] in ("binary", "cross_entropy", "xentropy"):
+            sigmoid = 1.0
+            for option in objective[1:]:
+                if option.startswith("sigmoid:"):
+                    sigmoid = float(option.split(":")[1])
+
+        return cls(
+            feature=np.asarray(tables["feature"], dtype=np.int32),
+            threshold=np.asarray(tables["threshold"], dtype=np.float64),
+            left=np.asarray(tables["left"], dtype=np.int32),
+            right=np.asarray(tables["right"], dtype=np.int32),
+            value=np.asarray(tables["value"], dtype=np.float64),
+            default_left=np.asarray(tables["default_left"], dtype=bool),
+            missing_type=np.asarray(tables["missing_type"], dtype=np.int8),
+            categorical=np.asarray(tables["categorical"], dtype=bool),
+            cat_index=np.asarray(tables["cat"], dtype=np.int32),
+            cat_boundaries=np.asarray(cat_boundaries, dtype=np.int32),
+            cat_bitsets=np.asarray(cat_bitsets, dtype=np.uint32),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            sigmoid=sigmoid,
+        )
+
+    def predict(self, features, raw_score=False):
+        """Predict a feature matrix, returning probabilities for binary objectives.
+
+        Rows are walked in blocks of at most `BLOCK_PAIRS` (row, tree) pairs, so memory stays bounded
+        whatever the number of rows.
+        """
+        features = np.ascontiguousarray(features, dtype=np.float64)
+        block_rows = max(1, BLOCK_PAIRS // max(1, len(self.roots)))
+        raw = np.empty(len(features), dtype=np.float64)
+        for start in range(0, len(features), block_rows):
+            leaves = self.predict_leaves(features[start:start + block_rows])
+            raw[start:start + block_rows] = self.value[leaves].sum(axis=1)
+        if raw_score or self.sigmoid is None:
+            return raw
+        return 1.0 / (1.0 + np.exp(-self.sigmoid * raw))
+
+    def predict_leaves(self, features):
+        """Return the leaf node of every tree for every row, shape (rows, trees)."""
+        features = np.ascontiguousarray(features, dtype=np.float64)
+        n_rows, n_features = features.shape
+        n_trees = len(self.roots)
+
+        # Walk flat (row, tree) pairs and drop them once they reach a leaf
+        leaves = np.tile(self.roots, n_rows)
+        offsets = np.repeat(np.arange(n_rows) * n_features, n_trees)
+        active = np.flatnonzero(~self._is_leaf[leaves])
+        nodes = leaves[active]
+        offsets = offsets[active]
+        values = features.ravel()
+
+        while len(active):
+            value = values[offsets + self.feature[nodes]]
+            nan = np.isnan(value)
+            go_left = value <= self._threshold[nodes]
+            if nan.any():
+                go_left[nan] = self._nan_left[nodes[nan]]
+
+            if self._has_zero_missing:
+                zero = (self.missing_type[nodes] == MISSING_ZERO) & (np.abs(value) <= ZERO_THRESHOLD)
+                go_left[zero] = self.default_left[nodes[zero]]
+
+            if self._has_categorical:
+                categorical = self.categorical[nodes]
+                if categorical.any():
+                    go_left[categorical] = self._categorical_decision(nodes[categorical], value[categorical])
+
+            nodes = self._children[2 * nodes + go_left]
+            done = self._is_leaf[nodes]
+            if done.any():
+                leaves[active[done]] = nodes[done]
+                keep = ~done
+                active, nodes, offsets = active[keep], nodes[keep], offsets[keep]
+
+        return leaves.reshape(n_rows, n_trees)
+
+    def _categorical_decision(self, nodes, values):
+        # NaN and negative categories always go right
+        valid = ~np.isnan(values) & (values >= 0)
+        categories = np.where(valid, values, 0).astype(np.int64)
+
+        cat_index = self.cat_index[nodes]
+        word = self.cat_boundaries[cat_index] + categories // 32
+        valid &= word < self.cat_boundaries[cat_index + 1]
+
+        bits = self.cat_bitsets[np.where(valid, word, 0)] >> (categories % 32).astype(np.uint32)
+        return valid & (bits & 1).astype(bool)
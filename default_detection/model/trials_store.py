@@ -0,0 +1,114 @@
+import logging
+import os
+import pickle
+import sqlite3
+
+from hyperopt import JOB_STATE_DONE, JOB_STATE_ERROR, JOB_STATE_NEW, JOB_STATE_RUNNING, Trials
+
+logger = logging.getLogger(__name__)
+
+
+class TrialsStore(object):
+    """Hyperopt trials of one search experiment stored in SQLite and shared between processes.
+
+    Trials are inserted as new, reserved by one worker process at a time and completed with their
+    result, so a search survives the process running it and can be resumed from the file. Each
+    process opens its own connection.
+    """
+
+    def __init__(self, path, experiment):
+        self.path = path
+        self.experiment = experiment
+        self._connection = None
+        self._pid = None
+
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS trials ("
+                "experiment TEXT, tid INTEGER, state INTEGER, owner INTEGER, doc BLOB, "
+                "PRIMARY KEY (experiment, tid))"
+            )
+
+    def insert(self, docs):
+        """Insert new trial documents to be evaluated."""
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT INTO trials (experiment, tid, state, owner, doc) VALUES (?, ?, ?, NULL, ?)",
+                [(self.experiment, doc["tid"], JOB_STATE_NEW, pickle.dumps(doc)) for doc in docs],
+            )
+
+    def reserve(self, owner):
+        """Mark the oldest new trial as running for the owner and return it, None if there is none."""
+        connection = self._connect()
+        # Take the write lock up front, so no two workers reserve the same trial
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT tid, doc FROM trials WHERE experiment = ? AND state = ? ORDER BY tid LIMIT 1",
+                (self.experiment, JOB_STATE_NEW),
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE trials SET state = ?, owner = ? WHERE experiment = ? AND tid = ?",
+                    (JOB_STATE_RUNNING, owner, self.experiment, row[0]),
+                )
+            connection.execute("COMMIT")
+        except Exception as _:
+            connection.execute("ROLLBACK")
+            raise
+        return None if row is None else pickle.loads(row[1])
+
+    def complete(self, doc):
+        """Store an evaluated trial with its final state."""
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE trials SET state = ?, doc = ? WHERE experiment = ? AND tid = ?",
+                (doc["state"], pickle.dumps(doc), self.experiment, doc["tid"]),
+            )
+
+    def requeue(self):
+        """Mark trials left running by a search that died as new again."""
+        with self._connect() as connection:
+            count = connection.execute(
+                "UPDATE trials SET state = ?, owner = NULL WHERE experiment = ? AND state = ?",
+                (JOB_STATE_NEW, self.experiment, JOB_STATE_RUNNING),
+            ).rowcount
+        if count:
+            logger.info(f"Requeued {count} interrupted trials")
+        return count
+
+    def count(self, states=(JOB_STATE_NEW, JOB_STATE_RUNNING, JOB_STATE_DONE, JOB_STATE_ERROR)):
+        """Return the number of trials in the given states."""
+        placeholders = ", ".join("?" * len(states))
+        return self._connect().execute(
+            f"SELECT COUNT(*) FROM trials WHERE experiment = ? AND state IN ({placeholders})",
+            (self.experiment,) + tuple(states),
+        ).fetchone()[0]
+
+    def next_tid(self):
+        """Return the first unused trial id."""
+        tid = self._connect().execute(
+            "SELECT MAX(tid) FROM trials WHERE experiment = ?", (self.experiment,)
+        ).fetchone()[0]
+        return 0 if tid is None else tid + 1
+
+    def trials(self):
+        """Return the completed trials as a hyperopt `Trials` object."""
+        rows = self._connect().execute(
+            "SELECT doc FROM trials WHERE experiment = ? AND state = ? ORDER BY tid",
+            (self.experiment, JOB_STATE_DONE),
+        ).fetchall()
+
+        trials = Trials()
+        trials.insert_trial_docs([pickle.loads(row[0]) for row in rows])
+        trials.refresh()
+        return trials
+
+    def _connect(self):
+        # SQLite connections must not be shared with forked processes
+        if self._connection is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        return self._connection
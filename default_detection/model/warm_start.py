@@ -0,0 +1,188 @@
+import glob
+import json
+import logging
+import os
+
+import dill
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import StratifiedKFold
+
+from default_detection import DATA_DIR, RANDOM_STATE
+from default_detection.model import metrics
+from default_detection.model.hyper_optimization import FLOAT_RANGES, MAX_DEPTHS, NUM_LEAVES_RANGE, HyperOptimization
+
+logger = logging.getLogger(__name__)
+
+# Hashes of the UUIDs a model was trained on, saved next to it
+TRAINING_ROWS_FILE = "training-rows.npy"
+
+# Fewest held out rows to validate continued boosting on
+MIN_VALIDATION_ROWS = 100
+
+
+class PreviousRun(object):
+    """A model trained earlier, with its parameters, cross validated AUC and booster."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "model-metadata.json"), 'r') as metadata_file:
+            self.metadata = json.load(metadata_file)
+        self._booster = None
+
+    @classmethod
+    def find(cls, warm_start, data_dir=DATA_DIR):
+        """Return the run of a model directory, or the latest run in the data directory for "latest"."""
+        if warm_start != "latest":
+            return cls(warm_start)
+
+        # Model directories are named after their training time
+        runs = sorted(glob.glob(os.path.join(data_dir, "*", "model-metadata.json")))
+        if not runs:
+            logger.warning(f"No previous run in {data_dir} to warm start from")
+            return None
+        return cls(os.path.dirname(runs[-1]))
+
+    @property
+    def id(self):
+        return self.metadata["id"]
+
+    @property
+    def params(self):
+        return self.metadata["model_params"]
+
+    @property
+    def auc(self):
+        """Cross validated AUC of the best trial of the run, or of the run it continued to boost."""
+        warm_start = self.metadata.get("warm_start") or {}
+        if warm_start.get("mode") == "boosting":
+            # Its own AUC is of a few held out rows and not comparable to cross validation
+            return warm_start["previous_auc"]
+        return self.metadata["evaluation_result"]["auc_score"]
+
+    @property
+    def booster(self):
+        if self._booster is None:
+            with open(os.path.join(self.directory, "model.pk"), 'rb') as model_file:
+                self._booster = dill.load(model_file)
+        return self._booster
+
+    def unseen(self, uuids):
+        """Return which of the UUIDs the run was not trained on, None if it did not save its training rows."""
+        path = os.path.join(self.directory, TRAINING_ROWS_FILE)
+        if not os.path.exists(path):
+            return None
+        return ~np.isin(_hash_uuids(uuids), np.load(path))
+
+    def matches(self, features, categorical_features):
+        """Whether the run was trained on the same features, so its booster can continue boosting."""
+        return (self.metadata["features"] == list(features)
+                and self.metadata["categorical_features"] == list(categorical_features))
+
+    def search_points(self, n_points, seed, scale=0.1):
+        """Return the best parameters of the run and points near them in the hyperopt search space.
+
+        Nearby points move every continuous parameter by a normal step of `scale` times its range,
+        `num_leaves` likewise and `max_depth` to a neighbouring choice at random.
+        """
+        rng = np.random.RandomState(seed)
+        params = self.params
+        depth_index = MAX_DEPTHS.index(params['max_depth']) if params['max_depth'] in MAX_DEPTHS else 0
+        best = {'max_depth': depth_index, 'num_leaves': float(params['num_leaves'])}
+        best.update({name: float(params[name]) for name in FLOAT_RANGES})
+
+        points = [best]
+        for _ in range(n_points - 1):
+            point = {}
+            for name, (low, high) in list(FLOAT_RANGES.items()) + [('num_leaves', NUM_LEAVES_RANGE)]:
+                point[name] = float(np.clip(best[name] + rng.normal(0, scale * (high - low)), low, high))
+            point['num_leaves'] = float(round(point['num_leaves']))
+            point['max_depth'] = int(np.clip(depth_index + rng.randint(-1, 2), 0, len(MAX_DEPTHS) - 1))
+            points.append(point)
+        return points
+
+
+def save_training_rows(directory, uuids):
+    """Save the hashes of the UUIDs of the training rows next to a model."""
+    np.save(os.path.join(directory, TRAINING_ROWS_FILE), _hash_uuids(uuids))
+
+
+def continue_boosting(datasets, unseen, previous, target_auc, max_rounds=200, early_stopping_rounds=50):
+    """Return the parameters, validation scores and evaluation of continuing to boost the previous booster.
+
+    A stratified third of the rows the previous model was not trained on is held out, the booster
+    continues boosting on the other rows from its predictions until the validation AUC reaches the
+    target, did not improve for `early_stopping_rounds` rounds or after `max_rounds` rounds, and
+    `n_estimators` of the parameters is the number of rounds to add. Returns None if there are too
+    few unseen rows to validate on.
+    """
+    unseen_rows = np.flatnonzero(unseen)
+    label = datasets.label
+    if len(unseen_rows) < 3 * MIN_VALIDATION_ROWS or len(np.unique(label[unseen_rows])) < 2:
+        return None
+
+    folds = StratifiedKFold(n_splits=3, shuffle=True, random_state=int(RANDOM_STATE))
+    _, valid_index = next(folds.split(unseen_rows, label[unseen_rows]))
+    valid_rows = unseen_rows[valid_index]
+    train_rows = np.setdiff1d(np.arange(len(label)), valid_rows)
+
+    init_model = previous.booster
+    raw_scores = init_model.predict(datasets.features_matrix, raw_score=True)
+    train = lgb.Dataset(
+        datasets.features_matrix[train_rows],
+        label[train_rows],
+        init_score=raw_scores[train_rows],
+        reference=datasets.train,
+        feature_name=datasets.features,
+        categorical_feature=datasets.categorical_features,
+        params=datasets.params,
+    )
+    valid = lgb.Dataset(
+        datasets.features_matrix[valid_rows],
+        label[valid_rows],
+        init_score=raw_scores[valid_rows],
+        reference=train,
+    )
+
+    params = dict(previous.params)
+    params.pop("n_estimators", None)
+    logger.info(f"Continuing to boost from {init_model.current_iteration()} rounds, validating on "
+                f"{len(valid_rows)} unseen rows")
+    scores = {}
+    booster = lgb.train(
+        params,
+        train,
+        num_boost_round=max_rounds,
+        valid_sets=[valid],
+        valid_names=["valid"],
+        feval=HyperOptimization.f1_score_valid,
+        early_stopping_rounds=early_stopping_rounds,
+        evals_result=scores,
+        verbose_eval=False,
+        callbacks=[_stop_at(target_auc)],
+    )
+
+    rounds = booster.best_iteration or booster.current_iteration()
+    params["n_estimators"] = rounds
+    valid_raw_scores = raw_scores[valid_rows] + booster.predict(
+        datasets.features_matrix[valid_rows], raw_score=True, num_iteration=rounds
+    )
+    evaluation = metrics.evaluate(label[valid_rows], 1 / (1 + np.exp(-valid_raw_scores)))
+    evaluation["validation_rows"] = len(valid_rows)
+    return params, {"auc": scores["valid"]["auc"][rounds - 1], "f1": scores["valid"]["f1"][rounds - 1]}, evaluation
+
+
+def _stop_at(target_auc):
+    """Callback that stops training once the validation AUC reached the target."""
+    def callback(env):
+        for _, metric, value, _ in env.evaluation_result_list:
+            if metric == "auc" and value >= target_auc:
+                logger.info(f"Reached the target AUC {target_auc:.5f} after {env.iteration + 1} rounds")
+                raise lgb.callback.EarlyStopException(env.iteration, env.evaluation_result_list)
+    callback.order = 40
+    return callback
+
+
+def _hash_uuids(uuids):
+    return pd.util.hash_array(np.asarray(uuids, dtype=object))
@@ -1,6 +1,10 @@
+from default_detection import MODEL_POLL_INTERVAL
 from default_detection.api import predictions, app
+from default_detection.api.model_watcher import ModelWatcher
 
 if __name__ == '__main__':
     predictions.load_data()
     predictions.load_model()
+    if MODEL_POLL_INTERVAL > 0:
+        ModelWatcher().start()
     app.run()
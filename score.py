@@ -0,0 +1,15 @@
+import argparse
+
+from default_detection import BATCH_SCORING_CHUNK_BYTES, BATCH_SCORING_WORKERS
+from default_detection.api.batch_scoring import OUTPUT_FORMATS, BatchScorer
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Score a ;-delimited CSV of raw records with the model.")
+    parser.add_argument("input", help="CSV of raw records with the columns of the data set")
+    parser.add_argument("output", help="file to write uuid, pd and default to")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="csv", help="output format, parquet needs pyarrow")
+    parser.add_argument("--workers", type=int, default=BATCH_SCORING_WORKERS, help="worker processes, 0 for one per CPU")
+    parser.add_argument("--chunk-bytes", type=int, default=BATCH_SCORING_CHUNK_BYTES, help="input bytes per chunk")
+    args = parser.parse_args()
+
+    BatchScorer(workers=args.workers, chunk_bytes=args.chunk_bytes).score(args.input, args.output, args.format)
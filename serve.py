@@ -0,0 +1,10 @@
+import os
+
+# OpenMP thread pools do not survive a fork, LightGBM runs single threaded in the master and the
+# workers set their own number of threads
+os.environ["OMP_NUM_THREADS"] = "1"
+
+from default_detection.api.server import PreforkServer
+
+if __name__ == '__main__':
+    PreforkServer().serve()
@@ -0,0 +1,47 @@
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from default_detection.api.batcher import MicroBatcher, _Request
+
+
+def _predict(records):
+    if any(record.get("bad") for record in records):
+        raise ValueError("bad record")
+    return np.array([record["value"] for record in records], dtype=np.float64)
+
+
+def _request(records):
+    return _Request(records, Future(), time.monotonic())
+
+
+def test_batch_is_split_between_requests():
+    batcher = MicroBatcher(_predict)
+    first, second = _request([{"value": 1}, {"value": 2}]), _request([{"value": 3}])
+    batcher._process([first, second])
+
+    np.testing.assert_array_equal(first.future.result(), [1, 2])
+    np.testing.assert_array_equal(second.future.result(), [3])
+    assert batcher.stats()["batches"] == 1
+
+
+def test_failing_request_fails_only_its_own_future():
+    batcher = MicroBatcher(_predict)
+    good, bad, other = _request([{"value": 1}]), _request([{"value": 2, "bad": True}]), _request([{"value": 3}])
+    batcher._process([good, bad, other])
+
+    np.testing.assert_array_equal(good.future.result(), [1])
+    np.testing.assert_array_equal(other.future.result(), [3])
+    with pytest.raises(ValueError, match="bad record"):
+        bad.future.result()
+    assert batcher.stats()["requests"] == 3
+
+
+def test_submitted_requests_are_scored_together():
+    batcher = MicroBatcher(_predict, max_batch_size=10, max_wait=0.5)
+    futures = [batcher.submit([{"value": i}]) for i in range(3)]
+
+    assert [future.result(timeout=5).tolist() for future in futures] == [[0], [1], [2]]
+    assert batcher.stats()["batch_size"]["max"] == 3
@@ -0,0 +1,98 @@
+import json
+import uuid
+
+import numpy as np
+import pytest
+from werkzeug.exceptions import BadRequest
+
+from default_detection.api import binary
+
+UUIDS = [str(uuid.UUID(int=i * 7919 + 1)) for i in range(5)] + ["0095dfb6-a886-4e2a-b056-15ef45fdb0ef"]
+
+
+def _predictions():
+    uuids = np.array(UUIDS[:4], dtype=object)
+    return uuids, np.array([0.1, 0.25, 0.5, 0.9]), np.array([0, 0, 1, 1]), UUIDS[4:]
+
+
+def test_pack_unpack_round_trip():
+    packed = binary.pack_uuids(UUIDS)
+
+    assert len(packed) == 16 * len(UUIDS)
+    assert packed == b"".join(uuid.UUID(u).bytes for u in UUIDS)
+    assert binary.unpack_uuids(packed) == UUIDS
+
+
+def test_pack_non_canonical_uuids():
+    assert binary.pack_uuids([u.upper().replace("-", "") for u in UUIDS[:2]]) == binary.pack_uuids(UUIDS[:2])
+    assert binary.pack_uuids(["{" + UUIDS[0] + "}"]) == uuid.UUID(UUIDS[0]).bytes
+
+
+def test_pack_unpack_nothing():
+    assert binary.pack_uuids([]) == b""
+    assert binary.unpack_uuids(b"") == []
+
+
+def test_unpack_rejects_partial_uuids():
+    with pytest.raises(BadRequest):
+        binary.unpack_uuids(b"\x00" * 17)
+
+
+def test_msgpack_round_trip():
+    msgpack = pytest.importorskip("msgpack")
+
+    for packed in (False, True):
+        uuids = binary.pack_uuids(UUIDS) if packed else UUIDS
+        assert binary.decode_uuids(msgpack.packb({"uuids": uuids}), "msgpack") == (UUIDS, packed)
+
+        body = msgpack.unpackb(binary.encode_predictions(*_predictions(), "msgpack", packed), raw=False)
+        predictions = body["predictions"]
+        if packed:
+            predictions["uuid"] = binary.unpack_uuids(predictions["uuid"])
+            body["unknown_uuids"] = binary.unpack_uuids(body["unknown_uuids"])
+        assert predictions == {"uuid": UUIDS[:4], "pd": [0.1, 0.25, 0.5, 0.9], "default": [0, 0, 1, 1]}
+        assert body["unknown_uuids"] == UUIDS[4:]
+
+
+@pytest.mark.parametrize("body", [b"\xc1", b"\x80", b"\x81\xa5uuids\x05"])
+def test_msgpack_rejects_invalid_bodies(body):
+    pytest.importorskip("msgpack")
+    with pytest.raises(BadRequest):
+        binary.decode_uuids(body, "msgpack")
+
+
+def _arrow_stream(pa, column):
+    table = pa.Table.from_arrays([column], ["uuid"])
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def test_arrow_round_trip():
+    pa = pytest.importorskip("pyarrow")
+
+    strings = pa.array(UUIDS, type=pa.string())
+    assert binary.decode_uuids(_arrow_stream(pa, strings), "arrow") == (UUIDS, False)
+    packed = pa.array([uuid.UUID(u).bytes for u in UUIDS], type=pa.binary(16))
+    assert binary.decode_uuids(_arrow_stream(pa, packed), "arrow") == (UUIDS, True)
+    # A sliced column starts at an offset into its buffer
+    assert binary.decode_uuids(_arrow_stream(pa, packed.slice(2, 3)), "arrow") == (UUIDS[2:5], True)
+
+    for packed in (False, True):
+        table = pa.ipc.open_stream(binary.encode_predictions(*_predictions(), "arrow", packed)).read_all()
+        uuids = table.column("uuid").to_pylist()
+        if packed:
+            uuids = binary.unpack_uuids(b"".join(uuids))
+        assert uuids == UUIDS[:4]
+        assert table.column("pd").to_pylist() == [0.1, 0.25, 0.5, 0.9]
+        assert table.column("default").to_pylist() == [0, 0, 1, 1]
+        assert json.loads(table.schema.metadata[b"unknown_uuids"]) == UUIDS[4:]
+
+
+def test_arrow_rejects_invalid_bodies():
+    pa = pytest.importorskip("pyarrow")
+
+    for body in (b"not arrow", _arrow_stream(pa, pa.array([1, 2])), _arrow_stream(pa, pa.array([UUIDS[0], None]))):
+        with pytest.raises(BadRequest):
+            binary.decode_uuids(body, "arrow")
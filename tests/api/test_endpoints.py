@@ -0,0 +1,29 @@
+import pytest
+from werkzeug.exceptions import BadRequest
+
+from default_detection.api import app
+from default_detection.api.endpoints import _int_arg
+
+
+@pytest.mark.parametrize("value, expected", [("0", 0), ("25", 25)])
+def test_int_arg(value, expected):
+    with app.test_request_context(f"/get-all?cursor={value}"):
+        assert _int_arg("cursor", None) == expected
+
+
+def test_int_arg_default():
+    with app.test_request_context("/get-all"):
+        assert _int_arg("limit", 7) == 7
+
+
+@pytest.mark.parametrize("value", ["-1", "1.5", "abc", "²", ""])
+def test_int_arg_rejects_non_integers(value):
+    with app.test_request_context("/get-all", query_string={"cursor": value}):
+        with pytest.raises(BadRequest):
+            _int_arg("cursor", 0)
+
+
+def test_int_arg_rejects_below_minimum():
+    with app.test_request_context("/get-all?limit=0"):
+        with pytest.raises(BadRequest):
+            _int_arg("limit", None, minimum=1)
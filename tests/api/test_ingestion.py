@@ -0,0 +1,75 @@
+import numpy as np
+
+from default_detection.api.ingestion import DeltaRows, IngestionLog
+
+
+def test_delta_rows_grow():
+    delta = DeltaRows(n_features=2, capacity=2)
+    for i in range(5):
+        assert delta.append([f"u{i}"], [[i, i]], [0.1 * i], [0], [True]) == i
+
+    assert delta.size == 5
+    assert delta.uuids[:5].tolist() == ["u0", "u1", "u2", "u3", "u4"]
+    np.testing.assert_array_equal(delta.features[:5, 0], np.arange(5))
+    assert not delta.superseded[:5].any()
+
+
+def test_log_reads_only_new_batches(tmp_path):
+    path = str(tmp_path / "ingestion.jsonl")
+    writer, reader = IngestionLog(path), IngestionLog(path)
+
+    assert not reader.has_new()
+    writer.append([{"uuid": "a"}])
+    writer.append([{"uuid": "b"}, {"uuid": "c"}])
+    assert reader.has_new()
+    assert list(reader.read_new()) == [[{"uuid": "a"}], [{"uuid": "b"}, {"uuid": "c"}]]
+
+    assert not reader.has_new()
+    writer.append([{"uuid": "d"}])
+    assert list(reader.read_new()) == [[{"uuid": "d"}]]
+
+
+def test_log_leaves_a_partial_batch_for_the_next_read(tmp_path):
+    path = str(tmp_path / "ingestion.jsonl")
+    IngestionLog(path).append([{"uuid": "a"}])
+    with open(path, "a") as log_file:
+        log_file.write('{"records": [{"uuid": "b"')
+
+    reader = IngestionLog(path)
+    assert list(reader.read_new()) == [[{"uuid": "a"}]]
+    with open(path, "a") as log_file:
+        log_file.write('}]}\n')
+    assert list(reader.read_new()) == [[{"uuid": "b"}]]
+
+
+def test_log_skips_invalid_lines(tmp_path):
+    path = str(tmp_path / "ingestion.jsonl")
+    log = IngestionLog(path)
+    log.append([{"uuid": "a"}])
+    with open(path, "a") as log_file:
+        log_file.write('not json\n{"other": 1}\n\n')
+    log.append([{"uuid": "b"}])
+
+    reader = IngestionLog(path)
+    assert list(reader.read_new()) == [[{"uuid": "a"}], [{"uuid": "b"}]]
+    assert not reader.has_new()
+
+
+def test_log_moves_past_a_batch_that_fails_to_apply(tmp_path):
+    path = str(tmp_path / "ingestion.jsonl")
+    log = IngestionLog(path)
+    for uuid in ["a", "bad", "c"]:
+        log.append([{"uuid": uuid}])
+
+    applied = []
+    reader = IngestionLog(path)
+    for records in reader.read_new():
+        try:
+            if records[0]["uuid"] == "bad":
+                raise ValueError("cannot apply")
+            applied.append(records[0]["uuid"])
+        except ValueError:
+            continue
+
+    assert applied == ["a", "c"]
+    assert not reader.has_new()
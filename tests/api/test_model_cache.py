@@ -0,0 +1,109 @@
+import collections
+import os
+
+import boto3
+import pytest
+
+from default_detection.api import model_cache
+from default_detection.api.model_cache import ModelCache
+
+try:
+    from moto import mock_aws
+except ImportError:
+    from moto import mock_s3 as mock_aws
+
+BUCKET = "models"
+CREDENTIALS = {"aws_access_key_id": "testing", "aws_secret_access_key": "testing"}
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        client = boto3.client("s3", **CREDENTIALS)
+        client.create_bucket(Bucket=BUCKET)
+        client.put_object(Bucket=BUCKET, Key="model/model.pk", Body=b"booster")
+        client.put_object(Bucket=BUCKET, Key="model/model-metadata.json", Body=b'{"id": "a"}')
+        yield client
+
+
+@pytest.fixture
+def cache(s3, tmp_path):
+    cache = ModelCache(bucket=BUCKET, cache_dir=str(tmp_path / "cache"), credentials=CREDENTIALS)
+    cache.calls = collections.Counter()
+    cache.client.meta.events.register("before-call.s3", lambda model, **_: cache.calls.update([model.name]))
+    return cache
+
+
+def test_first_fetch_heads_and_gets(cache, tmp_path):
+    paths = cache.fetch(str(tmp_path / "model"))
+
+    assert sorted(paths) == ["model-metadata.json", "model.pk"]
+    with open(paths["model.pk"], "rb") as file:
+        assert file.read() == b"booster"
+    assert cache.calls == {"HeadObject": 3, "GetObject": 2}
+
+
+def test_second_fetch_only_heads(cache, tmp_path):
+    cache.fetch(str(tmp_path / "model"))
+    cache.calls.clear()
+    cache.fetch(str(tmp_path / "model"))
+
+    assert cache.calls == {"HeadObject": 3}
+
+
+def test_changed_etag_downloads_again(s3, cache, tmp_path):
+    cache.fetch(str(tmp_path / "model"))
+    s3.put_object(Bucket=BUCKET, Key="model/model.pk", Body=b"new booster")
+    cache.calls.clear()
+    paths = cache.fetch(str(tmp_path / "model"))
+
+    with open(paths["model.pk"], "rb") as file:
+        assert file.read() == b"new booster"
+    assert cache.calls == {"HeadObject": 3, "GetObject": 1}
+
+
+def test_objects_of_earlier_versions_are_removed(s3, cache, tmp_path):
+    objects_dir = os.path.join(cache.cache_dir, "objects")
+    cache.fetch(str(tmp_path / "model"))
+    first = set(os.listdir(objects_dir))
+
+    s3.put_object(Bucket=BUCKET, Key="model/model.pk", Body=b"new booster")
+    paths = cache.fetch(str(tmp_path / "model"))
+
+    current = set(os.listdir(objects_dir))
+    assert len(first) == len(current) == 2
+    assert len(first & current) == 1
+    for path in paths.values():
+        assert any(os.path.samefile(path, os.path.join(objects_dir, name)) for name in current)
+
+
+def test_missing_optional_file_is_skipped(cache, tmp_path):
+    target_dir = tmp_path / "model"
+    target_dir.mkdir()
+    # Left behind by a previous model
+    (target_dir / "preprocessing.json").write_text("{}")
+
+    paths = cache.fetch(str(target_dir))
+
+    assert "preprocessing.json" not in paths
+    assert not (target_dir / "preprocessing.json").exists()
+
+
+def test_missing_required_file_raises(s3, cache, tmp_path):
+    from botocore.exceptions import ClientError
+
+    s3.delete_object(Bucket=BUCKET, Key="model/model.pk")
+    with pytest.raises(ClientError):
+        cache.fetch(str(tmp_path / "model"))
+
+
+def test_checksum_mismatch_raises_and_leaves_no_file(cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(model_cache, "_md5", lambda path: "0" * 32)
+    target_dir = tmp_path / "model"
+
+    with pytest.raises(IOError, match="Checksum mismatch"):
+        cache.fetch(str(target_dir))
+
+    assert os.listdir(os.path.join(cache.cache_dir, "objects")) == []
+    assert not (target_dir / "model.pk").exists()
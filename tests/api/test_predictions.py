@@ -0,0 +1,83 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from default_detection.api import predictions
+from default_detection.api.predictions import _validate_records
+
+
+def test_valid_records_give_raw_columns():
+    columns = _validate_records([{"has_paid": True, "age": 35, "merchant_group": "Entertainment"}, {"has_paid": 0}])
+
+    np.testing.assert_array_equal(columns["age"], [35, np.nan])
+    np.testing.assert_array_equal(columns["has_paid"], [True, False])
+    assert columns["merchant_group"].tolist() == ["Entertainment", None]
+
+
+@pytest.mark.parametrize("record, message", [
+    ({"has_paid": "yes"}, "has_paid"),
+    ({"has_paid": True, "age": "abc"}, "age must be a number"),
+    ({"has_paid": True, "age": [35]}, "age must be a number"),
+    ({"has_paid": True, "merchant_group": ["Entertainment"]}, "merchant_group must be a string"),
+])
+def test_invalid_records_raise_value_error(record, message):
+    with pytest.raises(ValueError, match=message):
+        _validate_records([{"has_paid": True}, record])
+
+
+def test_records_must_be_a_list_of_objects():
+    with pytest.raises(ValueError, match="list of objects"):
+        _validate_records({"has_paid": True})
+
+
+class _Preprocessor(object):
+    def transform_matrix(self, columns, features):
+        return np.zeros((len(columns["has_paid"]), len(features)))
+
+
+class _Classifier(object):
+    engine = "lightgbm"
+
+    def __init__(self, model_id):
+        self.metadata = {"id": model_id, "features": ["age"]}
+        self.timings = {}
+        self.preprocessor = _Preprocessor()
+
+    def predict_features(self, matrix):
+        return np.full(len(matrix), 0.25)
+
+
+@pytest.fixture
+def serving(monkeypatch):
+    data = pd.DataFrame({"uuid": ["a", "b"], "default": [0.0, np.nan], "age": [30.0, 40.0]})
+    monkeypatch.setattr(predictions, "INGESTION_LOG", None)
+    monkeypatch.setattr(predictions.store, "load_preprocessed", lambda path, preprocessor: (data, None))
+    serving = predictions._Serving(_Classifier("old"))
+    serving.load_data()
+    monkeypatch.setattr(predictions, "_serving", serving)
+    return serving
+
+
+def test_records_ingested_during_a_swap_reach_the_new_model(serving, monkeypatch):
+    predictions.ingest_records([{"uuid": "before", "has_paid": True}])
+    warming, proceed = threading.Event(), threading.Event()
+    # Hold the swap while the new model warms up, after the data of the new model is loaded
+    monkeypatch.setattr(predictions._Serving, "warm_up", lambda self: (warming.set(), proceed.wait(5)))
+    swap = threading.Thread(target=predictions.swap_model, args=(_Classifier("new"),))
+    swap.start()
+    assert warming.wait(5)
+
+    ingest = threading.Thread(target=predictions.ingest_records, args=([{"uuid": "during", "has_paid": True}],))
+    ingest.start()
+    ingest.join(0.2)
+    proceed.set()
+    swap.join(5)
+    ingest.join(5)
+
+    active = predictions._serving
+    assert active.classifier.metadata["id"] == "new"
+    assert {"before", "during"} <= set(active.index)
+    assert [records[0]["uuid"] for records in active.ingested] == ["before", "during"]
+    assert active.delta.size == 2
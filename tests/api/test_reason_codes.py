@@ -0,0 +1,127 @@
+import json
+
+import dill
+import lightgbm as lgb
+import numpy as np
+import pytest
+
+from default_detection.api.predictor import Predictor
+from default_detection.api.reason_codes import NO_REASON, ReasonCodeCache, ReasonCodeTable, top_contributions
+
+TOP_K = 3
+
+
+def test_top_contributions_largest_positive_first():
+    contributions = np.array([
+        [0.1, -0.5, 0.7, 0.3, 0.0],
+        [-0.1, -0.2, 0.05, -0.3, 0.0],
+        [-0.1, -0.2, -0.05, -0.3, 0.0],
+    ])
+    features, values = top_contributions(contributions, TOP_K)
+
+    np.testing.assert_array_equal(features, [[2, 3, 0], [2, NO_REASON, NO_REASON], [NO_REASON] * 3])
+    np.testing.assert_array_equal(values, [[0.7, 0.3, 0.1], [0.05, 0, 0], [0, 0, 0]])
+
+
+def test_top_contributions_of_few_features():
+    features, values = top_contributions(np.array([[0.2, 0.4]]), TOP_K)
+
+    np.testing.assert_array_equal(features, [[1, 0]])
+    np.testing.assert_array_equal(values, [[0.4, 0.2]])
+
+
+@pytest.fixture(scope="module")
+def model(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    features = rng.normal(size=(2000, 6))
+    features[rng.random(features.shape) < 0.05] = np.nan
+    label = (np.nan_to_num(features[:, 0]) - np.nan_to_num(features[:, 1]) + rng.normal(size=2000) > 0).astype(float)
+    booster = lgb.train({"objective": "binary", "num_leaves": 7, "verbose": -1}, lgb.Dataset(features, label), 30)
+
+    model_dir = tmp_path_factory.mktemp("model")
+    with open(model_dir / "model.pk", "wb") as model_file:
+        dill.dump(booster, model_file)
+    with open(model_dir / "model-metadata.json", "w") as metadata_file:
+        json.dump({"id": "test", "features": [f"f{i}" for i in range(6)]}, metadata_file)
+    return booster, Predictor(engine="lightgbm", model_dir=str(model_dir)), features[:200]
+
+
+def _expected_reasons(booster, features):
+    """Reasons from a fresh pred_contrib call, the positive contributions sorted largest first."""
+    contributions = booster.predict(features, pred_contrib=True)[:, :-1]
+    expected = []
+    for row in contributions:
+        order = [i for i in np.argsort(-row, kind="stable") if row[i] > 0][:TOP_K]
+        expected.append((order, row[order]))
+    return expected
+
+
+def _assert_reasons(features, contributions, expected):
+    for row_features, row_contributions, (expected_features, expected_contributions) in zip(
+        features, contributions, expected
+    ):
+        n = len(expected_features)
+        assert row_features[:n].tolist() == list(expected_features)
+        assert (row_features[n:] == NO_REASON).all()
+        np.testing.assert_allclose(row_contributions[:n], expected_contributions, rtol=1e-6, atol=1e-7)
+
+
+def test_contributions_sum_to_raw_score(model):
+    booster, predictor, features = model
+    contributions = predictor.contributions(features, chunk_size=64)
+
+    np.testing.assert_allclose(contributions.sum(axis=1), booster.predict(features, raw_score=True), atol=1e-9)
+
+
+def test_reason_codes_match_pred_contrib(model):
+    booster, predictor, features = model
+    _assert_reasons(*predictor.reason_codes(features, TOP_K), _expected_reasons(booster, features))
+
+
+def test_table_computes_once_and_returns_the_same_reasons(model):
+    booster, predictor, features = model
+    table = ReasonCodeTable("test", len(features), TOP_K)
+    computed = []
+
+    def compute(positions):
+        computed.append(len(positions))
+        return predictor.reason_codes(features[positions], TOP_K)
+
+    positions = np.array([5, 0, 5, 17, 199])
+    first = table.get(positions, compute)
+    second = table.get(positions, compute)
+
+    assert computed == [4]
+    np.testing.assert_array_equal(first[0], second[0])
+    _assert_reasons(*second, _expected_reasons(booster, features[positions]))
+
+
+def test_cache_computes_once_and_returns_the_same_reasons(model):
+    booster, predictor, features = model
+    cache = ReasonCodeCache(size=100)
+    computed = []
+
+    def compute(matrix):
+        computed.append(len(matrix))
+        return predictor.reason_codes(matrix, TOP_K)
+
+    cache.get(features[:10], compute)
+    result = cache.get(features[5:15], compute)
+
+    assert computed == [10, 5]
+    assert len(cache) == 15
+    _assert_reasons(*result, _expected_reasons(booster, features[5:15]))
+
+
+def test_cache_evicts_least_recently_used(model):
+    _, predictor, features = model
+    cache = ReasonCodeCache(size=4)
+    compute = lambda matrix: predictor.reason_codes(matrix, TOP_K)
+
+    cache.get(features[:4], compute)
+    cache.get(features[:1], compute)
+    cache.get(features[4:5], compute)
+
+    assert len(cache) == 4
+    assert features[1].tobytes() not in cache._entries
+    assert features[0].tobytes() in cache._entries
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.data import generate
+from default_detection.data import BINNED_FEATURES, ENCODED_FEATURES
+from default_detection.data.preprocessing import Preprocessor
+
+
+@pytest.fixture
+def data():
+    data = generate(500, seed=1)
+    data["age"] = np.arange(1, 501, dtype=np.float64)
+    data.loc[[3, 7], "age"] = np.nan
+    data["merchant_group"] = ["Entertainment", "Food & Beverage", None, "Leisure, Sport & Hobby"] * 125
+    return data
+
+
+@pytest.fixture
+def preprocessor(data):
+    return Preprocessor().fit(data)
+
+
+def test_bin_edges_are_deciles(data, preprocessor):
+    for column in BINNED_FEATURES:
+        _, expected = pd.qcut(data[column], q=10, retbins=True, duplicates="drop")
+        np.testing.assert_allclose(preprocessor.bin_edges[column], expected)
+    assert len(preprocessor.bin_edges["age"]) == 11
+
+
+def test_bins_match_qcut_on_the_fitted_data(data, preprocessor):
+    transformed = preprocessor.transform(data)
+    for column in BINNED_FEATURES:
+        expected = pd.qcut(data[column], q=10, labels=False, duplicates="drop")
+        np.testing.assert_array_equal(transformed[f"{column}_bin"].to_numpy(), expected.to_numpy(dtype=np.float64))
+
+
+def test_bins_of_new_values(preprocessor):
+    bins = preprocessor._bin("age", [-100.0, 1.0, 60.0, 10_000.0, np.nan])
+    np.testing.assert_array_equal(bins, [0, 0, 1, 9, np.nan])
+
+
+def test_categories_in_order_of_appearance(preprocessor):
+    assert preprocessor.categories["merchant_group"] == ["Entertainment", "Food & Beverage", "Leisure, Sport & Hobby"]
+    assert [c for c in preprocessor.columns if c.startswith("merchant_group_")] == [
+        "merchant_group_Entertainment",
+        "merchant_group_FoodBeverage",
+        "merchant_group_LeisureSportHobby",
+        "merchant_group_nan",
+        "merchant_group_1",
+    ]
+
+
+def test_unseen_and_missing_categories(data, preprocessor):
+    records = data.iloc[:3].copy()
+    records["merchant_group"] = ["Food & Beverage", "Never seen", None]
+    transformed = preprocessor.transform(records)
+    indicators = transformed[[c for c in preprocessor.columns if c.startswith("merchant_group_")]]
+    np.testing.assert_array_equal(indicators.to_numpy(), [[0, 1, 0, 0, 0], [0, 0, 0, 0, 1], [0, 0, 0, 1, 0]])
+
+
+def test_nan_indicator_columns(data, preprocessor):
+    transformed = preprocessor.transform(data)
+    for column in ENCODED_FEATURES:
+        expected = data[column].isnull().astype(np.uint8).to_numpy()
+        np.testing.assert_array_equal(transformed[f"{column}_nan"].to_numpy(), expected)
+
+
+def test_imputed_and_boolean_features(data, preprocessor):
+    data.loc[0, "account_status"] = np.nan
+    transformed = preprocessor.transform(data)
+    assert transformed.loc[0, "account_status"] == 0
+    assert set(transformed["has_paid"].unique()) <= {0, 1}
+
+
+def test_features_exclude_identifiers(preprocessor):
+    assert "uuid" not in preprocessor.features
+    assert "default" not in preprocessor.features
+    assert set(preprocessor.categorical_features) < set(preprocessor.features)
+    assert "age" not in preprocessor.categorical_features
+    assert "age_bin" not in preprocessor.categorical_features
+
+
+def test_fit_in_chunks_equals_fit(data, preprocessor):
+    chunked = Preprocessor().fit_chunks([data.iloc[:150], data.iloc[150:320], data.iloc[320:]])
+    assert chunked.config() == preprocessor.config()
+
+
+def test_saved_preprocessing_transforms_the_same(tmp_path, data, preprocessor):
+    path = str(tmp_path / "preprocessing.json")
+    preprocessor.save(path)
+    loaded = Preprocessor.load(path)
+    pd.testing.assert_frame_equal(loaded.transform(data), preprocessor.transform(data))
+
+
+def test_transform_matrix_matches_transform(data, preprocessor):
+    raw = data.drop(columns=["default"])
+    matrix = preprocessor.transform_matrix({c: raw[c].to_numpy() for c in raw.columns}, preprocessor.features)
+    expected = preprocessor.transform(data)[preprocessor.features].to_numpy(dtype=np.float64)
+    np.testing.assert_array_equal(matrix, expected)
@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+from benchmarks.data import write_csv
+from default_detection.data import store
+from default_detection.model.telemetry import Telemetry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Preprocesses the CSV into an empty store in a fresh process and prints the peak RSS growth up to
+# the end of storing, over the process with its imports
+MEASURE_PEAK = """
+import json, sys
+from default_detection.data import store
+from default_detection.model.telemetry import Telemetry, peak_rss_mb
+baseline = peak_rss_mb()
+telemetry = Telemetry()
+store.load_preprocessed(sys.argv[1], store_dir=sys.argv[2], telemetry=telemetry)
+increase_mb = telemetry.stages["store"]["peak_rss_mb"] - baseline
+print(json.dumps({"increase_mb": increase_mb, "stages": list(telemetry.stages)}))
+"""
+
+
+@pytest.fixture(scope="module")
+def csv_path(tmp_path_factory):
+    return write_csv(str(tmp_path_factory.mktemp("data") / "dataset.csv"), 20000, seed=3)
+
+
+def _peak_increase_mb(csv_path, store_dir, memory_mb):
+    env = dict(os.environ, PREPROCESSING_MEMORY_MB=str(memory_mb), PYTHONPATH=ROOT)
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE_PEAK, csv_path, store_dir], env=env, cwd=ROOT, check=True,
+        stdout=subprocess.PIPE, universal_newlines=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_chunked_store_equals_in_memory_store(csv_path, tmp_path):
+    in_memory, in_memory_preprocessor = store.load_preprocessed(csv_path, store_dir=str(tmp_path / "a"), memory_mb=0)
+    telemetry = Telemetry()
+    chunked, chunked_preprocessor = store.load_preprocessed(
+        csv_path, store_dir=str(tmp_path / "b"), telemetry=telemetry, memory_mb=40
+    )
+
+    assert "fit" in telemetry.stages
+    assert chunked_preprocessor.config() == in_memory_preprocessor.config()
+    assert chunked.dtypes.to_dict() == in_memory.dtypes.to_dict()
+    # Categories of the chunked store are in order of appearance rather than sorted
+    pd.testing.assert_frame_equal(_categories_as_values(chunked), _categories_as_values(in_memory))
+
+
+def _categories_as_values(data):
+    return data.apply(lambda column: column.astype(object) if column.dtype.name == "category" else column)
+
+
+def test_chunked_preprocessing_stays_within_its_budget(tmp_path):
+    budget_mb = 64
+    csv_path = write_csv(str(tmp_path / "dataset.csv"), 200000, seed=4)
+
+    in_memory = _peak_increase_mb(csv_path, str(tmp_path / "a"), 0)
+    chunked = _peak_increase_mb(csv_path, str(tmp_path / "b"), budget_mb)
+
+    # Read at once the data set would not fit, so the budget is what keeps the chunked run within it
+    assert in_memory["increase_mb"] > budget_mb
+    assert "fit" in chunked["stages"]
+    assert chunked["increase_mb"] < budget_mb
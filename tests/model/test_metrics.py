@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+from sklearn import metrics as sklearn_metrics
+
+from default_detection.model import metrics
+
+
+def _random(n_rows=400, seed=0):
+    rng = np.random.default_rng(seed)
+    y_true = (rng.random(n_rows) < 0.2).astype(np.float64)
+    scores = np.clip(0.3 * y_true + rng.random(n_rows) * 0.7, 0, 1)
+    return y_true, scores
+
+
+def _tied(n_rows=400, seed=1):
+    y_true, scores = _random(n_rows, seed)
+    # Few distinct scores, so most thresholds split runs of ties with both classes
+    return y_true, np.round(scores, 1)
+
+
+@pytest.fixture(params=["random", "tied"])
+def labelled_scores(request):
+    return _random() if request.param == "random" else _tied()
+
+
+def test_roc_auc_score(labelled_scores):
+    y_true, scores = labelled_scores
+    expected = sklearn_metrics.roc_auc_score(y_true, scores)
+    assert metrics.roc_auc_score(y_true, scores) == pytest.approx(expected, abs=1e-12)
+
+
+@pytest.mark.parametrize("threshold", [0.0, 0.3, 0.5, 0.7, 1.1])
+def test_f1_score(labelled_scores, threshold):
+    y_true, scores = labelled_scores
+    y_pred = scores >= threshold
+    expected = sklearn_metrics.f1_score(y_true, y_pred, zero_division=0)
+
+    assert metrics.f1_score(y_true, y_pred) == pytest.approx(expected, abs=1e-12)
+    assert metrics.f1_score_at(y_true, scores, threshold) == pytest.approx(expected, abs=1e-12)
+
+
+def test_threshold_sweep(labelled_scores):
+    y_true, scores = labelled_scores
+    sweep = metrics.threshold_sweep(y_true, scores)
+
+    np.testing.assert_array_equal(sweep["threshold"], np.unique(scores)[::-1])
+    for i, threshold in enumerate(sweep["threshold"]):
+        y_pred = scores >= threshold
+        assert sweep["precision"][i] == pytest.approx(sklearn_metrics.precision_score(y_true, y_pred), abs=1e-12)
+        assert sweep["recall"][i] == pytest.approx(sklearn_metrics.recall_score(y_true, y_pred), abs=1e-12)
+        assert sweep["f1"][i] == pytest.approx(sklearn_metrics.f1_score(y_true, y_pred), abs=1e-12)
+
+
+def test_best_threshold(labelled_scores):
+    y_true, scores = labelled_scores
+    thresholds = np.unique(scores)[::-1]
+    f1_scores = [sklearn_metrics.f1_score(y_true, scores >= threshold) for threshold in thresholds]
+
+    threshold, f1 = metrics.best_threshold(y_true, scores)
+    assert threshold == thresholds[int(np.argmax(f1_scores))]
+    assert f1 == pytest.approx(max(f1_scores), abs=1e-12)
+
+
+def test_evaluate(labelled_scores):
+    y_true, scores = labelled_scores
+    y_pred = scores >= 0.5
+    evaluation = metrics.evaluate(y_true, scores)
+
+    assert evaluation["auc"] == pytest.approx(sklearn_metrics.roc_auc_score(y_true, scores), abs=1e-12)
+    assert evaluation["f1"] == pytest.approx(sklearn_metrics.f1_score(y_true, y_pred, zero_division=0), abs=1e-12)
+    assert evaluation["precision"] == pytest.approx(
+        sklearn_metrics.precision_score(y_true, y_pred, zero_division=0), abs=1e-12
+    )
+    assert evaluation["recall"] == pytest.approx(sklearn_metrics.recall_score(y_true, y_pred), abs=1e-12)
+    assert evaluation["threshold"] == 0.5
+
+
+def test_all_scores_tied():
+    y_true = np.array([0, 1, 0, 1, 1], dtype=np.float64)
+    scores = np.full(5, 0.4)
+
+    assert metrics.roc_auc_score(y_true, scores) == 0.5
+    assert metrics.best_threshold(y_true, scores) == (0.4, pytest.approx(sklearn_metrics.f1_score(y_true, np.ones(5))))
+
+
+def test_no_predicted_positives():
+    y_true, scores = _random()
+    assert metrics.f1_score(y_true, np.zeros_like(y_true)) == 0.0
+    assert metrics.evaluate(y_true, scores, threshold=2.0)["precision"] == 0.0
+
+
+@pytest.mark.parametrize("label", [0.0, 1.0])
+def test_single_class_raises(label):
+    y_true = np.full(10, label)
+    scores = np.linspace(0, 1, 10)
+
+    # sklearn 0.24 raises as well, later versions warn and return NaN
+    with pytest.raises(ValueError, match="only one class"):
+        metrics.roc_auc_score(y_true, scores)
+    with pytest.raises(ValueError):
+        metrics.evaluate(y_true, scores)
+
+
+def test_empty_arrays_raise():
+    with pytest.raises(ValueError):
+        metrics.roc_auc_score(np.zeros(0), np.zeros(0))
@@ -0,0 +1,95 @@
+import lightgbm as lgb
+import numpy as np
+import pytest
+
+from default_detection.model import tree_ensemble
+from default_detection.model.tree_ensemble import TreeEnsemble
+
+TOLERANCE = 1e-9
+
+
+def _data(n_rows, seed):
+    rng = np.random.default_rng(seed)
+    features = np.column_stack([
+        rng.normal(size=n_rows),
+        rng.exponential(size=n_rows),
+        rng.integers(0, 6, size=n_rows).astype(np.float64),
+        rng.integers(0, 40, size=n_rows).astype(np.float64),
+        rng.normal(size=n_rows),
+    ])
+    logit = features[:, 0] - features[:, 1] + (features[:, 2] == 3) - 0.5 * (features[:, 3] % 7 == 0)
+    label = (rng.random(n_rows) < 1 / (1 + np.exp(-logit))).astype(np.float64)
+
+    # Missing values in numerical and categorical features
+    features[rng.random(n_rows) < 0.1, 0] = np.nan
+    features[rng.random(n_rows) < 0.05, 2] = np.nan
+    features[rng.random(n_rows) < 0.3, 4] = 0.0
+    return features, label
+
+
+def _booster(**params):
+    features, label = _data(3000, seed=0)
+    params = dict({"objective": "binary", "num_leaves": 15, "min_data_in_leaf": 5, "verbose": -1, "seed": 0}, **params)
+    dataset = lgb.Dataset(features, label, categorical_feature=[2, 3], free_raw_data=False)
+    return lgb.train(params, dataset, num_boost_round=50)
+
+
+@pytest.fixture(scope="module")
+def booster():
+    return _booster()
+
+
+def _rows_with_unseen_categories():
+    features, _ = _data(1000, seed=1)
+    features[:50, 2] = 17.0
+    features[50:100, 3] = 1000.0
+    features[100:150, 2] = -1.0
+    features[150:200, 3] = np.nan
+    features[200:250] = np.nan
+    return features
+
+
+def test_matches_lightgbm(booster):
+    features, _ = _data(1000, seed=1)
+    ensemble = TreeEnsemble.from_booster(booster)
+
+    np.testing.assert_allclose(ensemble.predict(features), booster.predict(features), rtol=0, atol=TOLERANCE)
+    np.testing.assert_allclose(
+        ensemble.predict(features, raw_score=True), booster.predict(features, raw_score=True), rtol=0, atol=TOLERANCE
+    )
+
+
+def test_categorical_splits_are_used(booster):
+    assert TreeEnsemble.from_booster(booster).categorical.any()
+
+
+def test_nan_and_unseen_categories_match_lightgbm(booster):
+    features = _rows_with_unseen_categories()
+    ensemble = TreeEnsemble.from_booster(booster)
+
+    np.testing.assert_allclose(ensemble.predict(features), booster.predict(features), rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize("params", [{"zero_as_missing": True}, {"use_missing": False}, {"max_cat_to_onehot": 8}])
+def test_missing_value_handling_matches_lightgbm(params):
+    booster = _booster(**params)
+    features = _rows_with_unseen_categories()
+
+    np.testing.assert_allclose(
+        TreeEnsemble.from_booster(booster).predict(features), booster.predict(features), rtol=0, atol=TOLERANCE
+    )
+
+
+def test_blocks_give_the_same_predictions(booster, monkeypatch):
+    features = _rows_with_unseen_categories()
+    ensemble = TreeEnsemble.from_booster(booster)
+    expected = ensemble.predict(features)
+
+    # Blocks of 7 rows on 50 trees, the last block is partial
+    monkeypatch.setattr(tree_ensemble, "BLOCK_PAIRS", 350)
+    np.testing.assert_array_equal(ensemble.predict(features), expected)
+
+
+def test_no_rows(booster):
+    ensemble = TreeEnsemble.from_booster(booster)
+    assert ensemble.predict(np.zeros((0, 5))).shape == (0,)